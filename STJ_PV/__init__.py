@@ -1,3 +1,9 @@
-from . import run_stj
-from . import stj_metric
+import importlib
 __version__ = "1.0.0"
+
+
+def __getattr__(name):
+    """Import `run_stj` and `stj_metric` when first used, they're slow to import."""
+    if name in ('run_stj', 'stj_metric'):
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 """Compute terms related to Eddy Kinetic Energy."""
 import numpy as np
-import matplotlib.pyplot as plt
 import STJ_PV.utils as utils
 
 __author__ = "Michael Kelleher, Penelope Maher"
@@ -0,0 +1,441 @@
+# -*- coding: utf-8 -*-
+"""
+Check a candidate jet finding engine gives the same jet position as the reference.
+
+An engine is a set of run configuration options (e.g. `persist`, `subset_input`,
+`execution`) applied on top of each case's configuration. Each reference case (the
+sample data, and small synthetic inputs, see :py:mod:`STJ_PV.synthetic`) is run with
+the reference engine, then the candidate, and their jet latitude, theta and intensity
+are compared against tolerances. The time taken by each is reported, so a new fast
+path can be shown to give the same answer, and how much faster it is, in one run.
+Each engine starts with no input files open, and finds the jet once, untimed, before
+it's timed, so neither is timed with files (or modules) loaded by the other.
+
+    `python equivalence.py --help`
+
+Usage
+-----
+
+    usage: equivalence.py [-h] [--file FILE] [--reference REFERENCE]
+                          [--candidate CANDIDATE] [--cases CASES]
+                          [--work-dir WORK_DIR] [--repeat REPEAT]
+                          [--output OUTPUT]
+            Compare jet position from a candidate engine to the reference
+
+    optional arguments:
+      -h, --help            show this help message and exit
+      --file FILE           Equivalence configuration (cases and tolerances)
+      --reference REFERENCE
+                            Reference engine options, YAML file or mapping
+      --candidate CANDIDATE
+                            Candidate engine options, YAML file or mapping
+      --cases CASES         Comma separated names of cases to run, default all
+      --work-dir WORK_DIR   Directory for synthetic data, IPV and logs
+      --repeat REPEAT       Run each engine this many times, the fastest is used
+      --output OUTPUT       Write the report to this YAML file
+
+For example, to check that keeping intermediate results in memory doesn't change the
+jet position:
+
+    python equivalence.py --candidate '{persist: true}'
+
+The script exits with status 1 if any case is outside tolerance.
+
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse as arg
+import warnings
+import numpy as np
+import pandas as pd
+import dask
+import yaml
+from STJ_PV import run_stj, stj_metric, input_data, synthetic
+
+__author__ = "Penelope Maher, Michael Kelleher"
+
+# Default tolerances: largest absolute difference allowed for each output variable,
+# and the largest fraction of values that may be missing in only one of the outputs
+TOLERANCE = {'lat': 0.01, 'theta': 0.1, 'intens': 0.01, 'missing': 0.0}
+ENGINES = ('reference', 'candidate')
+
+
+def _load_yaml(opts):
+    """Get options from a YAML file, or a YAML mapping as a string."""
+    if opts is None:
+        return None
+    if os.path.exists(opts):
+        with open(opts) as opts_file:
+            return yaml.safe_load(opts_file) or {}
+    return yaml.safe_load(opts) or {}
+
+
+def _cfg_file(file_name):
+    """Find a config file, in the current directory or the package's `conf/`."""
+    if os.path.exists(file_name):
+        return file_name
+    return os.path.join(run_stj.CFG_DIR, file_name)
+
+
+def _merge(config, opts):
+    """Update a config with options, merging (rather than replacing) mappings."""
+    config = dict(config)
+    for key, val in (opts or {}).items():
+        if isinstance(val, dict) and isinstance(config.get(key, None), dict):
+            val = dict(config[key], **val)
+        config[key] = val
+    return config
+
+
+def _date(date):
+    """Get a :class:`datetime.datetime` from a date or string in a config."""
+    return pd.Timestamp(date).to_pydatetime()
+
+
+def _case_data(name, case, work_dir):
+    """
+    Get the data configuration for a case, writing synthetic input if it's needed.
+
+    Synthetic input is written once, to `work_dir/name/data`, and shared by both
+    engines. Each engine writes its own IPV, so the IPV calculation is compared too.
+
+    """
+    with open(_cfg_file(case.get('data_cfg', 'data_config_sample.yml'))) as cfg:
+        data_cfg = _merge(yaml.safe_load(cfg), case.get('data', {}))
+
+    if 'synthetic' not in case:
+        # Relative paths (e.g. sample data) are within the package
+        for key in ['path', 'wpath']:
+            if key in data_cfg and not os.path.isabs(data_cfg[key]):
+                data_cfg[key] = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                             data_cfg[key])
+        return data_cfg, False
+
+    syn = dict(case['synthetic'])
+    data_cfg['path'] = os.path.join(work_dir, name, 'data', '')
+    data_cfg['short_name'] = name
+    if not os.path.exists(data_cfg['path']):
+        year_s, year_e = _date(case['date_s']).year, _date(case['date_e']).year
+        synthetic.write(data_cfg, syn.pop('year_s', year_s), syn.pop('year_e', year_e),
+                        path=data_cfg['path'], **syn)
+    return data_cfg, True
+
+
+def make_run(name, case, options, run_dir, work_dir):
+    """
+    Write the run and data configs for a case to `run_dir`, and set up its run.
+
+    Parameters
+    ----------
+    name : string
+        Name of the case
+    case : dict
+        Case configuration (see :py:func:`run_case`)
+    options : dict
+        Run config options applied on top of the case's (e.g. an engine's)
+    run_dir : string
+        Directory for the configs, log, and IPV files of synthetic cases
+    work_dir : string
+        Directory for synthetic input
+
+    Returns
+    -------
+    jf_run : :py:class:`~STJ_PV.run_stj.JetFindRun`
+        Jet finding run for the case
+    own_ipv : bool
+        IPV is written to `run_dir`, so it's computed by this run
+
+    """
+    os.makedirs(run_dir, exist_ok=True)
+    data_cfg, own_ipv = _case_data(name, case, work_dir)
+    if own_ipv:
+        data_cfg['wpath'] = os.path.join(run_dir, '')
+    with open(_cfg_file(case.get('config', 'stj_config_sample.yml'))) as cfg:
+        config = _merge(yaml.safe_load(cfg), case.get('options', {}))
+    config = _merge(config, options)
+    config['data_cfg'] = os.path.join(run_dir, 'data_cfg.yml')
+    config['log_file'] = os.path.join(run_dir, 'stj_find.log')
+    for cfg_name, cfg in [('data_cfg.yml', data_cfg), ('stj_config.yml', config)]:
+        with open(os.path.join(run_dir, cfg_name), 'w') as cfg_file:
+            yaml.safe_dump(cfg, cfg_file)
+
+    return run_stj.JetFindRun(os.path.join(run_dir, 'stj_config.yml')), own_ipv
+
+
+def clear_ipv(run_dir):
+    """Remove IPV files from `run_dir`, so the next run computes IPV again."""
+    for file_name in os.listdir(run_dir):
+        if file_name.endswith('.nc'):
+            os.remove(os.path.join(run_dir, file_name))
+
+
+def finish_run(jf_run, client=None):
+    """Close a run's dask client (and local cluster) and its log file."""
+    if client is not None:
+        cluster = client.cluster
+        client.close()
+        if cluster is not None:
+            cluster.close()
+
+    # Each JetFindRun adds a file handler to the metric's logger, remove this one's so
+    # the next case isn't logged here too
+    for handler in list(jf_run.log.handlers):
+        jf_run.log.removeHandler(handler)
+        handler.close()
+
+
+def run_case(name, case, engine, work_dir, repeat=1):
+    """
+    Find the jet for a case with one engine.
+
+    Parameters
+    ----------
+    name : string
+        Name of the case
+    case : dict
+        Case configuration: `config` (run config file, default the sample config),
+        `data_cfg` (data config file, default the sample data config), `options` and
+        `data` (overrides of each), `synthetic` (if set, arguments to
+        :py:func:`STJ_PV.synthetic.write`, used in place of the data config's input),
+        `date_s` and `date_e`
+    engine : tuple
+        Engine (reference or candidate) name, and its run config options
+    work_dir : string
+        Directory for synthetic input, IPV files and logs
+    repeat : int, optional
+        Number of times to find the jet, the fastest is reported, default 1. The jet
+        is found once more before these, untimed, after closing all open input files
+
+    Returns
+    -------
+    out_data : dict
+        Jet properties (:py:attr:`~STJ_PV.stj_metric.STJMetric.out_data`) for the case,
+        or if `methods` is set in its run config, mapping of method name to the jet
+        properties found with it
+    wall : float
+        Fastest time taken (seconds)
+
+    """
+    engine_name, engine_opts = engine
+    run_dir = os.path.join(work_dir, name, engine_name)
+    jf_run, own_ipv = make_run(name, case, engine_opts, run_dir, work_dir)
+    config = jf_run.config
+    date_s, date_e = _date(case['date_s']), _date(case['date_e'])
+    # The scheduler is only changed if the engine sets one, and is put back afterwards
+    dask_opts = {key: dask.config.get(key, None) for key in ['scheduler', 'num_workers']}
+    with dask.config.set(dask_opts):
+        client = None
+        if 'execution' in config:
+            client = run_stj.start_scheduler(config['execution'], jf_run.log)
+
+        # Files opened by the other engine's runs would otherwise be in the cache for
+        # this one only, warm up from the same (empty) cache for each engine instead
+        input_data.DATASET_CACHE.clear()
+        times = []
+        for rep in range(repeat + 1):
+            if own_ipv:
+                # Each repeat computes IPV again, rather than using the last one's
+                clear_ipv(run_dir)
+            time_0 = time.perf_counter()
+            jet = jf_run.run(date_s, date_e, save=False)
+            if rep > 0:
+                times.append(time.perf_counter() - time_0)
+        finish_run(jf_run, client)
+
+    if isinstance(jet, dict):
+        return {method: jet[method].out_data for method in jet}, min(times)
+    return jet.out_data, min(times)
+
+
+def compare(ref_data, cand_data, tolerance):
+    """
+    Compare jet properties from the reference and candidate engines.
+
+    Parameters
+    ----------
+    ref_data, cand_data : dict
+        Jet properties from each engine, from :py:func:`run_case`. If these are by
+        method, each method's are compared, as `method:variable`
+    tolerance : dict
+        Largest absolute difference allowed for each type of variable (`lat`, `theta`,
+        `intens`), and the largest fraction of values that may be missing (NaN) in
+        only one of them (`missing`)
+
+    Returns
+    -------
+    result : dict
+        For each compared variable: `max_diff`, `tolerance`, `missing` (fraction
+        missing in only one) and `passed`
+
+    """
+    result = {}
+    if all(isinstance(out_data, dict) for out_data in ref_data.values()):
+        for method in ref_data:
+            _result = compare(ref_data[method], cand_data.get(method, {}), tolerance)
+            result.update({'{}:{}'.format(method, var): _result[var] for var in _result})
+        return result
+
+    for var in ref_data:
+        prefix = var.split('_')[0]
+        if prefix not in tolerance or prefix == 'missing':
+            continue
+        ref = np.asarray(ref_data[var], dtype=float)
+        if var not in cand_data or np.shape(cand_data[var]) != ref.shape:
+            result[var] = {'max_diff': None, 'tolerance': tolerance[prefix],
+                           'missing': 1.0, 'passed': False}
+            continue
+        cand = np.asarray(cand_data[var], dtype=float)
+
+        both = np.isfinite(ref) & np.isfinite(cand)
+        missing = float(np.mean(np.isfinite(ref) != np.isfinite(cand)))
+        max_diff = float(np.max(np.abs(ref - cand)[both])) if both.any() else 0.0
+        result[var] = {
+            'max_diff': max_diff,
+            'tolerance': tolerance[prefix],
+            'missing': missing,
+            'passed': max_diff <= tolerance[prefix]
+            and missing <= tolerance.get('missing', 0.0),
+        }
+    return result
+
+
+def check(cases, reference, candidate, tolerance=None, work_dir=None, repeat=1):
+    """
+    Run each case with the reference and candidate engines, and compare the output.
+
+    Parameters
+    ----------
+    cases : dict
+        Name and configuration of each case (see :py:func:`run_case`)
+    reference, candidate : dict
+        Run config options of each engine
+    tolerance : dict, optional
+        Tolerances (see :py:func:`compare`), default :py:data:`TOLERANCE`
+    work_dir : string, optional
+        Directory for synthetic data, IPV files and logs, default a temporary
+        directory which is removed afterwards
+    repeat : int, optional
+        Number of times to run each engine, the fastest is used, default 1
+
+    Returns
+    -------
+    report : dict
+        Engine options, the commit tested, and for each case: the comparison (see
+        :py:func:`compare`), time taken by each engine, speedup (reference time /
+        candidate time), and whether all variables passed
+
+    """
+    tolerance = dict(TOLERANCE, **(tolerance or {}))
+    tmp_dir = None
+    if work_dir is None:
+        work_dir = tmp_dir = tempfile.mkdtemp(prefix='stj_equiv_')
+
+    report = {'commit-id': stj_metric.git_id(), 'reference': reference,
+              'candidate': candidate, 'tolerance': tolerance, 'cases': {}}
+    try:
+        for name, case in cases.items():
+            out_data = {}
+            times = {}
+            for engine in zip(ENGINES, [reference, candidate]):
+                out_data[engine[0]], times[engine[0]] = run_case(name, case, engine,
+                                                                 work_dir, repeat)
+            result = compare(out_data['reference'], out_data['candidate'], tolerance)
+            report['cases'][name] = {
+                'variables': result,
+                'time': times,
+                'speedup': times['reference'] / times['candidate'],
+                'passed': all(var['passed'] for var in result.values()),
+            }
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
+
+    report['passed'] = all(case['passed'] for case in report['cases'].values())
+    return report
+
+
+def print_report(report):
+    """Print the comparison of each case, and the speedup of the candidate."""
+    print('{:24s} {:>14s} {:>10s} {:>8s}  {}'.format('CASE / VARIABLE', 'MAX DIFF',
+                                                     'TOLERANCE', 'MISSING', 'RESULT'))
+    for name, case in report['cases'].items():
+        print('{:24s} REFERENCE {:.2f}s, CANDIDATE {:.2f}s, SPEEDUP {:.2f}x'.format(
+            name, case['time']['reference'], case['time']['candidate'], case['speedup']))
+        for var, result in case['variables'].items():
+            max_diff = 'SHAPE' if result['max_diff'] is None else result['max_diff']
+            print('  {:22s} {:>14} {:10g} {:8.3f}  {}'.format(
+                var, max_diff if isinstance(max_diff, str) else '{:.3g}'.format(max_diff),
+                result['tolerance'], result['missing'],
+                'PASS' if result['passed'] else 'FAIL'))
+
+    ref_time = sum(case['time']['reference'] for case in report['cases'].values())
+    cand_time = sum(case['time']['candidate'] for case in report['cases'].values())
+    if cand_time > 0:
+        print('TOTAL SPEEDUP {:.2f}x'.format(ref_time / cand_time))
+    print('CANDIDATE {}'.format('PASSED' if report['passed'] else 'FAILED'))
+
+
+def make_parse():
+    """Make command line argument parser with argparse."""
+    parser = arg.ArgumentParser(
+        description='Compare jet position from a candidate engine to the reference'
+    )
+    parser.add_argument('--file', type=str, default='equivalence_default.yml',
+                        help='Equivalence configuration (cases and tolerances)')
+    parser.add_argument('--reference', type=str, default=None,
+                        help='Reference engine options, YAML file or mapping')
+    parser.add_argument('--candidate', type=str, default=None,
+                        help='Candidate engine options, YAML file or mapping')
+    parser.add_argument('--cases', type=str, default=None,
+                        help='Comma separated names of cases to run, default all')
+    parser.add_argument('--work-dir', type=str, default=None,
+                        help='Directory for synthetic data, IPV and logs')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Run each engine this many times, the fastest is used')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Write the report to this YAML file')
+    return parser.parse_args()
+
+
+def main():
+    """Compare engines from command line arguments."""
+    args = make_parse()
+    with open(_cfg_file(args.file)) as cfg:
+        config = yaml.safe_load(cfg)
+
+    engines = {}
+    for engine in ENGINES:
+        engines[engine] = _load_yaml(getattr(args, engine))
+        if engines[engine] is None:
+            engines[engine] = config.get(engine, None) or {}
+
+    cases = config['cases']
+    if args.cases is not None:
+        names = args.cases.split(',')
+        unknown = [name for name in names if name not in cases]
+        if unknown:
+            print('UNKNOWN CASES: {}'.format(', '.join(unknown)))
+            print('POSSIBLE CASES: {}'.format(', '.join(cases)))
+            sys.exit(1)
+        cases = {name: cases[name] for name in names}
+
+    report = check(cases, engines['reference'], engines['candidate'],
+                   config.get('tolerance', None), args.work_dir, args.repeat)
+    print_report(report)
+    if args.output is not None:
+        with open(args.output, 'w') as out_file:
+            yaml.safe_dump(report, out_file, sort_keys=False)
+
+    if not report['passed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    # Only the comparison is of interest here, warnings from polynomial fits and
+    # invalid values are expected (see `run_stj.py`), so aren't shown
+    np.seterr(all='ignore')
+    warnings.simplefilter('ignore')
+    main()
@@ -1,21 +1,203 @@
 # -*- coding: utf-8 -*-
 """Generate or load input data for STJ Metric."""
 import os
+import collections
 import numpy as np
-import pkg_resources
+import importlib.resources
 import datetime as dt
+import cftime
+import dask.utils
+import pandas as pd
 import xarray as xr
 # Dependent code
 import STJ_PV.utils as utils
+import STJ_PV.timing as timing
 
 __author__ = "Penelope Maher, Michael Kelleher"
 
+# Canonical dimension order of input data
+DIM_ORDER = ('time', 'lev', 'lat', 'lon')
+# Factor to convert pressure to Pa, by the units of the vertical coordinate
+PRES_UNITS = {
+    'Pa': 1.0, 'hPa': 100.0, 'mb': 100.0, 'mbar': 100.0, 'millibar': 100.0,
+    'millibars': 100.0, 'kPa': 1000.0,
+}
+
+
+class DatasetCache:
+    """
+    Cache of open :class:`xarray.Dataset`, shared by all input data in a process.
+
+    Each file is opened, and its metadata and coordinates decoded, once. Datasets are
+    keyed by resolved path, modification time, and decode options, the least recently
+    used are closed when there are more than `max_count` or their total size is over
+    `max_bytes`.
+
+    Parameters
+    ----------
+    max_count : int, optional
+        Maximum number of open datasets, default 16
+    max_bytes : int or string, optional
+        Maximum total size (if fully loaded) of open datasets, e.g. '32GB', default no
+        limit. The most recently used dataset is kept open, regardless of its size
+
+    """
+
+    def __init__(self, max_count=16, max_bytes=None):
+        """Initialise an empty cache."""
+        self.datasets = collections.OrderedDict()
+        self.time_indices = {}
+        self.max_count = max_count
+        self.max_bytes = None
+        self.resize(max_count, max_bytes)
+
+    def resize(self, max_count=None, max_bytes=None):
+        """Change cache limits, closing datasets as needed."""
+        if max_count is not None:
+            self.max_count = max_count
+        if isinstance(max_bytes, str):
+            max_bytes = dask.utils.parse_bytes(max_bytes)
+        self.max_bytes = max_bytes
+        self._evict()
+
+    @staticmethod
+    def _path(file_name):
+        return os.path.realpath(file_name)
+
+    def open(self, file_name, **kwargs):
+        """
+        Open a dataset with :func:`xarray.open_dataset`, or get it from the cache.
+
+        Parameters
+        ----------
+        file_name : string
+            Path to netCDF file
+        kwargs : dict
+            Passed to :func:`xarray.open_dataset`
+
+        Returns
+        -------
+        dataset : :class:`xarray.Dataset`
+
+        """
+        path = self._path(file_name)
+        # Include modification time, so a re-written file is opened again
+        key = (path, os.stat(path).st_mtime_ns, tuple(sorted(kwargs.items())))
+
+        if key in self.datasets:
+            self.datasets.move_to_end(key)
+        else:
+            self.datasets[key] = xr.open_dataset(path, **kwargs)
+            self._evict()
+        return self.datasets[key]
+
+    def close(self, file_name):
+        """Close and remove all cached datasets for a file (e.g. before writing it)."""
+        path = self._path(file_name)
+        for key in [key for key in self.datasets if key[0] == path]:
+            self._close(self.datasets.pop(key))
+
+    def clear(self):
+        """Close and remove all cached datasets."""
+        while self.datasets:
+            self._close(self.datasets.popitem()[1])
+
+    def _close(self, dataset):
+        self.time_indices.pop(id(dataset), None)
+        dataset.close()
+
+    def time_index(self, dataset, tname):
+        """
+        Get the sorted time coordinate of a dataset, built once per dataset.
+
+        Parameters
+        ----------
+        dataset : :class:`xarray.Dataset`
+            Dataset, opened with :py:meth:`open`
+        tname : string
+            Name of time coordinate
+
+        Returns
+        -------
+        times : array_like
+            Sorted times
+        order : array_like or None
+            Indices that sort the time coordinate, None if it's already sorted
+
+        """
+        if id(dataset) not in self.time_indices:
+            times = dataset[tname].values
+            if np.all(times[1:] >= times[:-1]):
+                order = None
+            else:
+                order = np.argsort(times, kind='stable')
+                times = times[order]
+            self.time_indices[id(dataset)] = (times, order)
+        return self.time_indices[id(dataset)]
+
+    def _evict(self):
+        """Close least recently used datasets until within limits."""
+        while len(self.datasets) > 1 and (
+                len(self.datasets) > self.max_count
+                or (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+            _, dataset = self.datasets.popitem(last=False)
+            self._close(dataset)
+
+    @property
+    def nbytes(self):
+        """Total size of cached datasets."""
+        return sum(dataset.nbytes for dataset in self.datasets.values())
+
+
+DATASET_CACHE = DatasetCache()
+
+
+def _as_time(date, like):
+    """Convert a :class:`datetime.datetime` to the same type of time as `like`."""
+    if isinstance(like, np.datetime64):
+        date = np.datetime64(date, 'ns')
+    elif isinstance(like, cftime.datetime):
+        # Clamp the day to the length of the month in this calendar (e.g. 30 for
+        # 360_day), so the end of a period (Dec 31) is valid in every calendar
+        day = date.day
+        while True:
+            try:
+                return cftime.datetime(date.year, date.month, day, date.hour,
+                                       date.minute, date.second, calendar=like.calendar)
+            except ValueError:
+                if day <= 28:
+                    raise
+                day -= 1
+    return date
+
+
+def disk_chunks(data):
+    """
+    Get the on-disk (netCDF / HDF5) chunk shape of data as opened from file.
+
+    Parameters
+    ----------
+    data : :class:`xarray.DataArray`
+        Data as opened from file, before any change to the order of its dimensions
+
+    Returns
+    -------
+    chunks : dict
+        Chunk size of each dimension, by name, empty if the data are contiguous on
+        disk, or the layout is unknown
+
+    """
+    chunks = data.encoding.get('chunksizes', None)
+    if chunks is None or data.encoding.get('contiguous', False):
+        return {}
+    return dict(zip(data.dims, chunks))
+
 
 def package_data(relpath, file_name):
     """Get data relative to this installed package.
     Generally used for the sample data."""
-    _data_dir = pkg_resources.resource_filename('STJ_PV', relpath)
-    return xr.open_dataset(os.path.join(_data_dir, file_name))
+    _data_dir = str(importlib.resources.files('STJ_PV').joinpath(relpath))
+    return DATASET_CACHE.open(os.path.join(_data_dir, file_name))
 
 
 class InputData:
@@ -30,16 +212,42 @@ class InputData:
         within those files.
     year : int, optional
         Year of data to load, not used when all years are in a single file
+    cache : dict, optional
+        Variables already loaded by another InputData for the same dates, keyed by
+        (file name, variable name, footprint), shared so each variable is only
+        opened once
+    footprint : dict, optional
+        Part of the grid needed by the metric (see
+        :py:meth:`~STJ_PV.stj_metric.STJMetric.footprint`), only this is read from
+        file. Default None, read all data
 
     """
     # For the default InputData class, there are no required fields
     # this should be overridden in child classes for each metric
     load_vars = []
 
-    def __init__(self, props, date_s=None, date_e=None):
+    def __init__(self, props, date_s=None, date_e=None, cache=None, footprint=None):
         """Initialize InputData object, using JetFindRun class."""
         self.props = props
-        self.data_cfg = props.data_cfg
+        # Input data are normalised to pressure in Pa (see `_normalize`), so
+        # anything using the data config downstream should not re-scale it
+        self.data_cfg = dict(props.data_cfg, pfac=1.0)
+        self.pfac = props.data_cfg.get('pfac', 1.0)
+        # Floating point type data are computed in (`dtype` in run config)
+        self.dtype = np.dtype(props.config.get('dtype', 'float32'))
+        self.date_s = date_s
+        self.date_e = date_e
+        self.footprint = footprint
+        # Records the time taken by each stage, if timing is enabled for the run
+        self.timer = getattr(props, 'timer', timing.StageTimer(enabled=False))
+
+        if cache is None:
+            cache = {}
+        self.cache = cache
+
+        exec_cfg = props.config.get('execution', {})
+        DATASET_CACHE.resize(exec_cfg.get('file_cache_count', None),
+                             exec_cfg.get('file_cache_size', None))
 
         if date_s is not None:
             self.year = date_s.year
@@ -95,49 +303,76 @@ class InputData:
                 self.props.log.info('FILE FOR %s NOT FOUND', data_var)
 
     def _chunk_data(self, var):
-        """Re-chunk input data to ideal size."""
+        """Re-chunk input data to ideal size, in the compute type (`self.dtype`)."""
         self.in_data[var] = self.in_data[var].chunk(self.chunk)
+        if np.issubdtype(self.in_data[var].dtype, np.floating):
+            self.in_data[var] = self.in_data[var].astype(self.dtype)
+
+    def _set_chunks(self, data, mem_target=None, excldims=('lev', 'lat'),
+                    disk_chunks=None):
+        """
+        Plan dask chunks for input data, from its on-disk chunks and a memory target.
+
+        Parameters
+        ----------
+        data : :class:`xarray.DataArray`
+            Input data, selected and normalised (see :py:meth:`_normalize`)
+        mem_target : int or string, optional
+            Target size of each chunk in bytes (or a string like '64MB'), default is
+            `chunk_memory` in the `execution` run config, or 64MB, reduced if memory
+            use is high (see :py:class:`~STJ_PV.memory.MemoryGovernor`)
+        excldims : tuple
+            Dimensions (as named in the data config) kept in one chunk, since the
+            interpolation and fits need all of them at once
+        disk_chunks : dict, optional
+            On-disk chunk size of each dimension, by name (see :py:func:`disk_chunks`),
+            default is one element of each dimension (contiguous or unknown layout)
+
+        """
+        if mem_target is None and hasattr(self.props, 'governor'):
+            mem_target = self.props.governor.chunk_memory
+        elif mem_target is None:
+            mem_target = self.props.config.get('execution', {}).get('chunk_memory',
+                                                                    '64MB')
+        if isinstance(mem_target, str):
+            mem_target = dask.utils.parse_bytes(mem_target)
 
-    def _set_chunks(self, data, max_size=3e6, excldims=('lev', 'lat')):
-        """Get ideal-ish chunks in a different way."""
-        shape = data.shape
-        npoints = np.prod(shape)
         excl_n = [self.data_cfg[excldim] for excldim in excldims]
-        dims = [
-            coord
-            for coord in data.coords
-            if coord in data.dims and coord not in excl_n
-        ]
-        chunks = {dim: data[dim].shape[0] for dim in dims}
-        divis = {dim: 1 for dim in dims}
-        n_iter = 0
-
-        while npoints > max_size and n_iter < 10:
-            _pts = np.prod([data[name].shape[0] for name in excl_n])
-            for dim in dims:
-                divis[dim] *= 2
-                _pts *= chunks[dim] // divis[dim]
-            npoints = _pts
-            n_iter += 1
-        self.props.log.info(f'  Chunking took {n_iter} iterations')
-        chunks_out = {dim: chunks[dim] // divis[dim] for dim in dims}
-        for exname in excl_n:
-            chunks_out[exname] = data[exname].shape[0]
-
-        for dim in chunks_out:
-            # Quick sanity check to make sure we don't divide by 0
-            if chunks_out[dim] == 0:
-                chunks_out[dim] = 1
-
-            self.props.log.info(f'    - {dim}: {chunks_out[dim]}')
-        self.props.log.info(f'  Chunk size: {npoints}')
-
-        self.chunk = chunks_out
-
-    def _load_one_file(self, var, file_var=None):
+        sizes = dict(zip(data.dims, data.shape))
+
+        # On-disk chunk shape, chunks are whole multiples of this, so each chunk of
+        # the file is read (and decompressed) by only one dask task
+        disk_chunks = disk_chunks or {}
+        disk_chunks = {dim: min(disk_chunks.get(dim, 1), sizes[dim]) for dim in data.dims}
+
+        chunks = {dim: sizes[dim] if dim in excl_n else disk_chunks[dim]
+                  for dim in data.dims}
+        n_bytes = data.dtype.itemsize * np.prod(list(chunks.values()))
+
+        # Grow the rest from the innermost (fastest varying on disk) dimension out
+        for dim in reversed(data.dims):
+            if dim in excl_n:
+                continue
+            n_disk = -(-sizes[dim] // disk_chunks[dim])
+            mult = int(min(max(mem_target // n_bytes, 1), n_disk))
+            chunks[dim] = min(disk_chunks[dim] * mult, sizes[dim])
+            n_bytes = n_bytes // disk_chunks[dim] * chunks[dim]
+
+        n_chunks = np.prod([-(-sizes[dim] // chunks[dim]) for dim in data.dims])
+        self.props.log.info('  CHUNK PLAN FOR %s (ON DISK: %s)', data.name,
+                            ', '.join(['{}: {}'.format(dim, disk_chunks[dim])
+                                       for dim in data.dims]))
+        for dim in data.dims:
+            self.props.log.info('    - %s: %d', dim, chunks[dim])
+        self.props.log.info('  %d CHUNKS OF %s', n_chunks, dask.utils.format_bytes(n_bytes))
+
+        self.chunk = chunks
+
+    def _load_one_file(self, var, file_var=None, vname=None):
         """Load a single netCDF file as an xarray.Dataset."""
         cfg = self.data_cfg
-        vname = cfg[var]
+        if vname is None:
+            vname = cfg[var]
 
         # Use this to set the file variable name (look for uwnd in ipv file)
         if file_var is None:
@@ -149,38 +384,189 @@ class InputData:
         except KeyError:
             file_name = cfg['file_paths']['all'].format(year=self.year)
 
+        if self.footprint is None:
+            cache_key = (file_name, vname, None)
+        else:
+            cache_key = (file_name, vname, tuple(sorted(self.footprint.items())))
+
+        if cache_key in self.cache:
+            # Another InputData has already opened and chunked this variable
+            self.props.log.info('USING CACHED: %s FROM %s', vname, file_name)
+            self.in_data[var] = self.cache[cache_key]
+            return
+
         self.props.log.info(
             'OPEN: {}'.format(os.path.join(cfg['path'], file_name))
         )
-        try:
-            nc_file = xr.open_dataset(os.path.join(cfg['path'], file_name))
-        except FileNotFoundError:
-            nc_file = package_data(cfg['path'], file_name)
-
-        self.in_data[var] = nc_file[vname].sel(**self.sel)
-        _fails = 0
-        while self.in_data[var][cfg['time']].shape[0] == 0 and _fails < 15:
-            # Update the time slice so that it covers potential mis-match
-            # between how days are requested and how they're stored in the
-            # netCDF file (e.g. ask for 2013-07-14 00:00, but the netCDF
-            # file has 2013-07-14 09:00)
-            _day = dt.timedelta(hours=23)
-            self.sel[cfg['time']] = slice(
-                self.sel[cfg['time']].start, self.sel[cfg['time']].stop + _day
-            )
-            self.in_data[var] = nc_file[vname].sel(**self.sel)
-            self.props.log.info(
-                'UPDATING TIME SLICE BY 1 DAY %s',
-                (self.sel[cfg['time']].stop.strftime('%Y-%m-%d %HZ')),
+        with self.timer.stage('open', self.year):
+            try:
+                nc_file = DATASET_CACHE.open(os.path.join(cfg['path'], file_name))
+            except FileNotFoundError:
+                nc_file = package_data(cfg['path'], file_name)
+
+        with self.timer.stage('select', self.year) as stage:
+            _sel = {dim: self.sel[dim] for dim in self.sel if dim != cfg['time']}
+            # Chunk shape is by dimension name, since normalising can reorder them
+            _disk_chunks = disk_chunks(nc_file[vname])
+            self.in_data[var] = self._normalize(
+                nc_file[vname].isel(**{cfg['time']: self._time_select(nc_file)})
+                .sel(**_sel),
+                vert_pres=cfg['ztype'] == 'pres' and file_var != 'ipv',
             )
+            if self.footprint is not None:
+                self.in_data[var] = self._subset_footprint(self.in_data[var])
+
+            if all([self.chunk[var] is None for var in self.chunk]):
+                self._set_chunks(self.in_data[var], disk_chunks=_disk_chunks)
+
+            # Size of the selected data in memory (in the file's type, before the
+            # change to the compute type), compressed files read fewer bytes from disk
+            stage['bytes_processed'] = self.in_data[var].nbytes
+            stage['elements'] = self.in_data[var].size
+            self._chunk_data(var)
+            self.in_data[var] = self.timer.persist(self.in_data[var])
+        self.cache[cache_key] = self.in_data[var]
+
+    def _normalize(self, data, vert_pres=False):
+        """
+        Put data on the canonical grid used by all metrics.
+
+        Latitude and vertical level are ascending, longitude is ascending on
+        [0, 360), dimensions are ordered (time, lev, lat, lon), and pressure levels
+        are in Pa. Each step is only applied (and logged) if the data needs it, and
+        uses index selection so nothing is read from file.
+
+        Parameters
+        ----------
+        data : :class:`xarray.DataArray`
+            Lazily opened input data, as it is on file
+        vert_pres : bool, optional
+            Vertical coordinate is pressure, default False
+
+        Returns
+        -------
+        data : :class:`xarray.DataArray`
+            Input data on the canonical grid
+
+        """
+        vtime, vlev, vlat, vlon = [self.data_cfg[cvar] for cvar in DIM_ORDER]
+        steps = []
+
+        if vlon in data.dims:
+            lon = data[vlon].values
+            lon_pos = lon % 360.0
+            if np.any(lon_pos != lon) or np.any(np.diff(lon_pos) <= 0):
+                order = np.argsort(lon_pos, kind='stable')
+                data = data.isel(**{vlon: order}).assign_coords(
+                    **{vlon: (vlon, lon_pos[order], data[vlon].attrs)}
+                )
+                steps.append('{} TO [0, 360)'.format(vlon))
+
+        for dim in [vlat, vlev]:
+            if dim in data.dims and data[dim].shape[0] > 1 and data[dim][0] > data[dim][-1]:
+                data = data.isel(**{dim: slice(None, None, -1)})
+                steps.append('{} ASCENDING'.format(dim))
+
+        if vert_pres and vlev in data.dims:
+            units = data[vlev].attrs.get('units', None)
+            pfac = PRES_UNITS.get(units, self.pfac)
+            if pfac != 1.0 or units != 'Pa':
+                data = data.assign_coords(
+                    **{vlev: (vlev, data[vlev].values * pfac,
+                              dict(data[vlev].attrs, units='Pa'))}
+                )
+                steps.append('{} FROM {} TO Pa'.format(vlev, units))
 
-            # Iterate, but don't get stuck here
-            _fails += 1
+        dims = [dim for dim in (vtime, vlev, vlat, vlon) if dim in data.dims]
+        dims += [dim for dim in data.dims if dim not in dims]
+        if tuple(dims) != data.dims:
+            data = data.transpose(*dims)
+            steps.append('DIMS TO {}'.format(dims))
 
-        if all([self.chunk[var] is None for var in self.chunk]):
-            self._set_chunks(self.in_data[var])
+        if steps:
+            self.props.log.info('  NORMALIZE %s: %s', data.name, ', '.join(steps))
+        return data
 
-        self._chunk_data(var)
+    def _subset_footprint(self, data):
+        """Subset (lazily opened) data to the footprint, before it's read or chunked."""
+        vlat = self.data_cfg['lat']
+        vlev = self.data_cfg['lev']
+
+        if 'lat_band' in self.footprint and vlat in data.dims:
+            abs_lat = np.abs(data[vlat].values)
+            lat_min, lat_max = self.footprint['lat_band']
+            in_band = np.where((abs_lat >= lat_min) & (abs_lat <= lat_max))[0]
+            data = data.isel(**{vlat: in_band})
+
+        if 'lev' in self.footprint and vlev in data.dims:
+            levs = data[vlev].values
+            lev_min, lev_max = self.footprint['lev']
+            in_range = np.where((levs >= lev_min) & (levs <= lev_max))[0]
+            if in_range.shape[0] == 0:
+                in_range = np.array([np.abs(levs - lev_min).argmin()])
+            # Keep one level either side, to be safe with rounding in level values
+            lev_s = max(in_range.min() - 1, 0)
+            lev_e = min(in_range.max() + 2, levs.shape[0])
+            data = data.isel(**{vlev: slice(lev_s, lev_e)})
+
+        self.props.log.info('  SUBSET %s TO FOOTPRINT: %s', data.name, self.footprint)
+        return data
+
+    def _time_select(self, nc_file):
+        """
+        Find indices of the requested dates in a file, for use with `isel`.
+
+        Uses a sorted time index (built once per file) and the `time_match` data config
+        option: 'day' (default) includes all times on the start and end days (so
+        daily data stored at e.g. 12Z are found), 'exact' matches the dates as given,
+        and a time interval (e.g. '12h') widens the date
+        range by this much on either side.
+
+        Parameters
+        ----------
+        nc_file : :class:`xarray.Dataset`
+            Opened input data file
+
+        Returns
+        -------
+        tselect : slice or array_like
+            Indices along time axis of `nc_file` for the requested dates
+
+        """
+        date_s = self.sel[self.data_cfg['time']].start
+        date_e = self.sel[self.data_cfg['time']].stop
+        times, order = DATASET_CACHE.time_index(nc_file, self.data_cfg['time'])
+
+        time_match = self.data_cfg.get('time_match', 'day')
+        if time_match == 'day':
+            if date_s is not None:
+                date_s = dt.datetime(date_s.year, date_s.month, date_s.day)
+            if date_e is not None:
+                date_e = (dt.datetime(date_e.year, date_e.month, date_e.day)
+                          + dt.timedelta(days=1))
+            e_side = 'left'
+        else:
+            if time_match != 'exact':
+                tol = pd.Timedelta(time_match).to_pytimedelta()
+                date_s = date_s - tol if date_s is not None else None
+                date_e = date_e + tol if date_e is not None else None
+            e_side = 'right'
+
+        t_0 = 0
+        t_1 = times.shape[0]
+        if date_s is not None:
+            t_0 = np.searchsorted(times, _as_time(date_s, times[0]), side='left')
+        if date_e is not None:
+            t_1 = np.searchsorted(times, _as_time(date_e, times[0]), side=e_side)
+
+        if order is None:
+            tselect = slice(t_0, t_1)
+        else:
+            tselect = np.sort(order[t_0:t_1])
+
+        if t_1 <= t_0:
+            self.props.log.info('NO TIMES FOUND FOR %s - %s', date_s, date_e)
+        return tselect
 
     def get_data(self):
         """Get a single xarray.Dataset of required components for metric."""
@@ -198,12 +584,13 @@ class InputData:
             out_file = os.path.join(self.data_cfg['wpath'], file_name)
 
         if not os.access(out_file, os.W_OK):
-            write_dir = pkg_resources.resource_filename(
-                'STJ_PV', self.data_cfg['wpath']
+            write_dir = str(
+                importlib.resources.files('STJ_PV').joinpath(self.data_cfg['wpath'])
             )
             out_file = os.path.join(write_dir, file_name)
 
         self.props.log.info('Begin writing to %s', out_file)
+        DATASET_CACHE.close(out_file)
         self.get_data().to_netcdf(out_file)
         self.props.log.info('Finished writing to %s', out_file)
 
@@ -223,11 +610,11 @@ class InputDataSTJPV(InputData):
 
     """
 
-    load_vars = ['uwnd', 'vwnd', 'tair', 'epv', 'ipv']
+    load_vars = ['uwnd', 'vwnd', 'tair', 'epv', 'ipv', 'pres']
 
-    def __init__(self, props, date_s=None, date_e=None):
+    def __init__(self, props, date_s=None, date_e=None, cache=None, footprint=None):
         """Initialize InputData object, using JetFindRun class."""
-        super(InputDataSTJPV, self).__init__(props, date_s, date_e)
+        super(InputDataSTJPV, self).__init__(props, date_s, date_e, cache, footprint)
 
         # Each STJPV input data _must_ have u-wind and isentropic pv
         # but _might_ also need the v-wind and air temperature to
@@ -235,6 +622,9 @@ class InputDataSTJPV(InputData):
         self.out_data = {'uwnd': None, 'ipv': None}
         self.th_lev = None
 
+        # Bounding the fit by the thermal tropopause needs pressure on isentropic levels
+        self.need_pres = props.config.get('trop_bound', False)
+
     def _find_pv_update(self):
         """Determine if PV needs to be computed/re-computed."""
         pv_file_name = self.data_cfg['file_paths']['ipv'].format(
@@ -250,11 +640,12 @@ class InputDataSTJPV(InputData):
         if not self.in_data:
             self._load_data()
         self.props.log.info('Starting IPV calculation')
+        stage = self.timer.start('ipv', self.year)
         # calculate IPV
         if cfg['ztype'] == 'pres':
             if 'epv' not in self.in_data:
                 self.props.log.info('USING U, V, T TO COMPUTE IPV')
-                ipv, _, uwnd = utils.xripv(
+                ipv, pres, uwnd = utils.xripv(
                     self.in_data['uwnd'],
                     self.in_data['vwnd'],
                     self.in_data['tair'],
@@ -281,8 +672,20 @@ class InputDataSTJPV(InputData):
                     newlevname=cfg['lev'],
                 )
 
+                if self.need_pres:
+                    pres_in = self.in_data['tair'][cfg['lev']] * cfg['pfac']
+                    pres = utils.xrvinterp(
+                        pres_in.astype(self.dtype),
+                        thta,
+                        self.props.th_levels,
+                        levname=cfg['lev'],
+                        newlevname=cfg['lev'],
+                    )
+
             self.out_data['ipv'] = ipv
             self.out_data['uwnd'] = uwnd
+            if self.need_pres:
+                self.out_data['pres'] = pres
 
             self.th_lev = self.props.th_levels
 
@@ -295,6 +698,8 @@ class InputDataSTJPV(InputData):
             )
             self.out_data['ipv'] = ipv
             self.out_data['uwnd'] = self.in_data['uwnd']
+            if self.need_pres:
+                self.out_data['pres'] = self.in_data['pres']
 
         ipv_attrs = {
             'units': '10^-6 PVU',
@@ -309,6 +714,17 @@ class InputDataSTJPV(InputData):
 
         self.out_data['ipv'] = self.out_data['ipv'].assign_attrs(ipv_attrs)
         self.out_data['uwnd'] = self.out_data['uwnd'].assign_attrs(uwnd_attrs)
+        if self.need_pres:
+            pres_attrs = {
+                'units': 'Pa',
+                'standard_name': 'air_pressure',
+                'descr': 'Pressure on isentropic levels',
+            }
+            self.out_data['pres'] = self.out_data['pres'].assign_attrs(pres_attrs)
+
+        self.out_data = self.timer.persist(self.out_data)
+        stage['elements'] = sum(self.in_data[var].size for var in self.in_data)
+        self.timer.stop(stage)
         self.props.log.info('Finished calculating IPV')
 
     def _load_ipv(self):
@@ -324,6 +740,15 @@ class InputDataSTJPV(InputData):
             # But fall back on the uwind file
             self._load_one_file('uwnd')
 
+        if self.need_pres:
+            try:
+                # Pressure on isentropic levels is written to the IPV file
+                self._load_one_file(
+                    'pres', file_var='ipv', vname=self.data_cfg.get('pres', 'pres')
+                )
+            except KeyError:
+                self.props.log.info('NO PRESSURE IN IPV FILE')
+
         self.out_data = self.in_data
         self.th_lev = self.in_data['ipv'][self.data_cfg['lev']]
 
@@ -341,7 +766,11 @@ class InputDataSTJPV(InputData):
             {'units': 'K', 'standard_name': 'potential_temperature'}
         )
         dsout.encoding = dict((var, encoding) for var in dsout.data_vars)
-        dsout.to_netcdf(pv_file, encoding=dsout.encoding)
+        DATASET_CACHE.close(pv_file)
+        with self.timer.stage('ipv_write', self.year) as stage:
+            dsout.to_netcdf(pv_file, encoding=dsout.encoding)
+            stage['bytes_written'] = timing.file_size(pv_file)
+            stage['elements'] = sum(dsout[var].size for var in dsout.data_vars)
         self.props.log.info('DONE WRITING PV FILE')
 
     def get_data(self):
@@ -352,15 +781,26 @@ class InputDataSTJPV(InputData):
             force_write = False
 
         if self._find_pv_update():
+            write_ipv = self.sel[self.data_cfg['time']] == slice(None) or force_write
+            if write_ipv:
+                # IPV file is re-used by other runs, so it must cover the whole grid
+                self.footprint = None
             self._calc_ipv()
-            if self.sel[self.data_cfg['time']] == slice(None) or force_write:
+            if write_ipv:
                 self._write_ipv()
 
         else:
             self._load_ipv()
+            if self.need_pres and 'pres' not in self.out_data:
+                # Older IPV files don't have pressure, so it has to be re-computed
+                self.props.log.info('RE-COMPUTING IPV TO GET PRESSURE')
+                self.in_data = {}
+                self.out_data = {'uwnd': None, 'ipv': None}
+                self._calc_ipv()
 
         if self.th_lev[0] > self.th_lev[-1]:
-            for data_var in ['uwnd', 'ipv']:
+            # Input data are ascending, but computed IPV is on the configured levels
+            for data_var in self.out_data:
                 self.out_data[data_var] = self.out_data[data_var][:, ::-1]
             self.th_lev = self.th_lev[::-1]
 
@@ -385,12 +825,13 @@ class InputDataUWind(InputData):
     """
 
 
-    def __init__(self, props, date_s=None, date_e=None, vwnd=False):
+    def __init__(self, props, date_s=None, date_e=None, vwnd=False, cache=None,
+                 footprint=None):
         """Initialize InputData object, using JetFindRun class."""
         self.load_vars = ['uwnd']
         if vwnd:
             self.load_vars.append("vwnd")
-        super(InputDataUWind, self).__init__(props, date_s, date_e)
+        super(InputDataUWind, self).__init__(props, date_s, date_e, cache, footprint)
 
         # Each UWind input data _must_ have u-wind
         # but _might_ also need the pressure calculate isobaric uwind
@@ -424,3 +865,91 @@ class InputDataUWind(InputData):
         return xr.Dataset(
             self.out_data, attrs={'cfg': self.data_cfg, 'year': self.year}
         )
+
+
+class InputDataMulti(InputData):
+    """
+    Contains the input data for several metrics run on the same dataset.
+
+    Each variable is opened, selected and chunked once, then shared between the
+    :py:class:`InputData` needed by each metric. Metrics which use the same kind
+    of input data (e.g. STJUMax and DavisBirner) share the same :class:`xarray.Dataset`.
+
+    Parameters
+    ----------
+    jet_find : :py:meth:`~STJ_PV.run_stj.JetFindRun`
+        Object containing properties about the metric calculation
+        to be performed. Used to locate correct files, and variables
+        within those files.
+    methods : list
+        Names of the metrics (e.g. ['STJPV', 'STJUMax']) which need data
+    footprints : dict, optional
+        Mapping of method name to the footprint of the data it needs (see
+        :py:meth:`~STJ_PV.stj_metric.STJMetric.footprint`), default all data
+
+    """
+
+    def __init__(self, props, methods, date_s=None, date_e=None, footprints=None):
+        """Initialize InputDataMulti object, using JetFindRun class."""
+        super(InputDataMulti, self).__init__(props, date_s, date_e)
+        self.methods = methods
+        if footprints is None:
+            footprints = {}
+        self.footprints = footprints
+        self.out_data = {}
+
+    def get_data(self):
+        """
+        Load and compute the data for each method.
+
+        Returns
+        -------
+        data : dict
+            Mapping of method name to :class:`xarray.Dataset` for that metric
+
+        """
+        by_loader = {}
+        for method in self.methods:
+            loader_cls, kwargs = get_loader(method)
+            footprint = self.footprints.get(method, None)
+            if footprint is None:
+                fp_key = None
+            else:
+                fp_key = tuple(sorted(footprint.items()))
+            key = (loader_cls.__name__, tuple(sorted(kwargs.items())), fp_key)
+            if key not in by_loader:
+                self.props.log.info('LOAD %s DATA FOR %s', loader_cls.__name__, method)
+                loader = loader_cls(
+                    self.props, self.date_s, self.date_e, cache=self.cache,
+                    footprint=footprint, **kwargs
+                )
+                by_loader[key] = loader.get_data()
+            self.out_data[method] = by_loader[key]
+
+        return self.out_data
+
+
+def get_loader(method):
+    """
+    Get the InputData class needed for a particular metric.
+
+    Parameters
+    ----------
+    method : string
+        Name of the metric, as in the `method` key of the run configuration
+
+    Returns
+    -------
+    loader : type
+        Subclass of :py:class:`InputData` which provides data for `method`
+    kwargs : dict
+        Extra keyword arguments to pass to `loader` when it is created
+
+    """
+    if method == 'STJPV':
+        loader = (InputDataSTJPV, {})
+    elif method in ['STJUMax', 'DavisBirner']:
+        loader = (InputDataUWind, {})
+    else:
+        loader = (InputDataUWind, {'vwnd': True})
+    return loader
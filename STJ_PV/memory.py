@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""Keep memory used by a jet finding run under a ceiling."""
+import os
+import socket
+import threading
+import psutil
+import dask.utils
+
+__author__ = "Penelope Maher, Michael Kelleher"
+
+# Above this fraction of the ceiling, chunks / years in flight are reduced, below the
+# lower fraction they're increased again (up to the configured values)
+HIGH_WATER = 0.85
+LOW_WATER = 0.5
+# Smallest chunk target, below this dask overhead is larger than the data
+MIN_CHUNK = dask.utils.parse_bytes('4MB')
+
+
+def _worker_memory():
+    """Get host name, process ID and resident memory of a dask worker."""
+    return socket.gethostname(), os.getpid(), psutil.Process().memory_info().rss
+
+
+def memory_used(client=None):
+    """
+    Get resident memory of this process, its children, and a client's dask workers.
+
+    Parameters
+    ----------
+    client : :class:`dask.distributed.Client`, optional
+        If set, also include memory of this client's workers, which may be on other
+        machines (an external or distributed scheduler). Workers that are children
+        of this process (a local cluster) are only counted once
+
+    Returns
+    -------
+    rss : int
+        Resident set size, in bytes
+
+    """
+    proc = psutil.Process()
+    rss = proc.memory_info().rss
+    pids = {proc.pid}
+    for child in proc.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+            pids.add(child.pid)
+        except psutil.Error:
+            # Child has finished since it was listed
+            pass
+
+    if client is not None:
+        host = socket.gethostname()
+        for w_host, w_pid, w_rss in client.run(_worker_memory).values():
+            if w_host != host or w_pid not in pids:
+                rss += w_rss
+    return rss
+
+
+class PeakMemory:
+    """
+    Sample memory in a background thread, to find the peak over a block of code.
+
+    Used as a context manager, memory is sampled every `interval` seconds from entry
+    to exit: the resident memory of this process and its children (see
+    :py:func:`memory_used`), and of each process in `pids` (e.g. dask workers).
+
+    Parameters
+    ----------
+    pids : iterable, optional
+        Process IDs to record the peak of separately, default none
+    interval : float, optional
+        Time between samples (seconds), default 0.1
+
+    """
+
+    def __init__(self, pids=(), interval=0.1):
+        """Initialise memory sampler, with no samples."""
+        self.interval = interval
+        self.peak = 0
+        self.peaks = {pid: 0 for pid in pids}
+        self._procs = {pid: psutil.Process(pid) for pid in pids}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        """Sample memory used, and update peaks."""
+        self.peak = max(self.peak, memory_used())
+        for pid, proc in self._procs.items():
+            try:
+                self.peaks[pid] = max(self.peaks[pid], proc.memory_info().rss)
+            except psutil.Error:
+                # Process has finished
+                pass
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        """Start sampling."""
+        self.sample()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        """Stop sampling."""
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        return False
+
+
+def _parse_bytes(size, total=None):
+    """Get bytes from a string (e.g. '4GB'), or a fraction (<= 1) of `total`."""
+    if size is None:
+        return None
+    if isinstance(size, str):
+        try:
+            size = float(size)
+        except ValueError:
+            return dask.utils.parse_bytes(size)
+    if size <= 1 and total is not None:
+        return int(size * total)
+    return int(size)
+
+
+class MemoryGovernor:
+    """
+    Adapt dask chunk size and years in flight to stay under a memory ceiling.
+
+    Memory used (resident memory of this process and its children, and of the dask
+    client's workers, on this or other machines) and memory available on this machine
+    are sampled
+    with :py:mod:`psutil` before each year (or other period) is loaded, and when it's
+    complete. Above `HIGH_WATER` of the ceiling, or with less than `memory_headroom`
+    left, the number of years in flight is reduced, then the chunk target (halved,
+    down to `MIN_CHUNK`). Below `LOW_WATER` of the ceiling, each is increased back to
+    its configured value. If there's too little headroom, and nothing left to reduce,
+    :py:meth:`update` raises a :class:`MemoryError`, so the run stops cleanly (and can
+    be resumed) rather than being killed.
+
+    Parameters
+    ----------
+    exec_cfg : dict
+        Execution options, from the `execution` section of the run config, uses
+        `memory_ceiling` (bytes, a string like '48GB', or a fraction of total memory,
+        default None which turns the governor off), `memory_headroom` (default 1GB)
+        and `chunk_memory` (default 64MB)
+    years_in_flight : int, optional
+        Configured number of years in flight, the most that are allowed, default 1
+    log : :py:class:`logging.Logger`, optional
+        Logger for the run, where adjustments are recorded
+
+    """
+
+    def __init__(self, exec_cfg, years_in_flight=1, log=None):
+        """Initialise memory governor with configured chunk size and years in flight."""
+        total = psutil.virtual_memory().total
+        self.ceiling = _parse_bytes(exec_cfg.get('memory_ceiling', None), total)
+        self.headroom = _parse_bytes(exec_cfg.get('memory_headroom', '1GB'), total)
+        self.chunk_target = _parse_bytes(exec_cfg.get('chunk_memory', '64MB'))
+        self.max_in_flight = max(years_in_flight, 1)
+        self.log = log
+        self.chunk_memory = self.chunk_target
+        self.in_flight = self.max_in_flight
+        self.peak = 0
+
+        if self.enabled and self.log is not None:
+            self.log.info('MEMORY CEILING %s, HEADROOM %s',
+                          dask.utils.format_bytes(self.ceiling),
+                          dask.utils.format_bytes(self.headroom))
+
+    @property
+    def enabled(self):
+        """Memory is only governed if there's a ceiling."""
+        return self.ceiling is not None
+
+    def reset(self):
+        """Go back to the configured chunk size and years in flight."""
+        self.chunk_memory = self.chunk_target
+        self.in_flight = self.max_in_flight
+        self.peak = 0
+
+    def sample(self):
+        """
+        Sample memory used by the run, and available on the machine.
+
+        Memory used includes the workers of the current dask client, if there is one,
+        wherever they're running.
+
+        Returns
+        -------
+        used, available : int
+            Memory in bytes
+
+        """
+        try:
+            from dask.distributed import get_client
+            client = get_client()
+        except (ImportError, ValueError):
+            client = None
+        used = memory_used(client)
+        self.peak = max(self.peak, used)
+        return used, psutil.virtual_memory().available
+
+    def update(self, when=''):
+        """
+        Sample memory, and adapt chunk size and years in flight to stay under ceiling.
+
+        Parameters
+        ----------
+        when : string, optional
+            Description of this point in the run, for the log
+
+        Raises
+        ------
+        MemoryError
+            If there's less than `memory_headroom` left under the ceiling (or on the
+            machine), with the smallest chunks and one year in flight
+
+        """
+        if not self.enabled:
+            return
+        used, available = self.sample()
+        headroom = min(self.ceiling - used, available)
+        self.log.info('MEMORY %s: %s USED (PEAK %s), %s AVAILABLE', when,
+                      dask.utils.format_bytes(used), dask.utils.format_bytes(self.peak),
+                      dask.utils.format_bytes(available))
+
+        if used > HIGH_WATER * self.ceiling or headroom < self.headroom:
+            if not self._reduce() and headroom < self.headroom:
+                msg = ('NOT ENOUGH MEMORY TO CONTINUE: {} USED OF {} CEILING, {} '
+                       'AVAILABLE, NEED {} HEADROOM. REDUCE chunk_memory OR RAISE '
+                       'memory_ceiling, THEN RUN WITH --resume'.format(
+                           *[dask.utils.format_bytes(size) for size in
+                             [used, self.ceiling, available, self.headroom]]))
+                self.log.error(msg)
+                raise MemoryError(msg)
+
+        elif used < LOW_WATER * self.ceiling:
+            self._increase()
+
+    def _reduce(self):
+        """Reduce years in flight, or chunk size, return False if neither can be."""
+        if self.in_flight > 1:
+            self.in_flight -= 1
+            self.log.info('MEMORY HIGH: REDUCE YEARS IN FLIGHT TO %d', self.in_flight)
+        elif self.chunk_memory > MIN_CHUNK:
+            self.chunk_memory = max(self.chunk_memory // 2, MIN_CHUNK)
+            self.log.info('MEMORY HIGH: REDUCE CHUNK TARGET TO %s',
+                          dask.utils.format_bytes(self.chunk_memory))
+        else:
+            return False
+        return True
+
+    def _increase(self):
+        """Increase chunk size, or years in flight, back to their configured values."""
+        if self.chunk_memory < self.chunk_target:
+            self.chunk_memory = min(self.chunk_memory * 2, self.chunk_target)
+            self.log.info('MEMORY LOW: INCREASE CHUNK TARGET TO %s',
+                          dask.utils.format_bytes(self.chunk_memory))
+        elif self.in_flight < self.max_in_flight:
+            self.in_flight += 1
+            self.log.info('MEMORY LOW: INCREASE YEARS IN FLIGHT TO %d', self.in_flight)
@@ -8,6 +8,9 @@ Usage
 -----
 
     usage: run_stj.py [-h] [--sample] [--sens] [--warn] [--file FILE] [--ys YS] [--ye YE]
+                      [--scheduler SCHEDULER] [--workers WORKERS] [--threads THREADS]
+                      [--memory-limit MEMORY_LIMIT] [--local-dir LOCAL_DIR]
+                      [--dashboard] [--resume | --force] [--profile]
             Find the sub-tropical jet
 
     optional arguments:
@@ -18,6 +21,22 @@ Usage
       --file FILE  Configuration file path
       --ys YS      Start Year
       --ye YE      End Year
+      --scheduler SCHEDULER
+                   Dask scheduler: synchronous, threads, processes, local, or address
+                   of an existing scheduler
+      --workers WORKERS
+                   Number of dask workers
+      --threads THREADS
+                   Threads per dask worker (local cluster only)
+      --memory-limit MEMORY_LIMIT
+                   Memory limit per worker, e.g. '4GB' (local cluster only)
+      --local-dir LOCAL_DIR
+                   Directory for worker files and spilling to disk
+      --dashboard  Start the dask dashboard (local cluster only)
+      --resume     Skip years completed by a previous run of this config
+      --force      Start from the beginning, ignoring previous runs
+      --profile    Write a dask performance report, task stream, worker profiles, and
+                   tasks per stage beside the output file
 
 
 Authors: Penelope Maher, Michael Kelleher
@@ -25,20 +44,59 @@ Authors: Penelope Maher, Michael Kelleher
 """
 import os
 import sys
-import pkg_resources
-import multiprocessing
+import importlib.resources
+import importlib.util
 import logging
 import argparse as arg
+import collections
+import contextlib
 import datetime as dt
+import hashlib
 import warnings
-import numpy as np
 import yaml
-import STJ_PV.stj_metric as stj_metric
-import STJ_PV.input_data as inp
 
-from dask.distributed import Client, LocalCluster
 
-CFG_DIR = pkg_resources.resource_filename('STJ_PV', 'conf')
+def _lazy_import(name):
+    """
+    Import a module the first time one of its attributes is used, rather than now.
+
+    Parameters
+    ----------
+    name : string
+        Full name of the module
+
+    Returns
+    -------
+    module : module
+        The module, or if it's already imported, that module
+
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# These import numpy, dask, xarray and pandas, which take most of a second, so
+# they're imported once a run starts, after the arguments are parsed and the config
+# checked. dask.distributed is imported when a scheduler is started
+np = _lazy_import('numpy')
+dask = _lazy_import('dask')
+stj_metric = _lazy_import('STJ_PV.stj_metric')
+inp = _lazy_import('STJ_PV.input_data')
+timing = _lazy_import('STJ_PV.timing')
+memory = _lazy_import('STJ_PV.memory')
+
+CFG_DIR = str(importlib.resources.files('STJ_PV').joinpath('conf'))
+
+# Run config options that don't change the output, so aren't part of the config hash
+# used to check if a run can be resumed from a checkpoint
+CKPT_IGNORE = ('log_file', 'output_file', 'resume', 'years_in_flight', 'execution',
+               'persist', 'timing', 'timing_format', 'profile')
 
 
 class JetFindRun:
@@ -113,9 +171,15 @@ class JetFindRun:
         self.th_levels = None
         self.p_levels = None
         self.metric = None
+        # Records time taken by each stage of the run, if `timing` is set
+        self.timer = timing.StageTimer(self.config.get('timing', False))
 
         self._set_metric()
         self.log_setup()
+        # Adapts chunk size and years in flight to memory use, if there's a ceiling
+        self.governor = memory.MemoryGovernor(self.config.get('execution', {}),
+                                              self.config.get('years_in_flight', 1),
+                                              self.log)
 
     def __str__(self):
         out_str = '{0} {1} {0}\n'.format('#' * 10, 'Run Config ')
@@ -127,20 +191,25 @@ class JetFindRun:
             out_str += '{:15s}: {}\n'.format(param, self.data_cfg[param])
         return out_str
 
-    def _set_metric(self):
+    def _set_metric(self, method=None):
         """Set metric and associated levels."""
-        if self.config['method'] == 'STJPV':
+        if method is None:
+            method = self.config['method']
+
+        if method == 'STJPV':
             # self.th_levels = np.array([265.0, 275.0, 285.0, 300.0, 315.0, 320.0, 330.0,
             #                            350.0, 370.0, 395.0, 430.0])
-            self.th_levels = np.arange(300.0, 430.0, 10).astype(np.float32)
+            self.th_levels = np.arange(300.0, 430.0, 10).astype(
+                self.config.get('dtype', 'float32')
+            )
             self.metric = stj_metric.STJPV
-        elif self.config['method'] == 'STJUMax':
+        elif method == 'STJUMax':
             self.p_levels = np.array([1000., 925., 850., 700., 600., 500., 400., 300.,
                                       250., 200., 150., 100., 70., 50., 30., 20., 10.])
             self.metric = stj_metric.STJMaxWind
-        elif self.config['method'] == 'KangPolvani':
+        elif method == 'KangPolvani':
             self.metric = stj_metric.STJKangPolvani
-        elif self.config['method'] == 'DavisBirner':
+        elif method == 'DavisBirner':
             self.metric = stj_metric.STJDavisBirner
         else:
             self.metric = None
@@ -186,6 +255,11 @@ class JetFindRun:
             self.config['output_file'] += ('_lon{lon_s:0d}-{lon_e:0d}'
                                            .format(**self.data_cfg))
 
+        if self.config.get('sectors', None) is not None:
+            # Sector output is all in one file, with a `sector` dimension
+            self.config['output_file'] += '_sec{}'.format(
+                len(stj_metric.sector_bounds(self.config['sectors'])))
+
         if date_s is not None and isinstance(date_s, dt.datetime):
             self.config['output_file'] += '_{}'.format(date_s.strftime('%Y-%m-%d'))
 
@@ -207,16 +281,20 @@ class JetFindRun:
 
     def _get_data(self, date_s=None, date_e=None):
         """Retrieve data stored according to `self.data_cfg`."""
-        if self.config['method'] == 'STJPV':
-            data = inp.InputDataSTJPV(self, date_s, date_e)
-        elif self.config['method'] in ['STJUMax', 'DavisBirner']:
-            data = inp.InputDataUWind(self, date_s, date_e)
-        else:
-            data = inp.InputDataUWind(self, date_s, date_e, vwnd=True)
+        loader, kwargs = inp.get_loader(self.config['method'])
+        data = loader(self, date_s, date_e, footprint=self._footprint(), **kwargs)
 
         return data.get_data()
 
-    def run(self, date_s=None, date_e=None, save=True):
+    def _footprint(self):
+        """Get the part of the input grid needed by the current metric."""
+        if self.metric is None or not self.config.get('subset_input', True):
+            footprint = None
+        else:
+            footprint = self.metric.footprint(self.config, self.data_cfg)
+        return footprint
+
+    def run(self, date_s=None, date_e=None, save=True, resume=None):
         """
         Find the jet, save location to a file.
 
@@ -225,6 +303,19 @@ class JetFindRun:
         date_s, date_e : :class:`datetime.datetime`
             Beginning and end dates, optional. If not included,
             use (Jan 1, self.year_s) and/or (Dec 31, self.year_e)
+        save : bool, optional
+            Save jet position to `output_file` (default), if False return the metric
+        resume : bool, optional
+            If True, skip periods recorded as complete in the checkpoint file of a
+            previous run with the same configuration, if False start from the
+            beginning. Default is `resume` from the config, or False
+
+        Returns
+        -------
+        jet : :py:class:`~STJ_PV.stj_metric.STJMetric` or dict
+            If `save` is False, the metric, or if `methods` is set in the config, a
+            mapping of method name to its metric (see :py:meth:`run_multi`), otherwise
+            None
 
         """
         if date_s is None:
@@ -232,12 +323,136 @@ class JetFindRun:
         if date_e is None:
             date_e = dt.datetime(self.config['year_e'], 12, 31)
 
+        if self.config.get('methods', None):
+            return self.run_multi(date_s, date_e, save=save, resume=resume)
+
         self._set_output(date_s, date_e)
+        periods = self._periods(date_s, date_e)
+        self.timer.reset()
+        self.governor.reset()
 
-        if self.data_cfg['single_year_file'] and date_s.year != date_e.year:
-            for year in range(date_s.year, date_e.year + 1):
-                _date_s = dt.datetime(year, 1, 1, 0, 0)
-                _date_e = dt.datetime(year, 12, 31, 23, 59)
+        if save:
+            if resume is None:
+                resume = self.config.get('resume', False)
+            ckpt = RunCheckpoint(self.config['output_file'], self.config_hash())
+            if resume:
+                ckpt.load()
+            else:
+                ckpt.reset()
+            writer = stj_metric.JetWriter(n_times=ckpt.n_times)
+
+            todo = []
+            for _date_s, _date_e in periods:
+                if ckpt.is_done(_date_s, _date_e):
+                    self.log.info('SKIP COMPLETED %s - %s', _date_s.strftime('%Y-%m-%d'),
+                                  _date_e.strftime('%Y-%m-%d'))
+                else:
+                    todo.append((_date_s, _date_e))
+        else:
+            todo = periods
+
+        jets = []
+        for (_date_s, _date_e), jet in self._find_jets(todo):
+            if save:
+                # Each period is added to the end of the output file as it's found,
+                # then recorded as complete
+                t_0, t_1 = self._write_jet(writer, jet)
+                ckpt.add(_date_s, _date_e, t_0, t_1)
+            else:
+                jets.append(jet)
+
+        if save:
+            _out = None
+            writer.close()
+        else:
+            _out = jets[0]
+            _out.append(*jets[1:])
+
+        self._timing_report()
+        return _out
+
+    def _write_jet(self, writer, jet):
+        """Append a jet metric's output to its file, timing the write."""
+        jet.log_telemetry()
+        file_name = '{}.nc'.format(writer.file_name or self.config['output_file'])
+        with self.timer.stage('write', jet.data.year, self.config['method']) as stage:
+            size_0 = timing.file_size(file_name)
+            t_0, t_1 = writer.append(jet)
+            stage['bytes_written'] = timing.file_size(file_name) - size_0
+            stage['elements'] = sum(jet.out_data[var].size for var in jet.out_data)
+        return t_0, t_1
+
+    def _timing_report(self, method=None):
+        """
+        Write the time taken by each stage to the log, and `{output_file}.timing.yml`.
+
+        Parameters
+        ----------
+        method : string, optional
+            Only include stages for this metric, and those shared by all metrics,
+            default is to include all
+
+        """
+        if not self.timer.enabled:
+            return
+        report_file = '{}.timing.{}'.format(self.config['output_file'],
+                                            self.config.get('timing_format', 'yml'))
+        self.log.info('WRITE TIMING REPORT TO %s', report_file)
+        self.timer.log_summary(self.log, method)
+        self.timer.write(report_file, method,
+                         output_file='{}.nc'.format(self.config['output_file']))
+
+    def _find_jets(self, periods, methods=None, footprints=None):
+        """
+        Find the jet for each period, with several periods computed at once.
+
+        Up to `years_in_flight` (from config, default 1) periods are submitted to the
+        dask distributed scheduler at a time, so independent years run concurrently.
+        If there's a memory ceiling, this is reduced when memory use is high (see
+        :py:class:`~STJ_PV.memory.MemoryGovernor`).
+
+        Parameters
+        ----------
+        periods : list
+            List of (start, end) :class:`datetime.datetime` pairs
+        methods : list, optional
+            Methods to find the jet with for each period (a list of names for each of
+            `periods`), loading input data once per period (see
+            :py:meth:`run_multi`). Default None, use the configured `method`
+        footprints : dict, optional
+            Footprint of each of `methods`, from :py:meth:`_footprint`
+
+        Yields
+        ------
+        period : tuple
+            (start, end) dates of the period
+        jet : :py:class:`~STJ_PV.stj_metric.STJMetric`
+            Jet metric, with computed output for `period`, in the same order as
+            `periods`. If `methods` are given, a dict of these by method name
+
+        """
+        client = None
+        if self.governor.in_flight > 1:
+            from dask.distributed import get_client
+            try:
+                client = get_client()
+            except ValueError:
+                self.log.info('NO DASK CLIENT, COMPUTING ONE PERIOD AT A TIME')
+                self.governor.max_in_flight = self.governor.in_flight = 1
+
+        pending = collections.deque()
+        for idx, (_date_s, _date_e) in enumerate(periods):
+            # Check memory before loading the next period, this may reduce the number
+            # of periods in flight (so finish some first) and the size of its chunks
+            self.governor.update('BEFORE {}'.format(_date_s.strftime('%Y-%m-%d')))
+            while len(pending) >= self.governor.in_flight:
+                yield self._gather(pending)
+
+            self.timer.start_period(_date_s.year)
+            if methods is not None:
+                jet = self._find_multi(_date_s, _date_e, methods[idx], footprints,
+                                       client)
+            else:
                 self.log.info('FIND JET FOR %s - %s', _date_s.strftime('%Y-%m-%d'),
                               _date_e.strftime('%Y-%m-%d'))
                 data = self._get_data(_date_s, _date_e)
@@ -245,25 +460,165 @@ class JetFindRun:
 
                 for shemis in [True, False]:
                     jet.find_jet(shemis)
-                jet.compute()
-
-                if year == date_s.year:
-                    jet_all = jet
-                else:
-                    jet_all.append(jet)
-                jet_all.save_jet()
+                jet.compute(client=client)
+            pending.append(((_date_s, _date_e), jet))
+
+            while len(pending) >= self.governor.in_flight:
+                yield self._gather(pending)
+
+        while pending:
+            yield self._gather(pending)
+
+    def _gather(self, pending):
+        """Wait for the oldest period in flight, so output stays in order."""
+        period, jet = pending.popleft()
+        for _jet in jet.values() if isinstance(jet, dict) else [jet]:
+            _jet.gather()
+        self.timer.stop_period(period[0].year)
+        self.governor.update('AFTER {}'.format(period[0].strftime('%Y-%m-%d')))
+        return period, jet
+
+    def _periods(self, date_s, date_e):
+        """Split dates into periods (years if data is in yearly files) to find jet."""
+        if self.data_cfg['single_year_file'] and date_s.year != date_e.year:
+            periods = [(dt.datetime(year, 1, 1, 0, 0), dt.datetime(year, 12, 31, 23, 59))
+                       for year in range(date_s.year, date_e.year + 1)]
         else:
-            data = self._get_data(date_s, date_e)
-            jet_all = self.metric(self, data)
+            periods = [(date_s, date_e)]
+        return periods
+
+    def config_hash(self):
+        """Get a hash of the run and data configuration, used to check checkpoints."""
+        config = {key: self.config[key] for key in self.config if key not in CKPT_IGNORE}
+        cfg_str = yaml.safe_dump({'config': config, 'data_cfg': self.data_cfg})
+        return hashlib.sha1(cfg_str.encode()).hexdigest()
+
+    def _use_method(self, method, date_s, date_e):
+        """Set the run's method, and its output file for the dates of the run."""
+        self.config['method'] = method
+        self._set_metric(method)
+        self._set_output(date_s, date_e)
+
+    def _find_multi(self, date_s, date_e, methods, footprints, client=None):
+        """Find the jet with several methods for one period, loading input data once."""
+        self.log.info('FIND JET WITH %s FOR %s - %s', ', '.join(methods),
+                      date_s.strftime('%Y-%m-%d'), date_e.strftime('%Y-%m-%d'))
+        data = inp.InputDataMulti(self, methods, date_s, date_e,
+                                  footprints=footprints).get_data()
+        jets = {}
+        for method in methods:
+            self.config['method'] = method
+            self._set_metric(method)
+            jets[method] = self.metric(self, data[method])
             for shemis in [True, False]:
-                jet_all.find_jet(shemis)
+                jets[method].find_jet(shemis)
+
+        # Methods share input data, so are computed together
+        if client is not None:
+            stj_metric.submit(list(jets.values()), client)
+        else:
+            stj_metric.compute_all(list(jets.values()))
+        return jets
+
+    def run_multi(self, date_s, date_e, save=True, resume=None):
+        """
+        Find the jet with each of the `methods` in the config, loading input data once.
+
+        Variables required by any of the methods are read and chunked once per
+        period, then each metric is run on the shared data and writes its own output.
+        As with :py:meth:`run`, each method's output has its own checkpoint, so a run
+        can be resumed, and up to `years_in_flight` periods are computed at once.
+
+        Parameters
+        ----------
+        date_s, date_e : :class:`datetime.datetime`
+            Beginning and end dates
+        save : bool, optional
+            Save each metric's output to its own file (default), if False return them
+        resume : bool, optional
+            If True, skip periods recorded as complete in the checkpoints of a
+            previous run with the same configuration, for each method. Default is
+            `resume` from the config, or False
+
+        Returns
+        -------
+        jets : dict
+            If `save` is False, mapping of method name to its
+            :py:class:`~STJ_PV.stj_metric.STJMetric`, otherwise None
+
+        """
+        # Drop repeated methods, but keep the order they're listed in
+        methods = list(dict.fromkeys(self.config['methods']))
+        method_orig = self.config['method']
+
+        footprints = {}
+        for method in methods:
+            # Make sure the levels needed by every method are set up before loading
+            self._set_metric(method)
+            footprints[method] = self._footprint()
+
+        periods = self._periods(date_s, date_e)
+        self.timer.reset()
+        self.governor.reset()
+
+        ckpts = {}
+        writers = {}
+        if save:
+            if resume is None:
+                resume = self.config.get('resume', False)
+            for method in methods:
+                self._use_method(method, date_s, date_e)
+                ckpts[method] = RunCheckpoint(self.config['output_file'],
+                                              self.config_hash())
+                if resume:
+                    ckpts[method].load()
+                else:
+                    ckpts[method].reset()
+                writers[method] = stj_metric.JetWriter(n_times=ckpts[method].n_times)
+
+        # Only methods that haven't completed a period find the jet for it
+        todo = []
+        todo_methods = []
+        for _date_s, _date_e in periods:
+            _methods = [method for method in methods
+                        if not save or not ckpts[method].is_done(_date_s, _date_e)]
+            if _methods:
+                todo.append((_date_s, _date_e))
+                todo_methods.append(_methods)
+            else:
+                self.log.info('SKIP COMPLETED %s - %s', _date_s.strftime('%Y-%m-%d'),
+                              _date_e.strftime('%Y-%m-%d'))
+
+        jets = {method: [] for method in methods}
+        for (_date_s, _date_e), period_jets in self._find_jets(todo, todo_methods,
+                                                               footprints):
+            for method, jet in period_jets.items():
+                if save:
+                    self._use_method(method, date_s, date_e)
+                    t_0, t_1 = self._write_jet(writers[method], jet)
+                    ckpts[method].add(_date_s, _date_e, t_0, t_1)
+                else:
+                    jets[method].append(jet)
 
         if save:
+            for method in methods:
+                writers[method].close()
             _out = None
-            jet_all.save_jet()
         else:
-            _out = jet_all
+            _out = {}
+            for method in methods:
+                _out[method] = jets[method][0]
+                _out[method].append(*jets[method][1:])
+
+        # Each method's report includes the input data loaded for all of them
+        for method in methods:
+            self.config['method'] = method
+            self._set_output(date_s, date_e)
+            self._timing_report(method)
 
+        # Reset to original method
+        self.config['method'] = method_orig
+        self._set_metric()
         return _out
 
     def run_sensitivity(self, sens_param, sens_range, date_s=None, date_e=None):
@@ -309,6 +664,69 @@ class JetFindRun:
             self.config[sens_param] = param_orig
 
 
+class RunCheckpoint:
+    """
+    Record of which periods of a run are complete, stored in a YAML file beside output.
+
+    Parameters
+    ----------
+    output_file : string
+        Output file name (without .nc) of the run, checkpoint is `output_file`.ckpt.yml
+    config_hash : string
+        Hash of the run's configuration, from :py:meth:`JetFindRun.config_hash`
+
+    """
+
+    def __init__(self, output_file, config_hash):
+        """Initialise an empty checkpoint."""
+        self.file_name = '{}.ckpt.yml'.format(output_file)
+        self.info = {'config_hash': config_hash, 'output_file': '{}.nc'.format(output_file),
+                     'n_times': 0, 'periods': {}}
+
+    @property
+    def n_times(self):
+        """Number of times written to output by completed periods."""
+        return self.info['n_times']
+
+    @staticmethod
+    def _key(date_s, date_e):
+        return '{}_{}'.format(date_s.strftime('%Y-%m-%d'), date_e.strftime('%Y-%m-%d'))
+
+    def load(self):
+        """Load a previous checkpoint, exit if it's from a different configuration."""
+        if not os.path.exists(self.file_name) or not os.path.exists(
+                self.info['output_file']):
+            return
+
+        with open(self.file_name) as ckpt_file:
+            info = yaml.safe_load(ckpt_file.read())
+
+        if info['config_hash'] != self.info['config_hash']:
+            print('CHECKPOINT {} IS FROM A DIFFERENT CONFIG, RUN WITH --force TO '
+                  'START AGAIN...EXITING'.format(self.file_name))
+            sys.exit(1)
+        self.info = info
+
+    def reset(self):
+        """Remove a previous checkpoint, to start from the beginning."""
+        if os.path.exists(self.file_name):
+            os.remove(self.file_name)
+
+    def is_done(self, date_s, date_e):
+        """Check if a period is complete."""
+        return self._key(date_s, date_e) in self.info['periods']
+
+    def add(self, date_s, date_e, t_0, t_1):
+        """Record a period as complete, with where its output is along time axis."""
+        self.info['periods'][self._key(date_s, date_e)] = [t_0, t_1]
+        self.info['n_times'] = max(self.info['n_times'], t_1)
+
+        # Write to a temporary file then move it, so the checkpoint is always complete
+        with open('{}.tmp'.format(self.file_name), 'w') as ckpt_file:
+            ckpt_file.write(yaml.safe_dump(self.info))
+        os.replace('{}.tmp'.format(self.file_name), self.file_name)
+
+
 def check_config_req(cfg_file, required_keys_all, id_file=True):
     """
     Check that required keys exist within a configuration file.
@@ -382,27 +800,83 @@ def check_run_config(cfg_file):
     # Optional checks
     missing_optionals = []
     if not missing_req:
-        if config['method'] not in ['STJPV', 'STJUMax', 'KangPolvani']:
-            # config must have pfac if it's pressure level data
-            missing_optionals.append(False)
-            print('NO METHOD FOR HANDLING: {}'.format(config['method']))
-
-        elif config['method'] == 'STJPV':
-            opt_keys = {'poly': str, 'fit_deg': int, 'pv_value': float,
-                        'min_lat': float, 'max_lat': float}
-            _, missing_opt = check_config_req(cfg_file, opt_keys, id_file=False)
-            missing_optionals.append(missing_opt)
-
-        elif config['method'] == 'STJUMax':
-            opt_keys = {'pres_level': float, 'min_lat': float}
-            _, missing_opt = check_config_req(cfg_file, opt_keys, id_file=False)
-            missing_optionals.append(missing_opt)
-        elif config['method'] == 'KangPolvani':
-            opt_keys = {'pres_level': float}
-            _, missing_opt = check_config_req(cfg_file, opt_keys, id_file=False)
-            missing_optionals.append(missing_opt)
+        # Several methods can be run on the same data using the `methods` list
+        methods = config.get('methods', [config['method']])
+        if not isinstance(methods, list):
+            print('methods SHOULD BE A LIST, NOT {}'.format(type(methods)))
+            missing_optionals.append(True)
+            methods = []
+
+        for method in methods:
+            if method not in ['STJPV', 'STJUMax', 'KangPolvani']:
+                # config must have pfac if it's pressure level data
+                missing_optionals.append(False)
+                print('NO METHOD FOR HANDLING: {}'.format(method))
+
+            elif method == 'STJPV':
+                opt_keys = {'poly': str, 'fit_deg': int, 'pv_value': float,
+                            'min_lat': float, 'max_lat': float}
+                if 'trop_bound' in config:
+                    opt_keys['trop_bound'] = bool
+                _, missing_opt = check_config_req(cfg_file, opt_keys, id_file=False)
+                missing_optionals.append(missing_opt)
+
+            elif method == 'STJUMax':
+                opt_keys = {'pres_level': float, 'min_lat': float}
+                _, missing_opt = check_config_req(cfg_file, opt_keys, id_file=False)
+                missing_optionals.append(missing_opt)
+            elif method == 'KangPolvani':
+                opt_keys = {'pres_level': float}
+                _, missing_opt = check_config_req(cfg_file, opt_keys, id_file=False)
+                missing_optionals.append(missing_opt)
+
+        exec_cfg = config.get('execution', {})
+        if not isinstance(exec_cfg, dict):
+            print('execution SHOULD BE A DICT, NOT {}'.format(type(exec_cfg)))
+            missing_optionals.append(True)
+        elif exec_cfg.get('scheduler', 'local') is None:
+            print('execution: scheduler SHOULD BE synchronous, threads, processes, '
+                  'local, OR A SCHEDULER ADDRESS')
+            missing_optionals.append(True)
+        elif not isinstance(exec_cfg.get('memory_ceiling', None),
+                            (str, int, float, type(None))):
+            print('execution: memory_ceiling SHOULD BE A SIZE (e.g. \'48GB\') OR '
+                  'FRACTION OF TOTAL MEMORY')
+            missing_optionals.append(True)
 
-    return config, any([missing_req, all(missing_optionals)])
+        if config.get('dtype', 'float32') not in ['float32', 'float64']:
+            print('dtype SHOULD BE float32 OR float64, NOT {}'.format(config['dtype']))
+            missing_optionals.append(True)
+
+        if not isinstance(config.get('years_in_flight', 1), int):
+            print('years_in_flight SHOULD BE AN INT, NOT {}'
+                  .format(type(config['years_in_flight'])))
+            missing_optionals.append(True)
+
+        if config.get('sectors', None) is not None:
+            # Sectors are either a number of equal sectors or a dict of {name: [s, e]}
+            sectors = config['sectors']
+            if isinstance(sectors, dict):
+                bad_sectors = [name for name in sectors
+                               if not isinstance(sectors[name], list)
+                               or len(sectors[name]) != 2]
+            elif isinstance(sectors, int) and sectors > 0:
+                bad_sectors = []
+            else:
+                bad_sectors = [sectors]
+
+            if bad_sectors:
+                print('sectors SHOULD BE A POSITIVE INT OR DICT OF [lon_s, lon_e], '
+                      'CHECK: {}'.format(bad_sectors))
+                missing_optionals.append(True)
+
+            # Kang and Polvani jet is found from the zonal mean wind, not at each
+            # longitude, so it can't be reduced to sectors
+            if 'KangPolvani' in methods:
+                print('sectors CAN NOT BE USED WITH KangPolvani METHOD')
+                missing_optionals.append(True)
+
+    return config, any([missing_req, any(missing_optionals)])
 
 
 def check_data_config(cfg_file):
@@ -455,11 +929,101 @@ def make_parse():
                         help='Configuration file path')
     parser.add_argument('--ys', type=str, default="1979", help="Start Year")
     parser.add_argument('--ye', type=str, default="2018", help="End Year")
+
+    parser.add_argument('--scheduler', type=str, default=None,
+                        help=('Dask scheduler: synchronous, threads, processes, local, '
+                              'or address of an existing scheduler'))
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of dask workers')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Threads per dask worker (local cluster only)')
+    parser.add_argument('--memory-limit', type=str, default=None,
+                        help="Memory limit per worker, e.g. '4GB' (local cluster only)")
+    parser.add_argument('--local-dir', type=str, default=None,
+                        help='Directory for worker files and spilling to disk')
+    parser.add_argument('--dashboard', action='store_true', default=None,
+                        help='Start the dask dashboard (local cluster only)')
+
+    restart = parser.add_mutually_exclusive_group()
+    restart.add_argument('--resume', dest='resume', action='store_true', default=None,
+                         help='Skip years completed by a previous run of this config')
+    restart.add_argument('--force', dest='resume', action='store_false',
+                         help='Start from the beginning, ignoring previous runs')
+    parser.add_argument('--profile', action='store_true', default=None,
+                        help=('Write a dask performance report, task stream, worker '
+                              'profiles, and tasks per stage beside the output file'))
     args = parser.parse_args()
     return args
 
 
-def main(sample_run=True, sens_run=False, cfg_file=None, year_s=1979, year_e=2018):
+def start_scheduler(exec_cfg, log):
+    """
+    Set up the dask scheduler used to find the jet.
+
+    Parameters
+    ----------
+    exec_cfg : dict
+        Execution options, from the `execution` section of the run config (see
+        `conf/stj_config_default.yml`), and command line
+    log : :py:class:`logging.Logger`
+        Logger for the run
+
+    Returns
+    -------
+    client : :class:`dask.distributed.Client`
+        Client connected to a local cluster or existing scheduler, or None if using
+        one of the single machine schedulers (synchronous, threads, or processes)
+
+    """
+    import dask.system
+    from dask.distributed import Client, LocalCluster
+
+    scheduler = exec_cfg.get('scheduler', 'local')
+    # CPU count from dask is limited by cgroup quotas and CPU affinity, so it's the
+    # number actually available on a shared node or in a container
+    cpus = dask.system.CPU_COUNT
+
+    if scheduler in ['synchronous', 'threads', 'processes']:
+        dask.config.set(scheduler=scheduler)
+        if scheduler != 'synchronous':
+            dask.config.set(num_workers=exec_cfg.get('n_workers', None) or cpus)
+        log.info('USING %s DASK SCHEDULER', scheduler.upper())
+        return None
+
+    if scheduler == 'local':
+        threads = exec_cfg.get('threads_per_worker', None)
+        if threads is None:
+            if cpus % 4 == 0:
+                threads = 4
+            elif cpus % 3 == 0:
+                threads = 3
+            else:
+                threads = min(cpus, 2)
+        n_workers = exec_cfg.get('n_workers', None) or max(cpus // threads, 1)
+
+        if exec_cfg.get('dashboard', False):
+            dashboard = exec_cfg.get('dashboard_address', ':8787')
+        else:
+            dashboard = None
+
+        cluster = LocalCluster(
+            n_workers=n_workers,
+            threads_per_worker=threads,
+            memory_limit=exec_cfg.get('memory_limit', 'auto'),
+            local_directory=exec_cfg.get('local_directory', None),
+            dashboard_address=dashboard,
+        )
+        client = Client(cluster)
+    else:
+        # Anything else is the address of an existing scheduler
+        client = Client(scheduler)
+
+    log.info(client)
+    return client
+
+
+def main(sample_run=True, sens_run=False, cfg_file=None, year_s=1979, year_e=2018,
+         resume=None, execution=None, profile=None):
     """Run the STJ Metric given a configuration file."""
     # Generate an STJProperties, allows easy access to these properties across methods.
 
@@ -509,32 +1073,38 @@ def main(sample_run=True, sens_run=False, cfg_file=None, year_s=1979, year_e=201
         date_s = dt.datetime(year_s, 1, 1)
         date_e = dt.datetime(year_e, 12, 31)
 
-    cpus = multiprocessing.cpu_count()
-    if cpus % 4 == 0:
-        _threads = 4
-    elif cpus % 3 == 0:
-        _threads = 3
+    exec_cfg = dict(jf_run.config.get('execution', {}))
+    # Command line options take precedence over the config file
+    exec_cfg.update({key: val for key, val in (execution or {}).items()
+                     if val is not None})
+    client = start_scheduler(exec_cfg, jf_run.log)
+
+    if profile is None:
+        profile = jf_run.config.get('profile', False)
+    if profile:
+        # Profile is named for the output file, as it will be set by the run
+        jf_run._set_output(date_s, date_e)
+        run_context = timing.profile_run(jf_run.timer, jf_run.config['output_file'],
+                                         jf_run.log, client)
     else:
-        _threads = 2
-
-    cluster = LocalCluster(n_workers=cpus // _threads, threads_per_worker=_threads)
-
-    client = Client(cluster)
-    jf_run.log.info(client)
-
-    if sens_run:
-        sens_param_vals = {'pv_value': np.arange(1.0, 4.5, 0.5),
-                           'fit_deg': np.arange(3, 9),
-                           'min_lat': np.arange(2.5, 15, 2.5),
-                           'max_lat': np.arange(60., 95., 5.)}
+        run_context = contextlib.nullcontext()
+
+    with run_context:
+        if sens_run:
+            sens_param_vals = {'pv_value': np.arange(1.0, 4.5, 0.5),
+                               'fit_deg': np.arange(3, 9),
+                               'min_lat': np.arange(2.5, 15, 2.5),
+                               'max_lat': np.arange(60., 95., 5.)}
+
+            for sens_param in sens_param_vals:
+                jf_run.run_sensitivity(sens_param=sens_param,
+                                       sens_range=sens_param_vals[sens_param],
+                                       date_s=date_s, date_e=date_e)
+        else:
+            jf_run.run(date_s, date_e, resume=resume)
 
-        for sens_param in sens_param_vals:
-            jf_run.run_sensitivity(sens_param=sens_param,
-                                   sens_range=sens_param_vals[sens_param],
-                                   date_s=date_s, date_e=date_e)
-    else:
-        jf_run.run(date_s, date_e)
-    client.close()
+    if client is not None:
+        client.close()
     jf_run.log.info('JET FINDING COMPLETE')
 
 
@@ -560,5 +1130,15 @@ if __name__ == "__main__":
         sens_run=ARGS.sens,
         cfg_file=ARGS.file,
         year_s=int(ARGS.ys),
-        year_e=int(ARGS.ye)
+        year_e=int(ARGS.ye),
+        resume=ARGS.resume,
+        execution={
+            'scheduler': ARGS.scheduler,
+            'n_workers': ARGS.workers,
+            'threads_per_worker': ARGS.threads,
+            'memory_limit': ARGS.memory_limit,
+            'local_directory': ARGS.local_dir,
+            'dashboard': ARGS.dashboard,
+        },
+        profile=ARGS.profile,
     )
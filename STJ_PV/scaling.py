@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+"""
+Measure how finding the jet scales with resolution, record length and dask workers.
+
+Each point of a sweep (grid spacing, number of times, and number of workers in a
+local dask cluster, see `conf/scaling_default.yml`) finds the jet in synthetic input
+(see :py:mod:`STJ_PV.synthetic`) with :py:meth:`~STJ_PV.run_stj.JetFindRun.run`,
+timing each stage (see :py:class:`~STJ_PV.timing.StageTimer`) and sampling memory.
+For each point this records:
+
+* throughput: input columns (times x latitudes x longitudes) per second
+* peak resident memory of each worker, and of the whole run
+* parallel efficiency of each stage: time with the fewest workers, divided by time
+  with this many, per worker (1 is perfect scaling)
+
+The stage with the lowest parallel efficiency with the most workers, and the stage
+whose time per column grows most from the smallest to the largest input, are
+reported as the worst scaling. The table is written to CSV, the full report to YAML,
+and plots of throughput, memory and efficiency to PNG.
+
+    `python scaling.py --help`
+
+Usage
+-----
+
+    usage: scaling.py [-h] [--file FILE] [--res RES] [--times TIMES]
+                      [--workers WORKERS] [--threads THREADS]
+                      [--work-dir WORK_DIR] [--output OUTPUT] [--no-plot]
+            Measure how jet finding scales with resolution, times, and workers
+
+    optional arguments:
+      -h, --help           show this help message and exit
+      --file FILE          Scaling configuration (sweep and case)
+      --res RES            Comma separated grid spacings (degrees)
+      --times TIMES        Comma separated numbers of times
+      --workers WORKERS    Comma separated numbers of local cluster workers
+      --threads THREADS    Threads per worker
+      --work-dir WORK_DIR  Directory for synthetic data, IPV and logs
+      --output OUTPUT      Base name of the report (.yml), table (.csv) and plots
+                           (.png)
+      --no-plot            Don't plot the results
+
+For example, a quick sweep at coarse resolution:
+
+    python scaling.py --res 2.5,1.0 --times 8 --workers 1,2
+
+"""
+import os
+import time
+import shutil
+import tempfile
+import datetime as dt
+import argparse as arg
+import warnings
+import numpy as np
+import pandas as pd
+import dask.utils
+import yaml
+from STJ_PV import equivalence, input_data, memory, run_stj, stj_metric, synthetic
+from STJ_PV import timing
+
+__author__ = "Penelope Maher, Michael Kelleher"
+
+# Stages taking less than this fraction of a run's time aren't reported as the worst
+# scaling, since their time is mostly fixed overhead
+MIN_SHARE = 0.05
+
+
+def _list(values, kind=float):
+    """Get a list from a comma separated string (command line), or a list."""
+    if isinstance(values, str):
+        values = values.split(',')
+    return [kind(val) for val in values]
+
+
+def _datetime(date):
+    """Get a :class:`datetime.datetime` from a pandas or cftime date."""
+    return dt.datetime(*date.timetuple()[:6])
+
+
+def run_point(name, case, n_workers, work_dir, threads=1, execution=None):
+    """
+    Find the jet for a case, with a new local dask cluster, timing each stage.
+
+    Input files are closed first, so each point's `open` stage includes opening them.
+
+    Parameters
+    ----------
+    name : string
+        Name of the case, synthetic input is written to `work_dir/name/data`
+    case : dict
+        Case configuration (see :py:func:`STJ_PV.equivalence.run_case`)
+    n_workers : int
+        Number of workers in the local cluster
+    work_dir : string
+        Directory for synthetic input, IPV files, logs and timing reports
+    threads : int, optional
+        Threads per worker, default 1
+    execution : dict, optional
+        Other execution options for :py:func:`STJ_PV.run_stj.start_scheduler`
+
+    Returns
+    -------
+    point : dict
+        `wall` time (seconds), `peak_worker_memory` (largest of any worker) and
+        `peak_memory` (this process and its children) in bytes, and `stages`, the
+        wall time of each stage
+
+    """
+    run_dir = os.path.join(work_dir, name, 't{}_w{}'.format(case['n_times'], n_workers))
+    exec_cfg = dict(execution or {}, scheduler='local', n_workers=n_workers,
+                    threads_per_worker=threads)
+    jf_run, own_ipv = equivalence.make_run(name, case, {'timing': True,
+                                                        'execution': exec_cfg},
+                                           run_dir, work_dir)
+    if own_ipv:
+        equivalence.clear_ipv(run_dir)
+    # Each point opens its input files, rather than using those opened by the last
+    input_data.DATASET_CACHE.clear()
+
+    client = run_stj.start_scheduler(exec_cfg, jf_run.log)
+    pids = client.run(os.getpid)
+    cwd = os.getcwd()
+    try:
+        # Timing report is written beside the output file, so in the run directory
+        os.chdir(run_dir)
+        with memory.PeakMemory(pids.values()) as peak:
+            time_0 = time.perf_counter()
+            jf_run.run(case['date_s'], case['date_e'], save=False)
+            wall = time.perf_counter() - time_0
+    finally:
+        os.chdir(cwd)
+        equivalence.finish_run(jf_run, client)
+
+    return {'wall': wall, 'peak_worker_memory': max(peak.peaks.values()),
+            'peak_memory': peak.peak,
+            'stages': {stage: total['wall']
+                       for stage, total in jf_run.timer.totals()[0].items()}}
+
+
+def sweep(config, work_dir):
+    """
+    Find the jet at each resolution, number of times, and number of workers.
+
+    Parameters
+    ----------
+    config : dict
+        Scaling configuration (see `conf/scaling_default.yml`)
+    work_dir : string
+        Directory for synthetic input, IPV files, logs and timing reports
+
+    Returns
+    -------
+    points : list
+        For each point: `res`, `n_times`, `workers`, `n_columns`, `throughput`
+        (columns per second), and the result of :py:func:`run_point`
+
+    """
+    case = dict(config['case'])
+    syn = dict(case.pop('synthetic', {}))
+    year = case.pop('year', 2000)
+    n_max = max(config['n_times'])
+    # Enough years for the most times, at any frequency
+    times = synthetic.time_axis(year, year + n_max, syn.get('freq', 'D'),
+                                syn.get('calendar', 'standard'))[:n_max]
+
+    points = []
+    for res in config['resolutions']:
+        # Input for each resolution is written once, with the most times
+        name = 'res{:g}'.format(res)
+        n_lat, n_lon = (coord.size for coord in synthetic.grid(res))
+        res_syn = dict(syn, res=res, n_times=n_max, year_s=year,
+                       year_e=times[-1].year)
+        for n_times in config['n_times']:
+            _case = dict(case, synthetic=res_syn, n_times=n_times,
+                         date_s=_datetime(times[0]), date_e=_datetime(times[n_times - 1]))
+            for n_workers in config['workers']:
+                print('RES {:g}, {} TIMES, {} WORKERS'.format(res, n_times, n_workers))
+                point = {'res': res, 'n_times': n_times, 'workers': n_workers,
+                         'n_columns': n_times * n_lat * n_lon}
+                point.update(run_point(name, _case, n_workers, work_dir,
+                                       config.get('threads_per_worker', 1),
+                                       config.get('execution', None)))
+                point['throughput'] = point['n_columns'] / point['wall']
+                points.append(point)
+    return points
+
+
+def scaling(points):
+    """
+    Find parallel efficiency of each point, and the worst scaling stages.
+
+    Parameters
+    ----------
+    points : list
+        Results of :py:func:`sweep`, `efficiency` (of each stage, and `total`) is
+        added to each, relative to the point with the same input and fewest workers
+
+    Returns
+    -------
+    worst : dict
+        `parallel`: stage with the lowest mean efficiency with the most workers, and
+        `size`: stage whose time per column (with the fewest workers) grows most from
+        the smallest to the largest input. Either is None if there's only one worker
+        count or input size. Stages taking less than `MIN_SHARE` of the time are
+        left out
+
+    """
+    base = {}
+    for point in points:
+        key = (point['res'], point['n_times'])
+        if key not in base or point['workers'] < base[key]['workers']:
+            base[key] = point
+
+    for point in points:
+        ref = base[(point['res'], point['n_times'])]
+        walls = dict(point['stages'], total=point['wall'])
+        ref_walls = dict(ref['stages'], total=ref['wall'])
+        point['efficiency'] = {
+            stage: ref_walls[stage] * ref['workers'] / (wall * point['workers'])
+            for stage, wall in walls.items() if stage in ref_walls and wall > 0
+        }
+
+    worst = {'parallel': None, 'size': None}
+    max_workers = max(point['workers'] for point in points)
+    min_workers = min(point['workers'] for point in points)
+    if max_workers > min_workers:
+        effs = {}
+        for point in points:
+            if point['workers'] != max_workers:
+                continue
+            ref = base[(point['res'], point['n_times'])]
+            for stage, eff in point['efficiency'].items():
+                if stage != 'total' and ref['stages'][stage] >= MIN_SHARE * ref['wall']:
+                    effs.setdefault(stage, []).append(eff)
+        if effs:
+            stage = min(effs, key=lambda stage: np.mean(effs[stage]))
+            worst['parallel'] = {'stage': stage, 'workers': max_workers,
+                                 'efficiency': float(np.mean(effs[stage]))}
+
+    refs = sorted(base.values(), key=lambda point: point['n_columns'])
+    small, large = refs[0], refs[-1]
+    if large['n_columns'] > small['n_columns']:
+        ratios = {
+            stage: ((wall / large['n_columns']) /
+                    (small['stages'][stage] / small['n_columns']))
+            for stage, wall in large['stages'].items()
+            if small['stages'].get(stage, 0) > 0 and wall >= MIN_SHARE * large['wall']
+        }
+        if ratios:
+            stage = max(ratios, key=ratios.get)
+            worst['size'] = {'stage': stage, 'ratio': float(ratios[stage]),
+                             'from_columns': small['n_columns'],
+                             'to_columns': large['n_columns']}
+    return worst
+
+
+def table(points):
+    """
+    Get a table of results, one row per point.
+
+    Returns
+    -------
+    table : :class:`pandas.DataFrame`
+        Resolution, number of times, workers, columns, wall time, throughput, peak
+        memory, total parallel efficiency, and for each stage its wall time
+        (`wall_{stage}`) and parallel efficiency (`efficiency_{stage}`)
+
+    """
+    rows = []
+    for point in points:
+        row = {key: point[key] for key in ['res', 'n_times', 'workers', 'n_columns',
+                                           'wall', 'throughput', 'peak_worker_memory',
+                                           'peak_memory']}
+        row['efficiency'] = point['efficiency']['total']
+        for stage, wall in point['stages'].items():
+            row['wall_{}'.format(stage)] = wall
+            row['efficiency_{}'.format(stage)] = point['efficiency'].get(stage, np.nan)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def _stages(results):
+    """Get names of stages in a results table, in the order they happen."""
+    return [stage for stage in timing.STAGES
+            if 'efficiency_{}'.format(stage) in results]
+
+
+def print_report(results, worst):
+    """Print the results table, efficiency of each stage, and worst scaling stages."""
+    fmt = '{:>6s} {:>6s} {:>8s} {:>12s} {:>9s} {:>12s} {:>13s} {:>10s} {:>10s}'
+    print(fmt.format('RES', 'TIMES', 'WORKERS', 'COLUMNS', 'WALL (s)', 'COLUMNS / s',
+                     'PEAK / WORKER', 'PEAK', 'EFFICIENCY'))
+    for row in results.to_dict('records'):
+        print(fmt.format('{:g}'.format(row['res']), str(row['n_times']),
+                         str(row['workers']), str(row['n_columns']),
+                         '{:.2f}'.format(row['wall']),
+                         '{:.4g}'.format(row['throughput']),
+                         dask.utils.format_bytes(row['peak_worker_memory']),
+                         dask.utils.format_bytes(row['peak_memory']),
+                         '{:.2f}'.format(row['efficiency'])))
+
+    stages = _stages(results)
+    print('PARALLEL EFFICIENCY BY STAGE')
+    fmt = '{:>6s} {:>6s} {:>8s}' + ' {:>9s}' * len(stages)
+    print(fmt.format('RES', 'TIMES', 'WORKERS', *[stage.upper() for stage in stages]))
+    for row in results.to_dict('records'):
+        print(fmt.format('{:g}'.format(row['res']), str(row['n_times']),
+                         str(row['workers']),
+                         *['{:.2f}'.format(row['efficiency_{}'.format(stage)])
+                           for stage in stages]))
+
+    if worst['parallel'] is None:
+        print('WORST PARALLEL SCALING: NEED MORE THAN ONE WORKER COUNT')
+    else:
+        print('WORST PARALLEL SCALING: {stage}, EFFICIENCY {efficiency:.2f} WITH '
+              '{workers} WORKERS'.format(**worst['parallel']))
+    if worst['size'] is None:
+        print('WORST SIZE SCALING: NEED MORE THAN ONE INPUT SIZE')
+    else:
+        print('WORST SIZE SCALING: {stage}, TIME PER COLUMN x{ratio:.2f} FROM '
+              '{from_columns} TO {to_columns} COLUMNS'.format(**worst['size']))
+
+
+def plot(results, file_name):
+    """
+    Plot throughput, peak memory per worker, and efficiency of each stage.
+
+    Parameters
+    ----------
+    results : :class:`pandas.DataFrame`
+        Results table, from :py:func:`table`
+    file_name : string
+        Output image file
+
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(1, 3, figsize=(15, 4.5))
+    for (res, n_times), group in results.groupby(['res', 'n_times']):
+        label = '{:g}°, {} times'.format(res, n_times)
+        axes[0].plot(group['workers'], group['throughput'], 'o-', label=label)
+        axes[1].plot(group['workers'], group['peak_worker_memory'] / 2 ** 20, 'o-',
+                     label=label)
+
+    # Efficiency of each stage for the largest input
+    largest = results[results['n_columns'] == results['n_columns'].max()]
+    for stage in _stages(results):
+        axes[2].plot(largest['workers'], largest['efficiency_{}'.format(stage)], 'o-',
+                     label=stage)
+    axes[2].axhline(1.0, color='k', lw=0.8, ls='--')
+
+    for axis, title, ylabel in zip(
+            axes, ['Throughput', 'Peak memory per worker',
+                   'Parallel efficiency, {:g}°, {} times'.format(
+                       largest['res'].iloc[0], largest['n_times'].iloc[0])],
+            ['Columns / s', 'MiB', 'Efficiency']):
+        axis.set_title(title)
+        axis.set_xlabel('Workers')
+        axis.set_ylabel(ylabel)
+        axis.set_xticks(sorted(results['workers'].unique()))
+        axis.legend(fontsize='small')
+
+    fig.tight_layout()
+    fig.savefig(file_name)
+    plt.close(fig)
+
+
+def make_parse():
+    """Make command line argument parser with argparse."""
+    parser = arg.ArgumentParser(
+        description='Measure how jet finding scales with resolution, times, and workers'
+    )
+    parser.add_argument('--file', type=str, default='scaling_default.yml',
+                        help='Scaling configuration (sweep and case)')
+    parser.add_argument('--res', type=str, default=None,
+                        help='Comma separated grid spacings (degrees)')
+    parser.add_argument('--times', type=str, default=None,
+                        help='Comma separated numbers of times')
+    parser.add_argument('--workers', type=str, default=None,
+                        help='Comma separated numbers of local cluster workers')
+    parser.add_argument('--threads', type=int, default=None, help='Threads per worker')
+    parser.add_argument('--work-dir', type=str, default=None,
+                        help='Directory for synthetic data, IPV and logs')
+    parser.add_argument('--output', type=str, default='stj_scaling',
+                        help='Base name of the report (.yml), table (.csv) and plots '
+                             '(.png)')
+    parser.add_argument('--no-plot', action='store_true', default=False,
+                        help="Don't plot the results")
+    return parser.parse_args()
+
+
+def main():
+    """Run the scaling sweep, and write its results."""
+    args = make_parse()
+    cfg_file = args.file
+    if not os.path.exists(cfg_file):
+        cfg_file = os.path.join(run_stj.CFG_DIR, cfg_file)
+    with open(cfg_file) as cfg:
+        config = yaml.safe_load(cfg)
+
+    # Command line options take precedence over the config file
+    for key, opt, kind in [('resolutions', args.res, float), ('n_times', args.times, int),
+                           ('workers', args.workers, int)]:
+        config[key] = _list(config[key] if opt is None else opt, kind)
+    if args.threads is not None:
+        config['threads_per_worker'] = args.threads
+
+    tmp_dir = None
+    work_dir = args.work_dir
+    if work_dir is None:
+        work_dir = tmp_dir = tempfile.mkdtemp(prefix='stj_scaling_')
+    try:
+        points = sweep(config, os.path.abspath(work_dir))
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
+
+    worst = scaling(points)
+    results = table(points)
+    print_report(results, worst)
+
+    report = {'commit-id': stj_metric.git_id(), 'config': config, 'worst': worst,
+              'points': points}
+    with open('{}.yml'.format(args.output), 'w') as out_file:
+        yaml.safe_dump(report, out_file, sort_keys=False)
+    results.to_csv('{}.csv'.format(args.output), index=False)
+    if not args.no_plot:
+        plot(results, '{}.png'.format(args.output))
+    print('WROTE {}.*'.format(args.output))
+
+
+if __name__ == "__main__":
+    # Only the time taken is of interest here, warnings from polynomial fits and
+    # invalid values are expected (see `run_stj.py`), so aren't shown
+    np.seterr(all='ignore')
+    warnings.simplefilter('ignore')
+    main()
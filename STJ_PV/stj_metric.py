@@ -1,27 +1,62 @@
 # -*- coding: utf-8 -*-
 """Calculate the position of the subtropical jet in both hemispheres."""
+import os
+import functools
 import subprocess
 import yaml
 import numpy as np
 import numpy.polynomial as poly
-from scipy import signal as sig
-from scipy.signal import argrelextrema
-
-from netCDF4 import num2date, date2num
-import pandas as pd
+import dask
 import xarray as xr
-from xarray import ufuncs as xu
 from STJ_PV import utils
+from STJ_PV import timing
+
+# pandas, scipy.signal, netCDF4 and eddy_terms are imported where they're used, since
+# they're slow to import, and not needed to check a config or start a run
+
+
+@functools.lru_cache(maxsize=None)
+def git_id():
+    """
+    Get the git commit of this code, which is recorded in output files.
+
+    This is found the first time it's needed, and cached, rather than when the module
+    is imported.
+
+    Returns
+    -------
+    commit : string
+        Commit hash of the git repository this module is in, 'NONE' if it isn't in
+        one, or git isn't available
+
+    """
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+    except (subprocess.CalledProcessError, OSError):
+        return 'NONE'
+    return commit.decode().strip()
+
 
-try:
-    from eddy_terms import Kinetic_Eddy_Energies
-except ModuleNotFoundError:
-    print('Eddy Terms Function not available, STJKangPolvani not available')
+def __getattr__(name):
+    """Get `GIT_ID` (see :py:func:`git_id`) when it's used."""
+    if name == 'GIT_ID':
+        return git_id()
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 
-try:
-    GIT_ID = subprocess.check_output(['git', 'rev-parse', 'HEAD']).decode().strip()
-except subprocess.CalledProcessError:
-    GIT_ID = 'NONE'
+
+# Outcome of finding the jet in one column (time and longitude) with STJPV
+FOUND, MULTIPLE, NO_EXTREMA, FIT_FAIL, ALL_NAN = range(5)
+# Number of columns with each outcome at each time (over longitudes and hemispheres),
+# written with the jet position so periods where the jet is often missing can be found
+TELEMETRY = {
+    'n_multiple': (MULTIPLE, 'Number of columns with several jets, selected by shear'),
+    'n_no_extrema': (NO_EXTREMA, 'Number of columns with no extrema of theta gradient'),
+    'n_fit_fail': (FIT_FAIL, 'Number of columns where the polynomial fit failed'),
+    'n_all_nan': (ALL_NAN, 'Number of columns with no valid theta on the PV level'),
+}
 
 
 class STJMetric:
@@ -45,11 +80,43 @@ class STJMetric:
         self.data = data
         self.props = props.config
         self.log = props.log
+        # Records the time taken by each stage, if timing is enabled for the run
+        self.timer = getattr(props, 'timer', timing.StageTimer(enabled=False))
         self.out_data = {}
         self.time = None
         self.hemis = None
         self.debug_data = {}
         self.plot_idx = 0
+        self.sectors = sector_bounds(self.props.get('sectors', None))
+        # Number of columns (longitudes in each hemisphere) at each time
+        self.n_columns = 0
+        self._futures = {}
+
+    @classmethod
+    def footprint(cls, config, data_cfg):
+        """
+        Get the part of the input data grid this metric needs, before data is read.
+
+        Parameters
+        ----------
+        config : dict
+            Run configuration
+        data_cfg : dict
+            Data configuration
+
+        Returns
+        -------
+        footprint : dict
+            Subset of input data, passed to :py:class:`~STJ_PV.input_data.InputData`,
+            with optional keys `lat_band`: (min, max) absolute latitude, and `lev`:
+            (min, max) level (in Pa for pressure levels). None if all data is needed
+
+        """
+        return None
+
+    def _stage(self, name):
+        """Time a stage of finding the jet (see :py:class:`~STJ_PV.timing.StageTimer`)."""
+        return self.timer.stage(name, self.data.year, self.props['method'])
 
     def _drop_vars(self, out_var):
         """Drop coordinate variables that may not match."""
@@ -57,8 +124,8 @@ class STJMetric:
             if drop_var in self.out_data[out_var].coords:
                 self.out_data[out_var] = self.out_data[out_var].drop(drop_var)
 
-    def save_jet(self):
-        """Save jet position to file."""
+    def out_dataset(self):
+        """Get jet position, with metadata, as a :class:`xarray.Dataset`."""
         # Setup metadata for output variables
         props = {
             'lat': {
@@ -77,18 +144,45 @@ class STJMetric:
                 'units': 'K',
             },
         }
+        for name, (_, descr) in TELEMETRY.items():
+            props[name] = {'descr': descr, 'units': '1', 'columns': self.n_columns}
 
         for out_var in self.out_data:
             # Clean up dimension labels
             self._drop_vars(out_var)
 
-            prop_name = out_var.split('_')[0]
+            prop_name = out_var if out_var in props else out_var.split('_')[0]
             self.out_data[out_var] = self.out_data[out_var].assign_attrs(props[prop_name])
 
         out_dset = xr.Dataset(self.out_data)
+        file_attrs = {'commit-id': git_id(), 'run_props': yaml.safe_dump(self.props)}
+        return out_dset.assign_attrs(file_attrs)
+
+    def log_telemetry(self):
+        """Log the number of columns where the jet was not found simply, once computed."""
+        counts = [name for name in TELEMETRY if name in self.out_data]
+        if not counts:
+            return
+        vtime = self.data.cfg['time']
+        n_times = self.out_data[counts[0]][vtime].shape[0]
+        self.log.info('JET COLUMNS IN %s OF %d: %s', self.data.year,
+                      self.n_columns * n_times,
+                      ', '.join('{} {}'.format(name[2:].upper(),
+                                               int(self.out_data[name].sum()))
+                                for name in counts))
+
+        # Columns where no jet was found, at the worst time
+        missing = sum(self.out_data[name] for name in counts if name != 'n_multiple')
+        worst = int(missing.argmax())
+        if missing[worst] > 0:
+            self.log.info('MOST COLUMNS WITHOUT A JET AT %s: %d OF %d',
+                          str(missing[vtime].values[worst])[:19], int(missing[worst]),
+                          self.n_columns)
+
+    def save_jet(self):
+        """Save jet position to file."""
+        out_dset = self.out_dataset()
         self.log.info("WRITE TO {output_file}".format(**self.props))
-        file_attrs = {'commit-id': GIT_ID, 'run_props': yaml.safe_dump(self.props)}
-        out_dset = out_dset.assign_attrs(file_attrs)
         out_dset.to_netcdf(self.props['output_file'] + '.nc')
 
     def set_hemis(self, shemis):
@@ -119,8 +213,9 @@ class STJMetric:
             Abbreviation for hemisphere (NH or SH)
 
         """
+        from scipy import signal as sig
+
         lats = [self.props.get('min_lat', 0), self.props.get('max_lat', 90)]
-        lat_dec = self.data[self.data.cfg['lat']][0] > self.data[self.data.cfg['lat']][-1]
 
         if shemis:
             _lstart = -90
@@ -139,34 +234,233 @@ class STJMetric:
                 # Lats are negative, multiply by -1 to get positive for NH
                 lats = (-lats[0], -lats[1])
 
-        if lat_dec:
-            _lstart, _lend = _lend, _lstart
-
+        # Input data latitude is always ascending (see InputData._normalize)
         self.hemis = {self.data.cfg['lat']: slice(_lstart, _lend)}
-        return extrema, lats, hem_s
-
-    def compute(self):
-        """Compute all dask arrays in `self.out_data`."""
-        for vname in self.out_data:
-            self._drop_vars(vname)
-            try:
-                self.out_data[vname] = self.out_data[vname].compute()
-            except (AttributeError, TypeError):
-                self.props.log.info(
-                    'Compute fail data at %s not dask array it is %s',
-                    vname,
-                    type(self.out_data[vname]),
-                )
+        return extrema, tuple(sorted(lats)), hem_s
+
+    def reduce_lon(self, data, how=None):
+        """
+        Reduce jet properties along longitude, either zonally or in longitude sectors.
+
+        Parameters
+        ----------
+        data : :class:`xarray.DataArray`
+            Jet property (latitude, intensity, etc.) at each longitude
+        how : string, optional
+            'mean' or 'median', default is `zonal_opt` from config. If neither, `data`
+            is returned at each longitude
+
+        Returns
+        -------
+        data_out : :class:`xarray.DataArray`
+            Zonal (or sector) mean / median of `data`, if `sectors` is set in the config
+            the output has a `sector` dimension in place of longitude
+
+        """
+        vlon = self.data.cfg['lon']
+        if how is None:
+            how = self.props['zonal_opt'].lower()
+
+        if how not in ['mean', 'median'] or vlon not in data.dims:
+            return data
+
+        if self.sectors is None:
+            return getattr(data, how)(dim=vlon)
+
+        lon = data[vlon].values
+        names = list(self.sectors.keys())
+        members = np.stack(
+            [in_sector(lon, *self.sectors[name]) for name in names], axis=-1
+        )
 
-    def append(self, other):
-        """Append another metric's intensity, latitude, and theta positon to this one."""
+        if how == 'mean':
+            # All sectors at once: masked sum over a (longitude, sector) membership array
+            members = xr.DataArray(
+                members.astype(data.dtype), dims=(vlon, 'sector'), coords={'sector': names}
+            )
+            data_out = (data.fillna(0.0) * members).sum(dim=vlon) / (
+                data.notnull() * members
+            ).sum(dim=vlon)
+        else:
+            import pandas as pd
+
+            data_out = xr.concat(
+                [
+                    data.isel(**{vlon: np.where(members[:, idx])[0]}).median(dim=vlon)
+                    for idx in range(len(names))
+                ],
+                dim=pd.Index(names, name='sector'),
+            )
+
+        lon_s, lon_e = zip(*[self.sectors[name] for name in names])
+        return data_out.transpose(..., 'sector').assign_coords(
+            lon_s=('sector', np.array(lon_s)), lon_e=('sector', np.array(lon_e))
+        )
+
+    def compute(self, client=None):
+        """
+        Compute all dask arrays in `self.out_data`.
+
+        Parameters
+        ----------
+        client : :class:`dask.distributed.Client`, optional
+            If set, submit the computation to this client and return without waiting
+            for it, use :py:meth:`gather` to get the result
+
+        """
+        if client is not None:
+            submit([self], client)
+            return
+
+        compute_all([self])
+
+    def gather(self):
+        """Wait for, and collect, results submitted by :py:meth:`compute`."""
+        for vname in self._futures:
+            self.out_data[vname] = self._futures[vname].result()
+        self._futures = {}
+
+    def append(self, *others):
+        """Append other metrics' intensity, latitude, and theta positon to this one."""
         for var_name in self.out_data:
+            # Concatenate all at once, rather than pairwise, which copies this metric's
+            # data for every other metric
             self.out_data[var_name] = xr.concat(
-                (self.out_data[var_name], other.out_data[var_name]),
+                [self.out_data[var_name]]
+                + [other.out_data[var_name] for other in others],
                 dim=self.data.cfg['time'],
             )
 
 
+class JetWriter:
+    """
+    Write jet positions to a netCDF file, one block of times (e.g. a year) at a time.
+
+    The file is created with an unlimited time dimension at the first
+    :py:meth:`append`, and each following block is written in place at the end of the
+    time dimension, so writing a long record is linear in its length. The file is
+    flushed after each block, so it is valid up to the last complete block if a run
+    stops part way through.
+
+    Parameters
+    ----------
+    file_name : string, optional
+        Output file name (without .nc), defaults to `output_file` from the run
+        config of the first metric appended
+    n_times : integer, optional
+        Number of times already written to an existing output file (e.g. from a
+        checkpoint), if > 0 that file is appended to starting at this time index
+
+    """
+
+    def __init__(self, file_name=None, n_times=0):
+        """Initialise an (unopened) jet position writer."""
+        self.file_name = file_name
+        self.n_times = n_times
+        self.ncfile = None
+        self.tname = None
+        self.log = None
+
+    def append(self, jet):
+        """
+        Write the jet position from a metric to the end of the output file.
+
+        Parameters
+        ----------
+        jet : :py:class:`~STJ_PV.stj_metric.STJMetric`
+            Jet metric, whose `out_data` has been computed
+
+        Returns
+        -------
+        t_0, t_1 : integer
+            Start and end indices along the output time axis where `jet` is written
+
+        """
+        import netCDF4 as nc
+        import pandas as pd
+
+        out_dset = jet.out_dataset()
+        if self.ncfile is None:
+            self.tname = jet.data.cfg['time']
+            self.log = jet.log
+            if self.file_name is None:
+                self.file_name = jet.props['output_file']
+
+            if self.n_times == 0:
+                self._create(out_dset)
+                return 0, self.n_times
+
+            self.log.info('RESUME WRITING %s.nc AT TIME %d', self.file_name, self.n_times)
+            self.ncfile = nc.Dataset(self.file_name + '.nc', 'a')
+
+        nc_time = self.ncfile.variables[self.tname]
+        # Use the number of times from complete blocks, rather than the file's time
+        # dimension, so a block partly written before a crash is overwritten on resume
+        t_0 = self.n_times
+        t_1 = t_0 + out_dset[self.tname].shape[0]
+
+        times = out_dset[self.tname].values
+        if np.issubdtype(times.dtype, np.datetime64):
+            times = pd.to_datetime(times).to_pydatetime()
+        nc_time[t_0:t_1] = nc.date2num(
+            times, nc_time.units, calendar=getattr(nc_time, 'calendar', 'standard')
+        )
+
+        for var_name in out_dset.data_vars:
+            # Files from earlier versions may not have every variable (e.g. TELEMETRY)
+            nc_var = self.ncfile.variables.get(var_name, None)
+            if nc_var is None or self.tname not in nc_var.dimensions:
+                continue
+            _select = [slice(None)] * len(nc_var.dimensions)
+            _select[nc_var.dimensions.index(self.tname)] = slice(t_0, t_1)
+            nc_var[tuple(_select)] = out_dset[var_name].transpose(*nc_var.dimensions).values
+
+        self.ncfile.sync()
+        self.n_times = t_1
+        self.log.info('APPEND %d TIMES TO %s.nc', t_1 - t_0, self.file_name)
+        return t_0, t_1
+
+    def _create(self, out_dset):
+        """Create output file from the first block, leave it open for appending."""
+        import netCDF4 as nc
+
+        encoding = {}
+        if np.issubdtype(out_dset[self.tname].dtype, np.datetime64):
+            # Fixed time units, so later blocks can be encoded the same way
+            encoding[self.tname] = {
+                'units': 'hours since 1900-01-01 00:00:00',
+                'dtype': 'float64',
+            }
+
+        self.log.info('WRITE TO %s.nc', self.file_name)
+        out_dset.to_netcdf(
+            self.file_name + '.nc',
+            unlimited_dims=[self.tname],
+            encoding=encoding,
+            format='NETCDF4',
+        )
+        self.ncfile = nc.Dataset(self.file_name + '.nc', 'a')
+        self.n_times = out_dset[self.tname].shape[0]
+
+    def close(self):
+        """Write the time coverage of the output and close the file."""
+        import netCDF4 as nc
+
+        if self.ncfile is None:
+            return
+        nc_time = self.ncfile.variables[self.tname]
+        if self.n_times > 0:
+            dates = nc.num2date(
+                nc_time[[0, self.n_times - 1]],
+                nc_time.units,
+                calendar=getattr(nc_time, 'calendar', 'standard'),
+            )
+            self.ncfile.setncattr('time_coverage_start', dates[0].isoformat())
+            self.ncfile.setncattr('time_coverage_end', dates[1].isoformat())
+        self.ncfile.close()
+        self.ncfile = None
+
+
 class STJPV(STJMetric):
     """
     Subtropical jet position metric using dynamic tropopause on isentropic levels.
@@ -188,6 +482,7 @@ class STJPV(STJMetric):
         self.pv_lev = self.props['pv_value']
         self.fit_deg = self.props['fit_deg']
         self.min_lat = self.props['min_lat']
+        self.trop_bound = self.props.get('trop_bound', False)
 
         if self.props['poly'].lower() in ['cheby', 'cby', 'cheb', 'chebyshev']:
             self.pfit = poly.chebyshev.chebfit
@@ -207,6 +502,22 @@ class STJPV(STJMetric):
         # Initialise latitude & theta output dicts
         self.out_data = {}
 
+    @classmethod
+    def footprint(cls, config, data_cfg):
+        """
+        Get the latitude band needed for the STJPV metric.
+
+        This is `min_lat` to `max_lat` in each hemisphere, widened by
+        `footprint_margin` (default 5) degrees for the PV and fit derivatives. The
+        tropics are included if `trop_bound` is set. Theta levels are not subset,
+        since the wind shear and thermal tropopause use the whole column.
+
+        """
+        margin = config.get('footprint_margin', 5.0)
+        lats = sorted([abs(config.get('min_lat', 0.0)), abs(config.get('max_lat', 90.0))])
+        lat_min = 0.0 if config.get('trop_bound', False) else max(lats[0] - margin, 0.0)
+        return {'lat_band': (lat_min, min(lats[1] + margin, 90.0))}
+
     def _poly_deriv(self, lat, data, deriv=1):
         """
         Calculate the `deriv`^th derivative of a one-dimensional array w.r.t. latitude.
@@ -230,7 +541,10 @@ class STJPV(STJMetric):
         # a least squares fit on array with np.nan, use where it's valid to do the fit
         valid = np.isfinite(data)
         try:
-            poly_fit = self.pfit(lat[valid], data[valid], self.fit_deg)
+            # Least squares is done in double precision for stability, whatever the
+            # type of the data, since it's one column at a time this costs little
+            poly_fit = self.pfit(lat[valid].astype(np.float64),
+                                 data[valid].astype(np.float64), self.fit_deg)
         except TypeError as err:
             # This can happen on fitting the polynomial:
             # `raise TypeError("expected non-empty vector for x")`
@@ -287,26 +601,82 @@ class STJPV(STJMetric):
         # selection will raise an error
         _latlev = lev_subset.copy()
         _latlev.update(self.hemis)
-        _pv = self.data.ipv.sel(**_latlev).load()
-        _uwnd = self.data.uwnd.sel(**_latlev).load()
-        self.log.info('     COMPUTING THETA ON %.1e', pv_lev)
-        theta_xpv = utils.xrvinterp(
-            self.data[lev_name].sel(**lev_subset),
-            _pv,
-            pv_lev,
-            levname=lev_name,
-            newlevname='pv',
-        ).load()
-
-        self.log.info('     COMPUTING UWND ON %.1e', pv_lev)
-        uwnd_xpv = utils.xrvinterp(
-            _uwnd, _pv, pv_lev, levname=lev_name, newlevname='pv'
-        ).load()
-
-        self.log.info('     COMPUTING SHEAR FROM %.1e', pv_lev)
-        ushear = self._get_max_shear(uwnd_xpv.squeeze(dim='pv')).load()
-
-        return theta_xpv.squeeze(dim='pv'), uwnd_xpv.squeeze(dim='pv'), ushear
+        # Everything here stays lazy, so the full chain (through to the jet position) is
+        # computed once per output block, rather than whole hemispheres being loaded
+        _pv = self.data.ipv.sel(**_latlev)
+        _uwnd = self.data.uwnd.sel(**_latlev)
+
+        # |PV| increases with theta, so PV is increasing with height in the NH and
+        # decreasing in the SH, this saves checking the PV data itself
+        _theta = self.data[lev_name].sel(**lev_subset)
+        increasing = bool((_theta[-1] > _theta[0]) == (pv_lev[0] > 0))
+
+        with self._stage('pv_interp') as stage:
+            self.log.info('     COMPUTING THETA ON %.1e', pv_lev)
+            theta_xpv = utils.xrvinterp(
+                _theta,
+                _pv,
+                pv_lev,
+                levname=lev_name,
+                newlevname='pv',
+                increasing=increasing,
+            ).squeeze(dim='pv')
+
+            self.log.info('     COMPUTING UWND ON %.1e', pv_lev)
+            uwnd_xpv = utils.xrvinterp(
+                _uwnd, _pv, pv_lev, levname=lev_name, newlevname='pv',
+                increasing=increasing
+            ).squeeze(dim='pv')
+            theta_xpv, uwnd_xpv = self.timer.persist(theta_xpv, uwnd_xpv)
+            stage['elements'] = _pv.size + _uwnd.size
+
+        with self._stage('shear') as stage:
+            self.log.info('     COMPUTING SHEAR FROM %.1e', pv_lev)
+            ushear = self.timer.persist(self._get_max_shear(uwnd_xpv))
+            stage['elements'] = self.data.uwnd.size
+
+        if self.props.get('persist', False):
+            # Keep these in (cluster) memory, rather than re-computing them for each use
+            theta_xpv, uwnd_xpv, ushear = dask.persist(theta_xpv, uwnd_xpv, ushear)
+
+        return theta_xpv, uwnd_xpv, ushear
+
+    def trop_intersect(self, theta_xpv):
+        """
+        Find where the thermal tropopause and dynamical tropopause intersect.
+
+        The thermal (WMO lapse-rate) tropopause is found from the pressure on
+        isentropic levels loaded with the IPV, for all columns at once.
+
+        Parameters
+        ----------
+        theta_xpv : :class:`xarray.DataArray`
+            Potential temperature on the dynamical tropopause from
+            :py:meth:`~isolate_pv` for this hemisphere
+
+        Returns
+        -------
+        lat_bnd : :class:`xarray.DataArray`
+            Absolute latitude of the intersection, equatorward of 50 degrees, for each
+            time and longitude. NaN where no thermal tropopause is found
+
+        """
+        lev_name = self.data.cfg['lev']
+        vlat = self.data.cfg['lat']
+
+        pres = self.data.pres.sel(**self.hemis)
+        tair = self.data[lev_name] * (pres / utils.P_0) ** utils.KPPA
+
+        self.log.info('     COMPUTING THERMAL TROPOPAUSE')
+        trop_temp, trop_pres = utils.xrtropopause(tair, pres, levname=lev_name)
+        trop_theta = trop_temp * (utils.P_0 / trop_pres) ** utils.KPPA
+
+        # Distance between the two tropopause definitions in the tropics / subtropics
+        abs_lat = abs(theta_xpv[vlat])
+        th_diff = abs(trop_theta - theta_xpv).where(abs_lat < 50.0)
+        lat_bnd = abs_lat.where(th_diff == th_diff.min(dim=vlat)).min(dim=vlat)
+
+        return lat_bnd
 
     def find_jet(self, shemis=True, debug=False):
         """
@@ -338,58 +708,76 @@ class STJPV(STJMetric):
         # Restrict theta and shear between our min / max latitude from config file
         # that was processed by self.set_hemis
         _theta = theta_xpv.sel(**{vlat: slice(*lats)})
-        if _theta[vlat].shape[0] == 0:
-            # If the selection is empty along the latitude axis, that means
-            # the selection is the wrong way around, so flip it before moving on
-            lats = lats[::-1]
-            _theta = theta_xpv.sel(**{vlat: slice(*lats)})
         _shear = ushear.sel(**{vlat: slice(*lats)})
 
+        stage = self.timer.start('fit', self.data.year, self.props['method'])
+        stage['elements'] = _theta.size
+        if self.trop_bound:
+            # Restrict the fit to be poleward of the thermal / dynamical tropopause
+            # intersection, which is different for each time and longitude
+            lat_bnd = self.trop_intersect(theta_xpv)
+        else:
+            lat_bnd = xr.full_like(_theta.isel(**{vlat: 0}, drop=True), np.nan)
+
         self.log.info('COMPUTING JET POSITION FOR %s in %d', hem_s, self.data.year)
         # Set up computation of all the jet latitudes at once using self.find_single_jet
         # The input_core_dims is a list of lists, that tells xarray/dask that the
         # arguments _theta, _theta.lat, and _shear are passed to self.find_single_jet
-        # with that dimension intact. The kwargs argument passes keyword args to the
-        # self.find_single_jet
+        # with that dimension intact, and lat_bnd is one value per column. The kwargs
+        # argument passes keyword args to the self.find_single_jet
+        # The outcome in each column (see TELEMETRY) is found in the same pass
         if not debug:
-            jet_lat = xr.apply_ufunc(
+            jet_lat, status = xr.apply_ufunc(
                 self.find_single_jet,
                 _theta,
                 _theta[vlat],
                 _shear,
-                input_core_dims=[[vlat], [vlat], [vlat]],
+                lat_bnd,
+                input_core_dims=[[vlat], [vlat], [vlat], []],
+                output_core_dims=[[], []],
                 vectorize=True,
                 dask='parallelized',
-                kwargs={'extrema': extrema},
+                output_dtypes=[float, np.int8],
+                kwargs={'extrema': extrema, 'status': True},
             )
+            counts = self._count_status(status)
         else:
             dtheta, theta_fit, jet_lat = self._debug_jet_loop(_theta, _shear, extrema)
+            counts = {}
 
-        # Select the data for level and intensity by the latitudes generated
-        jet_theta = theta_xpv.sel(**{vlat: jet_lat})
-        jet_intens = uwnd_xpv.sel(**{vlat: jet_lat})
+        # Select the data for level and intensity by the latitudes generated, using a
+        # mask rather than .sel, so jet_lat doesn't need to be computed first
+        at_jet = theta_xpv[vlat] == jet_lat
+        jet_theta = theta_xpv.where(at_jet).max(dim=vlat)
+        jet_intens = uwnd_xpv.where(at_jet).max(dim=vlat)
 
         # This masks our xarrays of intrest where the jet_lat == 0.0, which is set
         # whenever there is invalid data for a particular cell
         jet_intens = jet_intens.where(jet_lat != 0.0)
         jet_theta = jet_theta.where(jet_lat != 0.0)
         jet_lat = jet_lat.where(jet_lat != 0.0)
-
-        # If we're interested in mean / median, take those
-        if self.props['zonal_opt'].lower() == 'mean':
-            jet_intens = jet_intens.mean(dim=self.data.cfg['lon'])
-            jet_theta = jet_theta.mean(dim=self.data.cfg['lon'])
-            jet_lat = jet_lat.mean(dim=self.data.cfg['lon'])
-
-        elif self.props['zonal_opt'].lower() == 'median':
-            jet_intens = jet_intens.median(dim=self.data.cfg['lon'])
-            jet_theta = jet_theta.median(dim=self.data.cfg['lon'])
-            jet_lat = jet_lat.median(dim=self.data.cfg['lon'])
+        jet_intens, jet_theta, jet_lat, *count_data = self.timer.persist(
+            jet_intens, jet_theta, jet_lat, *counts.values()
+        )
+        self.timer.stop(stage)
+
+        # If we're interested in mean / median (zonal or by sector), take those
+        with self._stage('reduce') as stage:
+            stage['elements'] = jet_lat.size * 3
+            jet_intens, jet_theta, jet_lat = self.timer.persist(
+                self.reduce_lon(jet_intens), self.reduce_lon(jet_theta),
+                self.reduce_lon(jet_lat)
+            )
 
         # Put the parameters into place for this hemisphere
         self.out_data['intens_{}'.format(hem_s)] = jet_intens
         self.out_data['theta_{}'.format(hem_s)] = jet_theta
         self.out_data['lat_{}'.format(hem_s)] = jet_lat
+        # Column counts are the total of both hemispheres
+        for name, count in zip(counts, count_data):
+            if name in self.out_data:
+                count = self.out_data[name] + count
+            self.out_data[name] = count
 
         if debug:
             output = dtheta, theta_fit, _theta, jet_lat
@@ -398,16 +786,42 @@ class STJPV(STJMetric):
 
         return output
 
+    def _count_status(self, status):
+        """
+        Count columns with each jet finding outcome, at each time.
+
+        Parameters
+        ----------
+        status : :class:`xarray.DataArray`
+            Outcome for each time and longitude from :py:meth:`~find_single_jet`
+
+        Returns
+        -------
+        counts : dict
+            Number of columns with each outcome in :py:data:`TELEMETRY` at each time
+
+        """
+        vtime = self.data.cfg['time']
+        dims = [dim for dim in status.dims if dim != vtime]
+        self.n_columns += int(status.size // status[vtime].size)
+        counts = {}
+        for name, (code, _) in TELEMETRY.items():
+            counts[name] = (status == code).sum(dim=dims).astype(np.int32)
+            # Don't keep the attributes of the input data
+            counts[name].attrs = {}
+        return counts
+
     def _debug_jet_loop(self, _theta, _shear, extrema):
         """Loop over each time/lon in _theta rather than xarray.apply_ufunc."""
         dims = _theta.shape
         tht_fit_shape = (self.props['fit_deg'] + 1, dims[0], dims[-1])
-        dtheta = np.zeros(dims)
-        theta_fit = np.zeros(tht_fit_shape)
-        jet_lat = np.zeros((dims[0], dims[-1]))
-
         lat = _theta[self.data.cfg['lat']].values
 
+        dtheta = np.zeros(dims, dtype=_theta.dtype)
+        # Fit coefficients are double precision (see _poly_deriv)
+        theta_fit = np.zeros(tht_fit_shape)
+        jet_lat = np.zeros((dims[0], dims[-1]), dtype=lat.dtype)
+
         dims_names = (self.data.cfg['time'], self.data.cfg['lon'])
         coords = {dim_name: _theta[dim_name] for dim_name in dims_names}
 
@@ -421,7 +835,7 @@ class STJPV(STJMetric):
                     _theta[tix, :, xix].values,
                     lat,
                     _shear[tix, :, xix].values,
-                    extrema,
+                    extrema=extrema,
                     debug=True,
                 )
                 jet_lat[tix, xix] = _info[0]
@@ -448,7 +862,8 @@ class STJPV(STJMetric):
         # the surface in some places, so we need to use the lowest valid wind level as
         # the surface, so do some magic to make that happen.
         _lev = self.data.cfg['lev']
-        if self.data[_lev].shape[0] != self.data.chunks[_lev][0]:
+        _uwnd = self.data.uwnd
+        if _uwnd.chunks is not None and len(_uwnd.chunks[_uwnd.get_axis_num(_lev)]) > 1:
             # re-chunk wind to ensure continuity along vertical axis
             self.data = self.data.chunk({_lev: -1})
 
@@ -458,12 +873,13 @@ class STJPV(STJMetric):
             input_core_dims=[[self.data.cfg['lev']]],
             vectorize=True,
             dask='parallelized',
-            output_dtypes=[float],
+            output_dtypes=[self.data.uwnd.dtype],
         )
 
         return uwnd_xpv - uwnd_sfc.sel(**self.hemis)
 
-    def find_single_jet(self, theta_xpv, lat, ushear, extrema, debug=False):
+    def find_single_jet(self, theta_xpv, lat, ushear, lat_bnd=np.nan, extrema=None,
+                        debug=False, status=False):
         """
         Find jet location for a 1D array of theta on latitude.
 
@@ -475,25 +891,45 @@ class STJPV(STJMetric):
             1D array of latitude same shape as theta_xpv from :py:meth:`~isolate_pv`
         ushear : array_like
             1D array along latitude axis of maximum surface - troposphere u-wind shear
+        lat_bnd : float, optional
+            Absolute latitude equatorward of which theta is not used in the fit, and the
+            jet is not identified (see :py:meth:`~trop_intersect`). Default NaN, no bound
+        extrema : function
+            Function used to identify extrema in meridional PV gradient, from
+            :py:meth:`~set_hemis`
         debug : boolean
             If True, returns debugging information about how jet position is found,
             if False (default) returns only jet location
+        status : boolean
+            If True, also return the outcome of finding the jet (one of `FOUND`,
+            `MULTIPLE`, `NO_EXTREMA`, `FIT_FAIL` or `ALL_NAN`), default False
 
         Returns
         -------
         jet_loc : int
             If debug is False, Index of jet location on latitude axis
+        jet_loc, outcome : tuple
+            If status is True (and debug is False)
         jet_loc, jet_loc_all, dtheta, theta_fit, lat, y_s, y_e  : tuple
             If debug is True, return lots of stuff
             TODO: document this better!!
 
         """
+        all_nan = not np.isfinite(theta_xpv).any()
+        if np.isfinite(lat_bnd):
+            # Only fit the dynamical tropopause poleward of the bound
+            in_band = np.abs(lat) >= lat_bnd
+            theta_xpv = np.where(in_band, theta_xpv, np.nan)
+
         # Find derivative of dynamical tropopause
         dtheta, theta_fit = self._poly_deriv(lat, theta_xpv)
 
         jet_loc_all = extrema(dtheta)[0].astype(int)
+        if np.isfinite(lat_bnd):
+            jet_loc_all = jet_loc_all[in_band[jet_loc_all]]
         select = self.select_jet(jet_loc_all, ushear)
-        if np.max(np.abs(theta_fit[0])) == 0.0:
+        fit_fail = np.max(np.abs(theta_fit[0])) == 0.0
+        if fit_fail:
             # This means there was a TypeError in _poly_deriv so probably
             # none of the theta_xpv data is valid for this time/lon, so
             # set the output latitude to be 0, so it can be masked out
@@ -503,6 +939,18 @@ class STJPV(STJMetric):
 
         if debug:
             output = out_lat, jet_loc_all, dtheta, theta_fit, lat
+        elif status:
+            if all_nan:
+                outcome = ALL_NAN
+            elif fit_fail:
+                outcome = FIT_FAIL
+            elif len(jet_loc_all) == 0:
+                outcome = NO_EXTREMA
+            elif len(jet_loc_all) > 1:
+                outcome = MULTIPLE
+            else:
+                outcome = FOUND
+            output = out_lat, outcome
         else:
             output = out_lat
 
@@ -586,11 +1034,6 @@ class STJDavisBirner(STJMetric):
         self.lower_p_level = self.props['lower_p_level']
         self.surf_p_level = self.props['surface_p_level']
 
-        if self.data[self.data.cfg['lev']].units in ['mb', 'millibars', 'hPa']:
-            self.lower_p_level /= 100.0
-            self.upper_p_level /= 100.0
-            self.surf_p_level /= 100.0
-
     def find_jet(self, shemis=True):
         """
         Find the subtropical jet using method from Davis and Birner (2016).
@@ -606,26 +1049,24 @@ class STJDavisBirner(STJMetric):
         _, hlats, hem_s = self.set_hemis(shemis)
         cfg = self.data.cfg
 
-        if self.data[cfg['lev']][0] > self.data[cfg['lev']][-1]:
-            subset = {cfg['lev']: slice(self.lower_p_level, self.upper_p_level)}
-        else:
-            subset = {cfg['lev']: slice(self.upper_p_level, self.lower_p_level)}
-
-        subset.update({cfg['lat']: slice(*hlats)})
+        # Pressure levels are ascending and in Pa (see InputData._normalize)
+        subset = {
+            cfg['lev']: slice(self.upper_p_level, self.lower_p_level),
+            cfg['lat']: slice(*hlats),
+        }
         uwnd_p = self.data.uwnd.sel(**subset)
-        if uwnd_p[cfg['lat']].shape[0] == 0:
-            # Reverse order of lat selection if none are found
-            subset[cfg['lat']] = slice(*hlats[::-1])
-            uwnd_p = self.data.uwnd.sel(**subset)
 
         # Subtract the surface wind from the wind in 400-100 layer
         uwnd_p = uwnd_p - self.data.uwnd.sel(**{cfg['lev']: self.surf_p_level})
         dims = uwnd_p.shape
 
         self.log.info('COMPUTING JET POSITION FOR %d TIMES HEMIS: %s', dims[0], hem_s)
-        if self.props['zonal_opt'].lower() == 'mean':
+        stage = self.timer.start('fit', self.data.year, self.props['method'])
+        stage['elements'] = uwnd_p.size
+        if self.props['zonal_opt'].lower() == 'mean' and self.sectors is None:
             uzonal = uwnd_p.mean(dim=cfg['lon'])
         else:
+            # For sectors, find the jet at each longitude, then reduce to sectors
             uzonal = uwnd_p
 
         jet_info = xr.apply_ufunc(
@@ -634,13 +1075,22 @@ class STJDavisBirner(STJMetric):
             uzonal[cfg['lat']],
             input_core_dims=[[cfg['lev'], cfg['lat']], [cfg['lat']]],
             vectorize=True,
-            dask='allowed',
+            dask='parallelized',
             output_core_dims=[[], []],
-            output_dtypes=[float, float],
+            output_dtypes=[float, uzonal.dtype],
         )
+        jet_info = self.timer.persist(*jet_info)
+        self.timer.stop(stage)
+
+        with self._stage('reduce') as stage:
+            stage['elements'] = jet_info[0].size * 2
+            jet_lat, jet_intens = self.timer.persist(
+                self.reduce_lon(jet_info[0]), self.reduce_lon(jet_info[1])
+            )
+
         # Put the parameters into place for this hemisphere
-        self.out_data['lat_{}'.format(hem_s)] = jet_info[0]
-        self.out_data['intens_{}'.format(hem_s)] = jet_info[1]
+        self.out_data['lat_{}'.format(hem_s)] = jet_lat
+        self.out_data['intens_{}'.format(hem_s)] = jet_intens
 
     def find_max_wind_surface(self, uzonal, lat, test_plot=False):
         """
@@ -657,6 +1107,8 @@ class STJDavisBirner(STJMetric):
         max_wind_surface = np.max(uzonal, axis=0)
         # for the given maximum wind surface, find local
         # maxima and then keep most equatorward.
+        from scipy.signal import argrelextrema
+
         turning_points = argrelextrema(max_wind_surface, np.greater_equal)[0]
         turning_lats = lat[turning_points]
 
@@ -735,10 +1187,17 @@ class STJMaxWind(STJMetric):
 
         # Some config options should be properties for ease of access
         self.pres_lev = self.props['pres_level']
-        if self.data[self.data.cfg['lev']].units in ['mb', 'hPa', 'millibars']:
-            self.pres_lev /= 100.0
         self.min_lat = self.props['min_lat']
 
+    @classmethod
+    def footprint(cls, config, data_cfg):
+        """Get the latitude band and pressure level needed for maximum wind metric."""
+        margin = config.get('footprint_margin', 5.0)
+        footprint = {'lat_band': (max(abs(config['min_lat']) - margin, 0.0), 90.0)}
+        if data_cfg['ztype'] == 'pres':
+            footprint['lev'] = (config['pres_level'], config['pres_level'])
+        return footprint
+
     def find_jet(self, shemis=True):
         """
         Find the subtropical jet using input parameters.
@@ -762,26 +1221,27 @@ class STJMaxWind(STJMetric):
         # Select the latitudes and level
         uwnd_hem = self.data.uwnd.sel(**_latlev_select)
 
-        if uwnd_hem[vlat].shape[0] == 0:
-            # This probably means that lat is decreasing with increasing index
-            # so swap the hemisphere latitudes around and re-try the selection
-            _latlev_select[vlat] = slice(*hlats[::-1])
-            uwnd_hem = self.data.uwnd.sel(**_latlev_select)
-
-        # Find the maximum zonal mean zonal wind at the level set in config
-        uwnd_max = uwnd_hem.argmax(dim=vlat)
-
-        # Use those indicies to find the latitude and intensity of the max wind
-        # Use the latitude coordinate from the hemisphere restricted uwnd so that the
-        # isel works properly (otherwise it's off by the nuber of gridpoints excluded)
-        jet_lat = uwnd_hem[vlat].isel(**{vlat: uwnd_max.load()})
-        jet_intens = uwnd_hem.isel(**{vlat: uwnd_max.load()})
-
-        # Put the parameters into place for this hemisphere, taking the zonal mean first
-        self.out_data['lat_{}'.format(hem_s)] = jet_lat.mean(dim=self.data.cfg['lon'])
-        self.out_data['intens_{}'.format(hem_s)] = jet_intens.mean(
-            dim=self.data.cfg['lon']
-        )
+        with self._stage('fit') as stage:
+            stage['elements'] = uwnd_hem.size
+            # Find the maximum zonal mean zonal wind at the level set in config
+            uwnd_max = uwnd_hem.argmax(dim=vlat)
+
+            # Use those indicies to find the latitude and intensity of the max wind
+            # Use the latitude coordinate from the hemisphere restricted uwnd so that
+            # the isel works properly (otherwise it's off by the nuber of gridpoints
+            # excluded)
+            jet_lat = uwnd_hem[vlat].isel(**{vlat: uwnd_max.load()})
+            jet_intens = self.timer.persist(uwnd_hem.isel(**{vlat: uwnd_max.load()}))
+
+        # Put the parameters into place for this hemisphere, taking the zonal (or
+        # sector) mean first
+        with self._stage('reduce') as stage:
+            stage['elements'] = jet_lat.size * 2
+            jet_lat, jet_intens = self.timer.persist(
+                self.reduce_lon(jet_lat, 'mean'), self.reduce_lon(jet_intens, 'mean')
+            )
+        self.out_data['lat_{}'.format(hem_s)] = jet_lat
+        self.out_data['intens_{}'.format(hem_s)] = jet_intens
 
 
 class STJKangPolvani(STJMetric):
@@ -801,8 +1261,9 @@ class STJKangPolvani(STJMetric):
         """Initialise Metric using Kang and Polvani Method."""
         name = 'KangPolvani'
         super(STJKangPolvani, self).__init__(name=name, props=props, data=data)
-        self.wh_200 = 20000.0 / self.data.cfg["pfac"]
-        self.wh_1000 = 100000.0 / self.data.cfg["pfac"]
+        # Pressure levels are in Pa (see InputData._normalize)
+        self.wh_200 = 20000.0
+        self.wh_1000 = 100000.0
 
     def find_jet(self, shemis=True):
         """
@@ -816,11 +1277,16 @@ class STJKangPolvani(STJMetric):
         """
         _, hlats, hem_s = self.set_hemis(shemis)
 
-        del_f = self.get_flux_div(hlats)
-        self.get_jet_lat(del_f, hem_s)
+        # Eddy flux, zero crossing, and monthly mean are all done at once here
+        with self._stage('fit') as stage:
+            stage['elements'] = self.data.uwnd.size + self.data.vwnd.size
+            del_f = self.get_flux_div(hlats)
+            self.get_jet_lat(del_f, hem_s)
 
     def get_flux_div(self, lats):
         """Calculate the meridional eddy momentum flux divergence."""
+        from STJ_PV.eddy_terms import Kinetic_Eddy_Energies
+
         _select = {self.data.cfg["lev"]: self.wh_200}
         _select.update(self.hemis)
         uwnd = self.data["uwnd"].sel(**_select)
@@ -865,7 +1331,8 @@ class STJKangPolvani(STJMetric):
             signchange,
             input_core_dims=[[_vlat], [_vlat], [_vlat], [_vlat]],
             vectorize=True,
-            dask='allowed',
+            dask='parallelized',
+            output_dtypes=[lat.dtype],
         )
 
         # Output the monthly mean of daily S for comparing the method
@@ -908,6 +1375,120 @@ class STJKangPolvani(STJMetric):
         )
 
 
+def _lazy_outputs(jets):
+    """Get (metric, output name) of each dask array in the `out_data` of metrics."""
+    lazy = []
+    for jet in jets:
+        for vname in jet.out_data:
+            jet._drop_vars(vname)
+            if dask.is_dask_collection(jet.out_data[vname]):
+                lazy.append((jet, vname))
+            elif not isinstance(jet.out_data[vname], xr.DataArray):
+                jet.props.log.info(
+                    'Compute fail data at %s not dask array it is %s',
+                    vname,
+                    type(jet.out_data[vname]),
+                )
+    return lazy
+
+
+def compute_all(jets):
+    """
+    Compute the output of several metrics, as one computation.
+
+    Outputs of one metric (or of metrics using the same input data) share most of
+    their graph (selection, interpolation, shear and fit), so they're computed
+    together, each shared task is then computed once, rather than once per output.
+
+    Parameters
+    ----------
+    jets : list
+        Metrics (:py:class:`STJMetric`) whose `out_data` to compute
+
+    """
+    lazy = _lazy_outputs(jets)
+    computed = dask.compute(*[jet.out_data[vname] for jet, vname in lazy])
+    for (jet, vname), data in zip(lazy, computed):
+        jet.out_data[vname] = data
+
+
+def submit(jets, client):
+    """
+    Submit the output of several metrics to a dask client, as one computation.
+
+    As for :py:func:`compute_all`, outputs are submitted together so each shared task
+    is computed once. Submitted separately, the scheduler may see the same key with a
+    different (optimised) task, which can deadlock. Use :py:meth:`STJMetric.gather` on
+    each metric to get the results.
+
+    Parameters
+    ----------
+    jets : list
+        Metrics (:py:class:`STJMetric`) whose `out_data` to compute
+    client : :class:`dask.distributed.Client`
+        Client to submit the computation to
+
+    """
+    lazy = _lazy_outputs(jets)
+    futures = client.compute([jet.out_data[vname] for jet, vname in lazy])
+    for (jet, vname), future in zip(lazy, futures):
+        jet._futures[vname] = future
+
+
+def sector_bounds(sectors):
+    """
+    Get longitude bounds of each sector from the `sectors` config option.
+
+    Parameters
+    ----------
+    sectors : integer or dict
+        Number of equal width sectors starting at 0E, or mapping of sector name
+        to [lon_s, lon_e]. Sectors may wrap around the dateline / prime meridian
+        (e.g. [300, 30])
+
+    Returns
+    -------
+    bounds : dict
+        Mapping of sector name to (lon_s, lon_e), None if `sectors` is None
+
+    """
+    if sectors is None:
+        bounds = None
+    elif isinstance(sectors, dict):
+        bounds = {str(name): (float(lons[0]), float(lons[1]))
+                  for name, lons in sectors.items()}
+    else:
+        width = 360.0 / int(sectors)
+        bounds = {}
+        for idx in range(int(sectors)):
+            lon_s, lon_e = idx * width, (idx + 1) * width
+            bounds['{:g}-{:g}'.format(lon_s, lon_e)] = (lon_s, lon_e)
+    return bounds
+
+
+def in_sector(lon, lon_s, lon_e):
+    """
+    Find longitudes within a sector [lon_s, lon_e), accounting for wrap-around.
+
+    Parameters
+    ----------
+    lon : array_like
+        Longitudes, in either -180 - 180 or 0 - 360 convention
+    lon_s, lon_e : float
+        Start and end (eastward) of the sector
+
+    Returns
+    -------
+    mask : array_like
+        Boolean array, True where `lon` is in the sector
+
+    """
+    width = (lon_e - lon_s) % 360.0
+    if width == 0 and lon_e != lon_s:
+        width = 360.0
+    return (np.asarray(lon) - lon_s) % 360.0 < width
+
+
 def lowest_valid(col):
     """
     Given 1-D array find lowest (along axis) valid data.
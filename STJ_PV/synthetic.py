@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+"""
+Generate synthetic reanalysis-like input data, for testing at scale without real data.
+
+Fields have a seasonally migrating subtropical jet, a WMO (lapse rate) tropopause that
+drops from ~16 km in the tropics to ~9 km poleward of the jet, travelling eddies, and
+mountains below which data are missing. Data are lazy (:mod:`dask`), generated one
+time chunk at a time, so inputs of any size can be written with bounded memory.
+
+    `python synthetic.py --help`
+
+Usage
+-----
+
+    usage: synthetic.py [-h] [--file FILE] [--ys YS] [--ye YE] [--freq FREQ]
+                        [--res RES] [--calendar CALENDAR] [--chunk CHUNK]
+                        [--seed SEED] [--path PATH] [--ipv]
+            Write synthetic input data in the layout of a data config
+
+    optional arguments:
+      -h, --help           show this help message and exit
+      --file FILE          Data configuration file path
+      --ys YS              Start Year
+      --ye YE              End Year
+      --freq FREQ          Time frequency, e.g. 'D', '6h', 'MS'
+      --res RES            Grid spacing in degrees
+      --calendar CALENDAR  Calendar, e.g. 'standard', 'noleap', '360_day'
+      --chunk CHUNK        Number of times generated at once
+      --seed SEED          Random seed
+      --path PATH          Output directory, default is `path` in the data config
+      --ipv                Also write IPV on isentropic levels (theta data only)
+
+"""
+import os
+import argparse as arg
+import numpy as np
+import dask.array as da
+import xarray as xr
+import yaml
+
+__author__ = "Penelope Maher, Michael Kelleher"
+
+# Default pressure levels [Pa] and isentropic levels [K]
+P_LEVELS = np.array([1000., 925., 850., 700., 600., 500., 400., 300., 250., 200.,
+                     150., 100., 70., 50., 30., 20., 10.]) * 100.0
+TH_LEVELS = np.arange(300.0, 430.0, 10.0)
+
+P_0 = 100000.0          # Reference pressure [Pa]
+SCALE_HGT = 7.0         # Scale height [km]
+KAPPA = 287.0 / 1004.0  # R / c_p
+Z_FINE = np.linspace(0.0, 40.0, 401)
+
+# Variables that can be generated for each vertical coordinate (ztype)
+VARIABLES = {'pres': ['uwnd', 'vwnd', 'tair'], 'theta': ['uwnd', 'vwnd', 'pres', 'ipv']}
+# Mountains: (latitude, longitude, height [km], radius [degrees])
+MOUNTAINS = [(32.0, 88.0, 4.5, 10.0), (40.0, 250.0, 2.5, 8.0), (-25.0, 292.0, 3.0, 5.0)]
+ATTRS = {
+    'uwnd': {'units': 'm s-1', 'standard_name': 'eastward_wind'},
+    'vwnd': {'units': 'm s-1', 'standard_name': 'northward_wind'},
+    'tair': {'units': 'K', 'standard_name': 'air_temperature'},
+    'pres': {'units': 'Pa', 'standard_name': 'air_pressure'},
+    'ipv': {'units': 'K m2 kg-1 s-1',
+            'standard_name': 'ertel_potential_vorticity'},
+}
+
+
+def grid(res):
+    """Get global latitude (ascending) and longitude with spacing `res` degrees."""
+    lat = np.linspace(-90.0, 90.0, int(round(180.0 / res)) + 1)
+    lon = np.arange(0.0, 360.0, res)
+    return lat, lon
+
+
+def _season(times, calendar):
+    """Seasonal cycle, +1 in mid-January (NH winter), -1 in mid-July."""
+    days = 360.0 if calendar == '360_day' else 365.25
+    return np.cos(2.0 * np.pi * (np.asarray(times.dayofyear) - 15.0) / days)
+
+
+def _orography(lat, lon):
+    """Surface height [km] on (lat, lon), including Antarctica."""
+    lon2d, lat2d = np.meshgrid(lon, lat)
+    hgt = 3.0 * np.clip((-lat2d - 65.0) / 10.0, 0.0, 1.0)
+    for m_lat, m_lon, m_hgt, m_rad in MOUNTAINS:
+        dlon = (lon2d - m_lon + 180.0) % 360.0 - 180.0
+        hgt += m_hgt * np.exp(-((lat2d - m_lat) ** 2 + dlon ** 2) / m_rad ** 2)
+    return hgt
+
+
+def _structure(lat, season):
+    """
+    Get jet latitude, tropopause height, and temperatures for each time and latitude.
+
+    Parameters
+    ----------
+    lat : array_like
+        1D latitude
+    season : array_like
+        1D seasonal cycle for each time, from :func:`_season`
+
+    Returns
+    -------
+    struct : dict
+        (time, lat) arrays of jet latitude `lat_j` and speed `u_j`, tropopause height
+        `z_trop` [km], surface `t_sfc` and tropopause `t_trop` temperature [K]
+
+    """
+    hem = np.sign(lat)[None, :]
+    alat = np.abs(lat)[None, :]
+    season = season[:, None]
+
+    # Jet is further equatorward and stronger in winter
+    lat_j = 33.0 - 5.0 * season * hem
+    u_j = 35.0 + 10.0 * season * hem
+    z_trop = 9.0 + 3.5 * (1.0 - np.tanh((alat - lat_j) / 5.0))
+    t_sfc = 300.0 - 45.0 * np.sin(np.deg2rad(alat)) ** 2 - 10.0 * season * hem * (
+        np.sin(np.deg2rad(alat)))
+    t_trop = t_sfc - 6.5 * z_trop
+    return {'lat_j': lat_j, 'u_j': u_j, 'z_trop': z_trop, 't_sfc': t_sfc,
+            't_trop': t_trop}
+
+
+def _tair(hgt, struct):
+    """Temperature [K] at height `hgt` [km] (time, lev, lat)."""
+    z_trop = struct['z_trop'][:, None, :]
+    return np.where(
+        hgt < z_trop,
+        struct['t_sfc'][:, None, :] - 6.5 * hgt,
+        struct['t_trop'][:, None, :] + 1.5 * (hgt - z_trop),
+    )
+
+
+def _winds(hgt, lat, lon, struct, phase):
+    """Zonal and meridional wind [m/s] at `hgt` [km] (time, lev, lat), on lon."""
+    alat = np.abs(lat)[None, None, :, None]
+    hgt = hgt[..., None]
+    lat_j = struct['lat_j'][:, None, :, None]
+    u_j = struct['u_j'][:, None, :, None]
+    # Travelling wavenumber 5 eddies in mid-latitudes
+    wave = (5.0 * np.deg2rad(lon)[None, None, None, :] +
+            phase[:, None, None, None])
+    eddy = 8.0 * np.exp(-((alat - 45.0) / 12.0) ** 2) * np.minimum(hgt / 8.0, 1.0)
+
+    uwnd = (
+        u_j * np.exp(-((alat - lat_j) / 8.0) ** 2 - ((hgt - 12.0) / 4.0) ** 2) +
+        10.0 * np.exp(-((alat - 55.0) / 10.0) ** 2) * (1.0 - np.exp(-hgt / 3.0)) +
+        20.0 * np.sin(np.deg2rad(alat)) ** 2 * np.minimum(hgt / 12.0, 1.0) -
+        8.0 * np.exp(-(alat / 12.0) ** 2 - ((hgt - 14.0) / 3.0) ** 2) +
+        eddy * np.cos(wave)
+    )
+    vwnd = eddy * np.sin(wave)
+    return uwnd, vwnd
+
+
+def _hgt_on_theta(th_levels, struct):
+    """Height [km] of isentropic levels (time, lev, lat), NaN below sea level."""
+    hgt = Z_FINE[None, :, None]
+    thta = _tair(hgt, struct) * np.exp(KAPPA * hgt / SCALE_HGT)
+    hgt_th = np.full((thta.shape[0], th_levels.shape[0], thta.shape[-1]), np.nan)
+    for lix, th_lev in enumerate(th_levels):
+        # Potential temperature increases with height, so count levels below th_lev
+        idx = np.clip((thta < th_lev).sum(axis=1), 1, Z_FINE.shape[0] - 1)
+        th_0 = np.take_along_axis(thta, idx[:, None, :] - 1, axis=1)[:, 0]
+        th_1 = np.take_along_axis(thta, idx[:, None, :], axis=1)[:, 0]
+        wgt = (th_lev - th_0) / (th_1 - th_0)
+        hgt_th[:, lix] = np.where(
+            (thta[:, 0] <= th_lev) & (wgt <= 1.0),
+            Z_FINE[idx - 1] + wgt * (Z_FINE[idx] - Z_FINE[idx - 1]),
+            np.nan,
+        )
+    return hgt_th
+
+
+def _block(tidx, season, var, ztype, levels, lat, lon, seed):
+    """Generate one time chunk of `var` (time, lev, lat, lon)."""
+    struct = _structure(lat, season)
+    # Eddy phase is common to all variables at a time, noise is not
+    phase = np.random.default_rng([seed, int(tidx[0])]).uniform(0, 2 * np.pi,
+                                                                tidx.shape[0])
+    rng = np.random.default_rng([seed, int(tidx[0]), VARIABLES[ztype].index(var) + 1])
+
+    if ztype == 'pres':
+        hgt = np.broadcast_to(-SCALE_HGT * np.log(levels / P_0)[None, :, None],
+                              (tidx.shape[0], levels.shape[0], lat.shape[0]))
+    else:
+        hgt = _hgt_on_theta(levels, struct)
+
+    if var in ['uwnd', 'vwnd']:
+        out = _winds(hgt, lat, lon, struct, phase)[['uwnd', 'vwnd'].index(var)]
+        out = out + rng.standard_normal(out.shape)
+    elif var == 'tair':
+        out = _tair(hgt, struct)[..., None] + 0.3 * rng.standard_normal(
+            hgt.shape + lon.shape)
+    elif var == 'pres':
+        out = (P_0 * np.exp(-hgt / SCALE_HGT))[..., None] * np.ones(lon.shape)
+    elif var == 'ipv':
+        # PV is 2 PVU at the tropopause, increasing upward (faster in the troposphere)
+        th_trop = struct['t_trop'] * np.exp(KAPPA * struct['z_trop'] / SCALE_HGT)
+        d_th = levels[None, :, None] - th_trop[:, None, :]
+        out = (np.sign(lat)[None, None, :] * 2e-6 *
+               np.exp(d_th / np.where(d_th > 0, 50.0, 20.0)))
+        out = out[..., None] * np.exp(0.05 * rng.standard_normal(out.shape + lon.shape))
+        out = np.where(np.isnan(hgt)[..., None], np.nan, out)
+
+    # Data are missing below ground
+    out = np.where(hgt[..., None] < _orography(lat, lon)[None, None], np.nan, out)
+    return out.astype(np.float32)
+
+
+def generate(data_cfg, times, res=2.5, levels=None, chunk=30, seed=0, canonical=False):
+    """
+    Generate synthetic input data as a lazy :class:`xarray.Dataset`.
+
+    Parameters
+    ----------
+    data_cfg : dict
+        Data configuration, used for variable and coordinate names, `ztype` and `pfac`
+    times : :class:`pandas.DatetimeIndex` or :class:`xarray.CFTimeIndex`
+        Times to generate, from :func:`time_axis`
+    res : float, optional
+        Grid spacing in degrees, default 2.5
+    levels : array_like, optional
+        Vertical levels, in Pa for pressure, K for isentropic. Default
+        :data:`P_LEVELS` or :data:`TH_LEVELS` depending on `data_cfg['ztype']`
+    chunk : int, optional
+        Number of times generated at once (dask chunk size), default 30
+    seed : int, optional
+        Random seed, the same seed and times always give the same data, default 0
+    canonical : bool, optional
+        If True, data are as after :py:meth:`~STJ_PV.input_data.InputData._normalize`
+        (ascending latitude and level, in Pa). Default False, latitude and pressure
+        decrease (90N to 90S, surface upward), like most reanalyses
+
+    Returns
+    -------
+    data : :class:`xarray.Dataset`
+        Dask-backed (time, lev, lat, lon) variables for `data_cfg['ztype']`
+
+    """
+    ztype = data_cfg['ztype']
+    if levels is None:
+        levels = P_LEVELS if ztype == 'pres' else TH_LEVELS
+    levels = np.sort(np.asarray(levels, dtype=float))
+    if ztype == 'pres' and not canonical:
+        levels = levels[::-1]
+    lat, lon = grid(res)
+    dims = [data_cfg[cvar] for cvar in ['time', 'lev', 'lat', 'lon']]
+
+    tidx = da.arange(len(times), chunks=chunk)
+    season = da.from_array(_season(times, getattr(times, 'calendar', 'standard')),
+                           chunks=chunk)
+    out_chunks = (tidx.chunks[0], (levels.shape[0],), (lat.shape[0],), (lon.shape[0],))
+
+    data = {}
+    for var in VARIABLES[ztype]:
+        field = da.map_blocks(
+            _block, tidx, season, var=var, ztype=ztype, levels=levels, lat=lat,
+            lon=lon, seed=seed, new_axis=[1, 2, 3], chunks=out_chunks,
+            dtype=np.float32, name='synthetic-{}-{}'.format(var, seed),
+        )
+        data[data_cfg.get(var, var)] = (dims, field, ATTRS[var])
+
+    if ztype == 'pres':
+        pfac = 1.0 if canonical else data_cfg.get('pfac', 1.0)
+        lev_attrs = {'units': {1.0: 'Pa', 100.0: 'hPa'}.get(pfac, 'Pa / {}'.format(pfac)),
+                     'standard_name': 'air_pressure'}
+    else:
+        pfac = 1.0
+        lev_attrs = {'units': 'K', 'standard_name': 'potential_temperature'}
+
+    if not canonical:
+        lat = lat[::-1]
+        for var in data:
+            data[var] = (dims, data[var][1][:, :, ::-1], data[var][2])
+
+    coords = {
+        dims[0]: times,
+        dims[1]: (dims[1], levels / pfac, lev_attrs),
+        dims[2]: (dims[2], lat, {'units': 'degrees_north'}),
+        dims[3]: (dims[3], lon, {'units': 'degrees_east'}),
+    }
+    return xr.Dataset(data, coords=coords,
+                      attrs={'title': 'Synthetic input data for STJ_PV', 'seed': seed})
+
+
+def time_axis(year_s, year_e, freq='D', calendar='standard'):
+    """
+    Get times from the start of `year_s` to the end of `year_e`.
+
+    Parameters
+    ----------
+    year_s, year_e : int
+        First and last year
+    freq : string, optional
+        Frequency of times, pandas offset alias, default 'D' (daily)
+    calendar : string, optional
+        CF calendar, default 'standard'
+
+    Returns
+    -------
+    times : :class:`pandas.DatetimeIndex` or :class:`xarray.CFTimeIndex`
+
+    """
+    # Up to the start of the next year, since Dec 31 isn't in every calendar (360_day)
+    return xr.date_range('{:04d}-01-01'.format(year_s), '{:04d}-01-01'.format(year_e + 1),
+                         freq=freq, calendar=calendar, use_cftime=calendar != 'standard',
+                         inclusive='left')
+
+
+def write(data_cfg, year_s, year_e, freq='D', calendar='standard', res=2.5, chunk=30,
+          seed=0, ipv=False, path=None, n_times=None):
+    """
+    Write synthetic input files in the layout set by a data configuration.
+
+    Files are named by `data_cfg['file_paths']` in the same way as they are found by
+    :py:meth:`~STJ_PV.input_data.InputData._load_one_file`: a variable's own file, or
+    the `all` file, one per year if the name has a `{year}` placeholder. Data are
+    generated and written one time chunk at a time.
+
+    Parameters
+    ----------
+    data_cfg : dict
+        Data configuration
+    year_s, year_e : int
+        First and last year
+    freq : string, optional
+        Frequency of times, default 'D'
+    calendar : string, optional
+        CF calendar, default 'standard'
+    res : float, optional
+        Grid spacing in degrees, default 2.5
+    chunk : int, optional
+        Number of times generated at once, default 30
+    seed : int, optional
+        Random seed, default 0
+    ipv : bool, optional
+        Write IPV (isentropic data only) to the `ipv` file, so it is not computed by
+        :py:class:`~STJ_PV.input_data.InputDataSTJPV`. Default False
+    path : string, optional
+        Output directory, default `data_cfg['path']`
+    n_times : int, optional
+        Only write the first `n_times` times, default None (all times to the end of
+        `year_e`)
+
+    Returns
+    -------
+    files : list
+        Files written
+
+    """
+    if path is None:
+        path = data_cfg['path']
+    os.makedirs(path, exist_ok=True)
+    times = time_axis(year_s, year_e, freq, calendar)[:n_times]
+    data = generate(data_cfg, times, res=res, chunk=chunk, seed=seed)
+    vtime = data_cfg['time']
+
+    # Group variables by the file they belong in
+    file_vars = {}
+    for var in VARIABLES[data_cfg['ztype']]:
+        if var == 'ipv':
+            if not ipv:
+                continue
+            file_name = data_cfg['file_paths']['ipv']
+        else:
+            file_name = data_cfg['file_paths'].get(var, data_cfg['file_paths'].get('all'))
+        file_vars.setdefault(file_name, []).append(data_cfg.get(var, var))
+
+    years = np.asarray(data[vtime].dt.year)
+    encoding = {vtime: {'units': 'hours since 1900-01-01 00:00:00', 'calendar': calendar,
+                        'dtype': 'float64'}}
+    files = []
+    for file_name, names in file_vars.items():
+        if '{year' in file_name:
+            out = [(file_name.format(year=year), data[names].isel(**{vtime: years == year}))
+                   for year in np.unique(years)]
+        else:
+            out = [(file_name, data[names])]
+
+        for out_file, dset in out:
+            out_file = os.path.join(path, out_file)
+            dset.to_netcdf(out_file, unlimited_dims=[vtime], encoding=encoding)
+            files.append(out_file)
+    return files
+
+
+def make_parse():
+    """Make command line argument parser with argparse."""
+    parser = arg.ArgumentParser(
+        description='Write synthetic input data in the layout of a data config'
+    )
+    parser.add_argument('--file', type=str, default='data_config_sample.yml',
+                        help='Data configuration file path')
+    parser.add_argument('--ys', type=int, default=2000, help='Start Year')
+    parser.add_argument('--ye', type=int, default=2000, help='End Year')
+    parser.add_argument('--freq', type=str, default='D',
+                        help="Time frequency, e.g. 'D', '6h', 'MS'")
+    parser.add_argument('--res', type=float, default=2.5,
+                        help='Grid spacing in degrees')
+    parser.add_argument('--calendar', type=str, default='standard',
+                        help="Calendar, e.g. 'standard', 'noleap', '360_day'")
+    parser.add_argument('--chunk', type=int, default=30,
+                        help='Number of times generated at once')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--path', type=str, default=None,
+                        help='Output directory, default is `path` in the data config')
+    parser.add_argument('--ipv', action='store_true', default=False,
+                        help='Also write IPV on isentropic levels (theta data only)')
+    return parser.parse_args()
+
+
+def main():
+    """Write synthetic data from command line arguments."""
+    args = make_parse()
+    cfg_file = args.file
+    if not os.path.exists(cfg_file):
+        cfg_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conf',
+                                cfg_file)
+    with open(cfg_file) as cfg:
+        data_cfg = yaml.safe_load(cfg)
+
+    files = write(data_cfg, args.ys, args.ye, freq=args.freq, calendar=args.calendar,
+                  res=args.res, chunk=args.chunk, seed=args.seed, ipv=args.ipv,
+                  path=args.path)
+    for file_name in files:
+        print('WROTE: {}'.format(file_name))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+"""Record the time taken, and data processed, by each stage of a jet finding run."""
+import os
+import re
+import json
+import importlib.util
+import time
+import contextlib
+import collections
+import yaml
+import dask
+import dask.utils
+
+__author__ = "Penelope Maher, Michael Kelleher"
+
+# Stages of a run, in the order they happen
+STAGES = ('open', 'select', 'ipv', 'ipv_write', 'pv_interp', 'shear', 'fit', 'reduce',
+          'write')
+# Unique part of a dask graph layer name
+TOKEN = re.compile('[0-9a-f]{32}')
+# Quantities recorded for each stage, summed over each time the stage is run
+FIELDS = ('calls', 'wall', 'cpu', 'bytes_processed', 'bytes_written', 'elements',
+          'tasks')
+
+
+def _worker_cpu_time():
+    """
+    Get CPU time used by dask workers in other processes, 0 if there's no client.
+
+    This is a round trip to every worker, so is only sampled once per period (see
+    :py:meth:`StageTimer.start_period`), not for each stage.
+
+    """
+    try:
+        from dask.distributed import get_client
+        client = get_client()
+    except (ImportError, ValueError):
+        return 0.0
+
+    pid = os.getpid()
+    workers = client.run(lambda: (os.getpid(), time.process_time()))
+    # Workers in this process (e.g. a threaded cluster) are counted in stage CPU time
+    return sum(w_cpu for w_pid, w_cpu in workers.values() if w_pid != pid)
+
+
+class StageTimer:
+    """
+    Wall time, CPU time, bytes read / written, and elements processed by each stage.
+
+    Work in this code is mostly lazy (with dask), so is done wherever it's finally
+    computed. When the timer is enabled, the result of each stage is computed
+    (persisted) at the end of that stage with :py:meth:`persist`, so the time taken is
+    counted against the stage that did the work. This needs more memory, since the
+    intermediate results are kept, so timing is off by default.
+
+    CPU time of each stage is for this process only. CPU time of dask workers in
+    other processes is sampled at the start and end of each period (e.g. year), with
+    :py:meth:`start_period` and :py:meth:`stop_period`, so it's recorded for each
+    period rather than each stage. If periods overlap (years in flight), each
+    period's worker CPU time includes the others' work done at the same time.
+
+    The number of tasks each stage adds to the dask graph can also be recorded
+    (`graphs`), without changing how the run is computed. Each stage's graph layers
+    are kept in `layer_stage`, so tasks run by the scheduler can be matched to the
+    stage that created them (see :py:func:`profile_run`).
+
+    Parameters
+    ----------
+    enabled : bool, optional
+        Record stages, default True. If False, :py:meth:`stage` records nothing, and
+        :py:meth:`persist` leaves its arguments lazy
+    graphs : bool, optional
+        Record tasks added to the graph by each stage, default False
+
+    """
+
+    def __init__(self, enabled=True, graphs=False):
+        """Initialise a stage timer, with no stages recorded."""
+        self.enabled = bool(enabled)
+        self.graphs = graphs
+        self.records = []
+        self.worker_cpu = {}
+        self.layer_stage = {}
+        self._token_stage = {}
+        self._open = []
+        self._period_cpu = {}
+
+    @property
+    def recording(self):
+        """Stages are recorded, either for timing or graph size."""
+        return self.enabled or self.graphs
+
+    def reset(self):
+        """Remove all recorded stages."""
+        self.records = []
+        self.worker_cpu = {}
+        self._period_cpu = {}
+
+    def start_period(self, year):
+        """Start recording dask worker CPU time for a period (e.g. year)."""
+        if self.enabled:
+            self._period_cpu[year] = _worker_cpu_time()
+
+    def stop_period(self, year):
+        """Finish recording dask worker CPU time for a period."""
+        if self.enabled and year in self._period_cpu:
+            cpu = _worker_cpu_time() - self._period_cpu.pop(year)
+            self.worker_cpu[year] = self.worker_cpu.get(year, 0.0) + cpu
+
+    def start(self, name, year=None, method=None):
+        """
+        Start timing a stage of the run.
+
+        Parameters
+        ----------
+        name : string
+            Name of the stage, one of `STAGES`
+        year : int, optional
+            Year of data being processed
+        method : string, optional
+            Name of the metric, None for stages shared by all metrics (e.g. input)
+
+        Returns
+        -------
+        record : dict
+            Record of this stage, set its `bytes_processed`, `bytes_written` and
+            `elements` before passing it to :py:meth:`stop`
+
+        """
+        record = {'stage': name, 'year': year, 'method': method, 'calls': 1,
+                  'wall': 0.0, 'cpu': 0.0, 'bytes_processed': 0, 'bytes_written': 0,
+                  'elements': 0, 'tasks': 0}
+        if self.enabled:
+            record['start'] = (time.perf_counter(), time.process_time())
+        if self.recording:
+            self._open.append(record)
+        return record
+
+    def stop(self, record):
+        """Finish timing a stage, started with :py:meth:`start`."""
+        if not self.recording:
+            return
+        if self.enabled:
+            wall_0, cpu_0 = record.pop('start')
+            record['wall'] = time.perf_counter() - wall_0
+            record['cpu'] = time.process_time() - cpu_0
+        self._open = [_record for _record in self._open if _record is not record]
+        self.records.append(record)
+
+    @contextlib.contextmanager
+    def stage(self, name, year=None, method=None):
+        """
+        Time a stage of the run, as a context manager (see :py:meth:`start`).
+
+        Yields
+        ------
+        record : dict
+            Record of this stage, set its `bytes_processed`, `bytes_written` and
+            `elements` within the `with` block
+
+        """
+        record = self.start(name, year, method)
+        yield record
+        # Not reached if the stage fails, so only complete stages are recorded
+        self.stop(record)
+
+    def persist(self, *data):
+        """
+        Compute dask collections (keeping them in memory) if the timer is enabled.
+
+        If `graphs` is set, tasks added to the graph since the last stage are counted
+        against the stage this is called from.
+
+        Parameters
+        ----------
+        data : :class:`xarray.DataArray`, :class:`xarray.Dataset`, or dict
+            Lazy data, a dict of these is persisted all at once
+
+        Returns
+        -------
+        data : same type as `data`
+            Persisted data if the timer is enabled, otherwise `data` unchanged. One
+            object if one is passed, otherwise a tuple
+
+        """
+        if self.graphs and self._open:
+            self._add_layers(data, self._open[-1])
+
+        if self.enabled:
+            data = dask.persist(*data)
+            try:
+                from dask.distributed import get_client, wait
+                get_client()
+            except (ImportError, ValueError):
+                pass
+            else:
+                # With a distributed client persist returns at once, so wait for it
+                wait(data)
+
+        if len(data) == 1:
+            data = data[0]
+        return data
+
+    def _add_layers(self, data, record):
+        """Count tasks in graph layers of `data` not made by an earlier stage."""
+        items = []
+        for item in data:
+            items.extend(item.values() if isinstance(item, dict) else [item])
+
+        for item in items:
+            if not dask.is_dask_collection(item):
+                continue
+            graph = item.__dask_graph__()
+            if hasattr(graph, 'layers'):
+                layers = {name: len(layer) for name, layer in graph.layers.items()}
+            else:
+                layers = collections.Counter(key_name(key) for key in graph)
+
+            for name, n_tasks in layers.items():
+                if name not in self.layer_stage:
+                    self.layer_stage[name] = record['stage']
+                    record['tasks'] += n_tasks
+                    for token in TOKEN.findall(name):
+                        self._token_stage.setdefault(token, record['stage'])
+
+    def stage_of(self, key):
+        """
+        Get the stage whose graph a task is from, 'other' if it's not known.
+
+        Tasks fused by dask's graph optimisation are renamed, but keep the token
+        of one of the layers they were fused from, which is used if the name of
+        the task's layer isn't known.
+
+        """
+        name = key_name(key)
+        if name in self.layer_stage:
+            return self.layer_stage[name]
+        for token in TOKEN.findall(name):
+            if token in self._token_stage:
+                return self._token_stage[token]
+        return 'other'
+
+    def totals(self, method=None):
+        """
+        Sum recorded stages, over the whole run and for each year.
+
+        Parameters
+        ----------
+        method : string, optional
+            Only include stages for this metric, and those shared by all metrics
+
+        Returns
+        -------
+        stages : dict
+            Mapping of stage name to dict of `FIELDS` for the whole run
+        years : dict
+            Mapping of year to the same as `stages` for that year
+
+        """
+        stages = collections.OrderedDict()
+        years = collections.OrderedDict()
+        for record in self.records:
+            if method is not None and record['method'] not in [None, method]:
+                continue
+            for total in [stages, years.setdefault(record['year'], {})]:
+                _total = total.setdefault(record['stage'],
+                                          {field: 0 for field in FIELDS})
+                for field in FIELDS:
+                    _total[field] += record[field]
+
+        return _in_order(stages), {year: _in_order(years[year]) for year in years}
+
+    def report(self, method=None):
+        """Get recorded stages as a dict, for writing to a file."""
+        stages, years = self.totals(method)
+        return {'wall': sum(stage['wall'] for stage in stages.values()),
+                'cpu': sum(stage['cpu'] for stage in stages.values()),
+                'worker_cpu': float(sum(self.worker_cpu.values())),
+                'worker_cpu_years': {year: float(cpu)
+                                     for year, cpu in self.worker_cpu.items()},
+                'stages': stages, 'years': years}
+
+    def write(self, file_name, method=None, **info):
+        """
+        Write recorded stages to a JSON (if `file_name` ends with .json) or YAML file.
+
+        Parameters
+        ----------
+        file_name : string
+            Path to output file
+        method : string, optional
+            Only include stages for this metric, and those shared by all metrics
+        info : dict
+            Other information to include (e.g. the output file name)
+
+        """
+        report = dict(info, **self.report(method))
+        with open(file_name, 'w') as out_file:
+            if file_name.endswith('.json'):
+                json.dump(report, out_file, indent=2)
+            else:
+                out_file.write(yaml.safe_dump(report, sort_keys=False))
+
+    def log_summary(self, log, method=None):
+        """
+        Write a table of the time, throughput and data size of each stage to the log.
+
+        Parameters
+        ----------
+        log : :py:class:`logging.Logger`
+            Logger for the run
+        method : string, optional
+            Only include stages for this metric, and those shared by all metrics
+
+        """
+        stages, _ = self.totals(method)
+        fmt = '  {:10s} {:>6s} {:>10s} {:>10s} {:>10s} {:>10s} {:>12s} {:>10s} {:>8s}'
+        log.info('TIME BY STAGE')
+        log.info(fmt.format('STAGE', 'CALLS', 'WALL (s)', 'CPU (s)', 'PROCESSED',
+                            'WRITTEN', 'ELEMENTS', 'ELEM / s', 'TASKS'))
+        for name, total in stages.items():
+            if total['wall'] > 0:
+                rate = '{:.3g}'.format(total['elements'] / total['wall'])
+            else:
+                rate = '-'
+            log.info(fmt.format(
+                name, str(total['calls']), '{:.3f}'.format(total['wall']),
+                '{:.3f}'.format(total['cpu']),
+                dask.utils.format_bytes(total['bytes_processed']),
+                dask.utils.format_bytes(total['bytes_written']),
+                str(total['elements']), rate, str(total['tasks']),
+            ))
+        wall = sum(total['wall'] for total in stages.values())
+        cpu = sum(total['cpu'] for total in stages.values())
+        log.info(fmt.format('TOTAL', '', '{:.3f}'.format(wall), '{:.3f}'.format(cpu),
+                            '', '', '', '', ''))
+        if self.worker_cpu:
+            log.info('DASK WORKER CPU (s): %.3f', sum(self.worker_cpu.values()))
+
+
+@contextlib.contextmanager
+def profile_run(timer, base_name, log, client=None):
+    """
+    Profile a run on a dask distributed cluster, as a context manager.
+
+    Within the `with` block, `timer` records the tasks each stage adds to the graph,
+    and the scheduler's task stream is captured. At the end, these are written
+    beside the output, with the same base name:
+
+    * `{base_name}.dask-report.html`: :func:`dask.distributed.performance_report`
+      (task stream, worker profiles, bandwidth), if bokeh is installed
+    * `{base_name}.task-stream.json`: every task run, with its worker and timings
+    * `{base_name}.worker-profile.json`: statistical profile of worker threads
+    * `{base_name}.profile.yml`: tasks in the graph, tasks run, and their compute
+      time, for each stage
+
+    Parameters
+    ----------
+    timer : :py:class:`StageTimer`
+        Timer of the run, its `graphs` option is set within the `with` block
+    base_name : string
+        Output file name, without extension
+    log : :py:class:`logging.Logger`
+        Logger for the run
+    client : :class:`dask.distributed.Client`, optional
+        Client of the run, default is the current client. If there isn't one, only
+        the tasks in the graph for each stage are recorded
+
+    """
+    if client is None:
+        try:
+            from dask.distributed import get_client
+            client = get_client()
+        except (ImportError, ValueError):
+            log.info('NO DASK CLIENT, ONLY GRAPH SIZE IS PROFILED')
+
+    graphs = timer.graphs
+    timer.graphs = True
+    with contextlib.ExitStack() as stack:
+        stream = None
+        if client is not None:
+            from dask.distributed import get_task_stream, performance_report
+            if importlib.util.find_spec('bokeh') is not None:
+                stack.enter_context(performance_report(
+                    filename='{}.dask-report.html'.format(base_name)))
+            else:
+                log.info('bokeh NOT INSTALLED, NO DASK PERFORMANCE REPORT')
+            stream = stack.enter_context(get_task_stream(client))
+        yield
+    timer.graphs = graphs
+
+    stages = {name: {'graph_tasks': total['tasks'], 'tasks_run': 0, 'task_time': 0.0}
+              for name, total in timer.totals()[0].items()}
+    info = {'stages': stages}
+    if stream is not None:
+        for task in stream.data:
+            stage = stages.setdefault(
+                timer.stage_of(task['key']),
+                {'graph_tasks': 0, 'tasks_run': 0, 'task_time': 0.0}
+            )
+            stage['tasks_run'] += 1
+            stage['task_time'] += sum(startstop['stop'] - startstop['start']
+                                      for startstop in task['startstops']
+                                      if startstop['action'] == 'compute')
+
+        info['task_stream'] = '{}.task-stream.json'.format(base_name)
+        with open(info['task_stream'], 'w') as out_file:
+            json.dump(stream.data, out_file, default=str)
+
+        info['worker_profile'] = '{}.worker-profile.json'.format(base_name)
+        with open(info['worker_profile'], 'w') as out_file:
+            json.dump(client.profile(), out_file, default=str)
+
+    fmt = '  {:10s} {:>12s} {:>10s} {:>14s}'
+    log.info('DASK TASKS BY STAGE')
+    log.info(fmt.format('STAGE', 'GRAPH TASKS', 'TASKS RUN', 'TASK TIME (s)'))
+    for name, stage in stages.items():
+        stage['task_time'] = float(stage['task_time'])
+        log.info(fmt.format(name, str(stage['graph_tasks']), str(stage['tasks_run']),
+                            '{:.3f}'.format(stage['task_time'])))
+
+    with open('{}.profile.yml'.format(base_name), 'w') as out_file:
+        out_file.write(yaml.safe_dump(info, sort_keys=False))
+    log.info('WROTE PROFILE TO %s.*', base_name)
+
+
+def key_name(key):
+    """Get the name of the graph layer a dask task key is part of."""
+    if isinstance(key, tuple):
+        key = key[0]
+    return str(key)
+
+
+def _in_order(totals):
+    """Put stage totals in the order of `STAGES`, as python types."""
+    order = {name: idx for idx, name in enumerate(STAGES)}
+    return {name: {field: _clean(totals[name][field]) for field in FIELDS}
+            for name in sorted(totals, key=lambda name: order.get(name, len(STAGES)))}
+
+
+def _clean(value):
+    """Convert numpy scalars to python types, so they can be written to YAML / JSON."""
+    if isinstance(value, float) or hasattr(value, 'dtype') and value.dtype.kind == 'f':
+        return float(value)
+    return int(value)
+
+
+def file_size(file_name):
+    """Size of a file in bytes, 0 if it doesn't exist."""
+    if os.path.exists(file_name):
+        return os.path.getsize(file_name)
+    return 0
@@ -1,10 +1,9 @@
 # -*- coding: utf-8 -*-
 """Utility functions not specific to subtropical jet finding."""
 from __future__ import division
+import functools
 import numpy as np
 import xarray as xr
-import xarray.ufuncs as xu
-from scipy import interpolate as interp
 
 __author__ = "Penelope Maher, Michael Kelleher"
 
@@ -18,6 +17,7 @@ EARTH_R = 6.371e6       # Radius of earth                   [m]
 R_D = 287.0             # Dry gas constant                  [J kg^-1 K^-1]
 C_P = 1004.0            # Specific heat of dry air          [J kg^-1 K^-1]
 KPPA = R_D / C_P        # Ratio of gas constants
+P_0 = 100000.0          # Reference pressure for potential temperature [Pa]
 
 
 class NDSlicer(object):
@@ -102,7 +102,29 @@ class NDSlicer(object):
             list of slices such that all data at other axes are kept, one axis is sliced
 
         """
-        self.__getitem__(slice(start, stop, step))
+        return self.__getitem__(slice(start, stop, step))
+
+
+def float_type(*arrays):
+    """
+    Get the floating point type to compute with, from the input data.
+
+    Input data are cast to the compute type (`dtype` in the run config) when they are
+    loaded, so results are kept in the type of the data. Coordinates (e.g. latitude,
+    often double precision in files) are cast to this type rather than promoting data.
+
+    Parameters
+    ----------
+    arrays : array_like
+        Input data (or dtypes)
+
+    Returns
+    -------
+    dtype : :class:`numpy.dtype`
+        The widest floating point type of `arrays`, at least single precision
+
+    """
+    return np.result_type(*[getattr(arr, 'dtype', arr) for arr in arrays], np.float32)
 
 
 def vinterp(data, vcoord, vlevels):
@@ -214,7 +236,7 @@ def vinterp(data, vcoord, vlevels):
         out_shape = list(vcoord.shape)
     out_shape[1] = vlevels.shape[0]
 
-    out_data = np.zeros(out_shape) + np.nan
+    out_data = np.full(out_shape, np.nan, dtype=float_type(data))
 
     for lev_idx, lev in enumerate(vlevels):
         if idx_gt == 0:
@@ -298,7 +320,7 @@ def inc_with_z(vcoord, levname):
     return pctinc
 
 
-def _xrvinterp_single(data, vcoord, lev, levname='lev'):
+def _xrvinterp_single(data, vcoord, lev, levname='lev', increasing=True):
     r"""
     Perform linear interpolation along vertical axis on an :class:`xarray.DataArray`.
 
@@ -315,6 +337,8 @@ def _xrvinterp_single(data, vcoord, lev, levname='lev'):
     levname : string
         Name of the vertical level coordinate variable upon
         which to interpolate
+    increasing : bool, optional
+        True (default) if `vcoord` is increasing along `levname`, False if decreasing
 
     Returns
     -------
@@ -326,8 +350,7 @@ def _xrvinterp_single(data, vcoord, lev, levname='lev'):
     _sabove = {levname: slice(1, None)}
     _sbelow = {levname: slice(None, -1)}
 
-    if inc_with_z(vcoord, levname) <= 0.8:
-        # Fewer than 80% of points are increasing with index, swap directions
+    if not increasing:
         _sbelow, _sabove = _sabove, _sbelow
 
     # Original levels from vcoord, should match original levels from data
@@ -347,7 +370,7 @@ def _xrvinterp_single(data, vcoord, lev, levname='lev'):
 
     # Combine, this means select all points where
     # vcoord[LEVEL - 1] <= lev && vcoord[LEVEL + 1] > lev
-    idx = xu.logical_and(above, below)
+    idx = above & below
 
     # This is vcoord[:, 1:, ...], wherever idx is true and NaN everywhere else
     ix_ab = xr.where(idx.assign_coords(**_coord_above),
@@ -374,7 +397,7 @@ def _xrvinterp_single(data, vcoord, lev, levname='lev'):
     return out
 
 
-def xrvinterp(data, vcoord, vlevs, levname, newlevname):
+def xrvinterp(data, vcoord, vlevs, levname, newlevname, increasing=None):
     r"""
     Perform vertical interpolation for several levels for an :class:`xarray.DataArray`.
 
@@ -393,6 +416,10 @@ def xrvinterp(data, vcoord, vlevs, levname, newlevname):
         which to interpolate
     newlevname : string
         Name of new vertical level coordinate variable
+    increasing : bool, optional
+        True if `vcoord` is increasing along `levname`, False if decreasing. If not
+        set, this is found from `vcoord` (increasing if more than 80% of points are),
+        which computes part of `vcoord`, so set it to keep `data` fully lazy
 
     Returns
     -------
@@ -408,8 +435,13 @@ def xrvinterp(data, vcoord, vlevs, levname, newlevname):
     to do with them. We're not the boss of you :)
 
     """
+    if increasing is None:
+        increasing = bool(inc_with_z(vcoord, levname) > 0.8)
+    # Levels in the same type as vcoord, so interpolation weights don't promote data
+    vlevs = np.asarray(vlevs, dtype=float_type(vcoord))
+
     # Use a list-comprehension to assemble all the vertical coordinates
-    intp = [_xrvinterp_single(data, vcoord, lev, levname) for lev in vlevs]
+    intp = [_xrvinterp_single(data, vcoord, lev, levname, increasing) for lev in vlevs]
     # Concatenate the length (vlevs.shape[0]) list of xarray.DataArrays
     # The concat_dims is default, and avoids weirdness when data rank is small
     # (e.g. data.ndim < vcoord.ndim). Assing vlevs to be the values
@@ -434,9 +466,92 @@ def xrvinterp(data, vcoord, vlevs, levname, newlevname):
     return intp
 
 
-def interp_nd(lat, theta_in, data, lat_hr, theta_hr):
+@functools.lru_cache(maxsize=64)
+def _interp_weights(x_in, x_out, kind):
+    """Cached :py:func:`interp_weights`, grids are passed as (hashable) tuples."""
+    # Interpolating the identity gives the weight each input point has for each output
+    # point, since the interpolation is linear in the data
+    from scipy import interpolate as interp
+
+    eye = np.eye(len(x_in))
+    wgt = interp.interp1d(np.array(x_in), eye, axis=0, kind=kind, bounds_error=False,
+                          fill_value=np.nan)(np.array(x_out))
+    wgt.flags.writeable = False
+    return wgt
+
+
+def interp_weights(x_in, x_out, kind='linear'):
     """
-    Perform interpolation on 2-dimensions on up to 4-dimensional numpy array.
+    Compute 1-D interpolation weights from one grid to another.
+
+    Weights are cached, so they are only computed once for each pair of grids.
+
+    Parameters
+    ----------
+    x_in : array_like
+        1D source coordinate
+    x_out : array_like
+        1D target coordinate
+    kind : string
+        Type of interpolation, 'linear' or 'cubic' (or any `kind` accepted by
+        :class:`scipy.interpolate.interp1d`)
+
+    Returns
+    -------
+    wgt : array_like
+        Array of weights, shape (x_out.shape[0], x_in.shape[0]), so that
+        `data_out = wgt @ data_in`. Rows for `x_out` outside of `x_in` are NaN
+
+    """
+    return _interp_weights(tuple(np.asarray(x_in, dtype=float)),
+                           tuple(np.asarray(x_out, dtype=float)), kind)
+
+
+def apply_weights(data, wgt, axis=-1):
+    """
+    Apply interpolation weights from :py:func:`interp_weights` along one axis.
+
+    All other axes are done at once with a single tensor contraction. Output points
+    whose interpolation uses a missing (NaN) input point are set to NaN. For linear
+    weights these are only the points next to it, but cubic spline weights are non-zero
+    almost everywhere, so one missing point (e.g. a level below ground) makes almost the
+    whole of its line along `axis` missing.
+
+    Parameters
+    ----------
+    data : array_like
+        N-D array of data to interpolate
+    wgt : array_like
+        2-D array of weights, where wgt.shape[1] == data.shape[axis]
+    axis : integer
+        Axis of `data` to be interpolated
+
+    Returns
+    -------
+    data_out : array_like
+        N-D array, same as `data` except data_out.shape[axis] == wgt.shape[0]
+
+    """
+    missing = np.isnan(data)
+    out = np.tensordot(np.where(missing, 0.0, data), wgt, axes=([axis], [1]))
+
+    if missing.any():
+        # Points with any non-zero weight on a missing input value are also missing
+        n_miss = np.tensordot(missing, np.abs(wgt) > 0, axes=([axis], [1]))
+        out = np.where(n_miss > 0, np.nan, out)
+
+    # Weights are double precision, so the sum is too, the output is the input's type
+    out = out.astype(float_type(data), copy=False)
+    return np.moveaxis(out, -1, axis)
+
+
+def interp_nd(lat, theta_in, data, lat_hr, theta_hr, kind='linear', lat_axis=None,
+              theta_axis=None):
+    """
+    Perform interpolation on 2-dimensions of an N-dimensional numpy array.
+
+    The interpolation is separable, so weights are computed once for latitude and once
+    for theta, then applied to all other dimensions at once.
 
     Parameters
     ----------
@@ -450,6 +565,12 @@ def interp_nd(lat, theta_in, data, lat_hr, theta_hr):
         1-D latitude coordinate array that `data` is interpolated to
     theta_hr : array_like
         1-D vertical coordinate array that `data` is interpolated to
+    kind : string
+        Type of interpolation, 'linear' (default) or 'cubic'. With 'cubic', data
+        should have no missing values, see :py:func:`apply_weights`
+    lat_axis, theta_axis : integer, optional
+        Axes of `data` matching `lat` and `theta_in`. If not set, these are the first
+        axes whose length matches `theta_in` then `lat`
 
     Returns
     -------
@@ -458,57 +579,62 @@ def interp_nd(lat, theta_in, data, lat_hr, theta_hr):
         `theta_hr`
 
     """
-    lat_dim = np.where(np.array(data.shape) == lat.shape[0])[0]
-    theta_dim = np.where(np.array(data.shape) == theta_in.shape[0])[0]
-    if data.ndim == 2:
-        data_f = interp.interp2d(lat, theta_in, data, kind='cubic')
-        data_interp = data_f(lat_hr, theta_hr)
-
-    elif data.ndim == 3:
-
-        out_shape = list(data.shape)
-        out_shape[lat_dim] = lat_hr.shape[0]
-        out_shape[theta_dim] = theta_hr.shape[0]
-
-        data_interp = np.zeros(out_shape)
+    shape = np.array(data.shape)
+    if theta_axis is None:
+        theta_axis = np.where(shape == theta_in.shape[0])[0][0]
+    if lat_axis is None:
+        lat_axis = [axis for axis in np.where(shape == lat.shape[0])[0]
+                    if axis != theta_axis][0]
+
+    data_interp = apply_weights(data, interp_weights(theta_in, theta_hr, kind),
+                                axis=theta_axis)
+    data_interp = apply_weights(data_interp, interp_weights(lat, lat_hr, kind),
+                                axis=lat_axis)
+    return data_interp
 
-        #For contexts when you have a 3d array but 2 dimensions are the same.
-        cmn_axis = np.where(np.logical_and(np.array(data.shape) != lat.shape[0],
-                                           np.array(data.shape) != theta_in.shape[0]))[0]
-        # cmn_axis = np.where(out_shape == np.array(data.shape))[0]
-        for idx0 in range(data.shape[cmn_axis]):
 
-            data_f = interp.interp2d(lat, theta_in, data.take(idx0, axis=cmn_axis),
-                                     kind='cubic')
+def xrinterp_nd(data, coords, kind='linear'):
+    """
+    Perform separable interpolation along one or more dimensions of a DataArray.
 
-            slc = [slice(None)] * data_interp.ndim
-            slc[cmn_axis] = idx0
-            data_interp[slc] = data_f(lat_hr, theta_hr)
+    Parameters
+    ----------
+    data : :class:`xarray.DataArray`
+        N-D array of data to interpolate, may be dask backed
+    coords : dict
+        Mapping of dimension name to 1-D array of new coordinates,
+        e.g. `{'lat': lat_hr, 'level': theta_hr}`
+    kind : string
+        Type of interpolation, 'linear' (default) or 'cubic'. With 'cubic', data
+        should have no missing values, see :py:func:`apply_weights`
 
-    elif data.ndim == 4:
+    Returns
+    -------
+    data_interp : :class:`xarray.DataArray`
+        N-D array of `data` interpolated to `coords`, with same dimension order as `data`
 
-        out_shape = list(data.shape)
-        out_shape[lat_dim] = lat_hr.shape[0]
-        out_shape[theta_dim] = theta_hr.shape[0]
-        data_interp = np.zeros(out_shape)
-
-        # For contexts when you have a 3d array but 2 dimensions are the same.
-        cmn_axis = np.where(np.logical_and(np.array(data.shape) != lat.shape[0],
-                                           np.array(data.shape) != theta_in.shape[0]))[0]
-
-        # cmn_axis = np.where(out_shape == np.array(data.shape))[0][:]
-        for idx0 in range(data.shape[cmn_axis[0]]):
-            for idx1 in range(data.shape[cmn_axis[1]]):
-                data_slice = data.take(idx1, axis=cmn_axis[1]).take(idx0,
-                                                                    axis=cmn_axis[0])
-                data_f = interp.interp2d(lat, theta_in, data_slice, kind='cubic')
-                # slc says which axis to place interpolated array on, it's what changes
-                # with the loops
-                slc = [slice(None)] * data_interp.ndim
-                slc[cmn_axis[0]] = idx0
-                slc[cmn_axis[1]] = idx1
-                data_interp[slc] = data_f(lat_hr, theta_hr)
-    return data_interp
+    """
+    data_interp = data
+    for dim, new_coord in coords.items():
+        wgt = interp_weights(data[dim].values, new_coord, kind)
+        if data_interp.chunks is not None:
+            # Interpolated dimension must be in one chunk, all others are done blockwise
+            data_interp = data_interp.chunk({dim: -1})
+
+        data_interp = xr.apply_ufunc(
+            apply_weights,
+            data_interp,
+            input_core_dims=[[dim]],
+            output_core_dims=[[dim]],
+            exclude_dims={dim},
+            kwargs={'wgt': wgt, 'axis': -1},
+            dask='parallelized',
+            output_dtypes=[float_type(data)],
+            dask_gufunc_kwargs={'output_sizes': {dim: len(new_coord)}},
+        )
+        data_interp = data_interp.assign_coords(**{dim: np.asarray(new_coord)})
+
+    return data_interp.transpose(*data.dims)
 
 
 def xrtheta(tair, pvar='level'):
@@ -541,8 +667,8 @@ def xrtheta(tair, pvar='level'):
         # if pressure is in hPa (or similar), fix p_0
         p_0 /= 100.
 
-    # Compute and return theta
-    return tair * (p_0 / tair[pvar]) ** KPPA
+    # Compute and return theta, in the same type as tair
+    return tair * ((p_0 / tair[pvar]) ** KPPA).astype(float_type(tair))
 
 
 def theta(tair, pres):
@@ -709,6 +835,7 @@ def lapse_rate(t_air, pres, vaxis=None):
 
     # rho = p / (Rd * T)
     # Hydrostatic approximation dz = -dp/(rho * g)
+    bcast_nd = tuple(bcast_nd)
     d_z = -d_p[bcast_nd] / (((pres[bcast_nd] * pres_fac) /
                              (R_D * t_air))[slc_t.slice(1, None)] * GRV) / 1000.0
 
@@ -763,6 +890,53 @@ def trop_lev_1d(dtdz, d_z, thr=2.0, return_idx=False):
         return out_mask
 
 
+def _trop_candidates(dtdz, d_z, thr=2.0, depth=2.0):
+    """
+    Flag every level which meets the WMO tropopause criteria, vertical axis last.
+
+    This is the same test as :py:func:`trop_lev_1d`, but each candidate level is tested
+    for all columns at once, so the only loop is over the (few) vertical levels.
+
+    Parameters
+    ----------
+    dtdz : array_like
+        N-D array of lapse rate in K/km, vertical axis last
+    d_z : array_like
+        N-D array (same shape as `dtdz`) of difference in height between levels in km
+    thr : float
+        Lapse rate threshold in K/km (WMO definition is 2.0 K/km)
+    depth : float
+        Depth of layer above tropopause in which lapse rate must stay below `thr`,
+        WMO definition is 2 km
+
+    Returns
+    -------
+    is_trop : array_like
+        N-D array of booleans, same shape as `dtdz`, True at levels meeting the criteria
+
+    """
+    lt_thr = dtdz < thr
+    # Start of a layer where lapse rate drops below threshold, the 0th level never is
+    is_trop = np.zeros(dtdz.shape, dtype=bool)
+    is_trop[..., 1:] = np.logical_and(np.logical_not(lt_thr[..., :-1]), lt_thr[..., 1:])
+
+    for lev in range(1, dtdz.shape[-1]):
+        if not is_trop[..., lev].any():
+            continue
+        # Height of each level above this one, and the index of the level closest to
+        # `depth` above (relative to this one), NaN where a missing level is reached
+        hgt = np.cumsum(d_z[..., lev:], axis=-1)
+        top = np.abs(hgt - depth).argmin(axis=-1)
+
+        # Maximum lapse rate in the layer between this level and `top`
+        max_lr = np.maximum.accumulate(dtdz[..., lev:], axis=-1)
+        max_lr = np.take_along_axis(max_lr, np.maximum(top - 1, 0)[..., None], axis=-1)
+
+        is_trop[..., lev] &= np.logical_and(top > 0, max_lr[..., 0] <= thr)
+
+    return is_trop
+
+
 def find_tropopause_mask(dtdz, d_z, thr=2.0):
     """
     Use Reichler et al. 2003 method to calculate tropopause level.
@@ -770,40 +944,146 @@ def find_tropopause_mask(dtdz, d_z, thr=2.0):
     Parameters
     ----------
     dtdz : array_like
-        1-D array of lapse rate in K/km
+        N-D array of lapse rate in K/km, if >= 2-D vertical axis is 1
     d_z : array_like
-        1-D array (same shape as `dtdz`) of difference in height between levels
+        N-D array (same shape as `dtdz`) of difference in height between levels
     thr : float
         Lapse rate threshold in K/km (WMO definition is 2.0 K/km)
 
     Returns
     -------
-    trop_level : integer
-        Index of tropopause level on the vertical axis
+    trop_level : array_like
+        N-D array of booleans, same shape as `dtdz`, `True` everywhere except the
+        tropopause level
 
     """
     # For now, we'll assume if 1-D data: vertical is dim 0, >= 2-D vertical is dim 1
-    # Loops are slow, but still can't figure out a way beyond them :-(
-    trop_level = np.empty(dtdz.shape, dtype=bool)
-    if dtdz.ndim == 1:
-        return trop_lev_1d(dtdz, d_z, thr)
-
-    elif dtdz.ndim == 2:
-        for ixt in range(dtdz.shape[0]):
-            trop_level[ixt, :] = trop_lev_1d(dtdz[ixt, :], d_z[ixt, :], thr)
-
-    elif dtdz.ndim == 3:
-        for ixt in range(dtdz.shape[0]):
-            for ixy in range(dtdz.shape[2]):
-                trop_level[ixt, :, ixy] = trop_lev_1d(dtdz[ixt, :, ixy], d_z[ixt, :, ixy],
-                                                      thr)
-    elif dtdz.ndim == 4:
-        for ixt in range(dtdz.shape[0]):
-            for ixy in range(dtdz.shape[2]):
-                for ixx in range(dtdz.shape[3]):
-                    trop_level[ixt, :, ixy, ixx] = trop_lev_1d(dtdz[ixt, :, ixy, ixx],
-                                                               d_z[ixt, :, ixy, ixx], thr)
-    return trop_level
+    vaxis = min(dtdz.ndim - 1, 1)
+    is_trop = _trop_candidates(np.moveaxis(dtdz, vaxis, -1), np.moveaxis(d_z, vaxis, -1),
+                               thr=thr)
+    return np.moveaxis(np.logical_not(is_trop), -1, vaxis)
+
+
+def trop_index(dtdz, d_z, thr=2.0, axis=1):
+    """
+    Find index of the lowest WMO (Reichler et al. 2003) tropopause level of each column.
+
+    Parameters
+    ----------
+    dtdz : array_like
+        N-D array of lapse rate in K/km
+    d_z : array_like
+        N-D array (same shape as `dtdz`) of difference in height between levels
+    thr : float
+        Lapse rate threshold in K/km (WMO definition is 2.0 K/km)
+    axis : integer
+        Vertical axis of `dtdz` and `d_z`
+
+    Returns
+    -------
+    trop_idx : array_like
+        (N-1)-D array of integer index of tropopause level on the vertical axis
+    found : array_like
+        (N-1)-D array of booleans, False where no tropopause was found in the column
+        (`trop_idx` is 0 there)
+
+    """
+    is_trop = _trop_candidates(np.moveaxis(dtdz, axis, -1), np.moveaxis(d_z, axis, -1),
+                               thr=thr)
+    return is_trop.argmax(axis=-1), is_trop.any(axis=-1)
+
+
+def find_tropopause(t_air, pres, thr=2.0, vaxis=1, half_levels=True):
+    """
+    Return the tropopause temperature and pressure for WMO tropopause.
+
+    Vectorised version of :py:func:`get_tropopause`, which uses the lowest level that
+    meets the WMO criteria in each column.
+
+    Parameters
+    ----------
+    t_air : array_like
+        ND array of temperature
+    pres : array_like
+        ND array of pressure levels, shape is same as `t_air`
+    thr : float
+        Lapse rate threshold, default/WMO definition is 2.0 K km^-1
+    vaxis : integer
+        Vertical axis of `t_air` and `pres`
+    half_levels : bool
+        If True (default) use every other level starting at 1 (the half levels
+        from :py:func:`get_tropopause_pres`) as :py:func:`get_tropopause` does,
+        if False, use every level
+
+    Returns
+    -------
+    trop_temp, trop_pres : array_like
+        Temperature and pressure at tropopause level, in (N-1)-D arrays, where dimension
+        dropped is vertical axis, same units as input t_air and pres respectively. NaN
+        where no tropopause is found
+
+    """
+    vaxis = vaxis % t_air.ndim
+    # Calculate the lapse rate, gives back lapse rate and d(height)
+    dtdz, d_z = lapse_rate(t_air, pres, vaxis=vaxis)
+
+    slc = NDSlicer(vaxis, t_air.ndim)
+    if half_levels:
+        levs = slc[1::2]
+    else:
+        levs = slc[:]
+
+    trop_idx, found = trop_index(dtdz[levs], d_z[levs], thr=thr, axis=vaxis)
+    trop_idx = np.expand_dims(trop_idx, vaxis)
+
+    trop_temp = np.take_along_axis(t_air[levs], trop_idx, axis=vaxis).squeeze(axis=vaxis)
+    trop_pres = np.take_along_axis(pres[levs], trop_idx, axis=vaxis).squeeze(axis=vaxis)
+
+    return np.where(found, trop_temp, np.nan), np.where(found, trop_pres, np.nan)
+
+
+def xrtropopause(tair, pres, levname='level', thr=2.0, half_levels=False):
+    """
+    Find the WMO tropopause temperature and pressure for a :class:`xarray.DataArray`.
+
+    Each block of columns is computed at once with :py:func:`find_tropopause`, so this
+    works on dask backed arrays, as long as `levname` is not split across chunks.
+
+    Parameters
+    ----------
+    tair : :class:`xarray.DataArray`
+        N-D array of air temperature in K
+    pres : :class:`xarray.DataArray`
+        Pressure, either N-D with the same dimensions as `tair` or the 1-D
+        vertical coordinate
+    levname : string
+        Name of vertical dimension
+    thr : float
+        Lapse rate threshold, default/WMO definition is 2.0 K km^-1
+    half_levels : bool
+        Use only every other level, see :py:func:`find_tropopause`
+
+    Returns
+    -------
+    trop_temp, trop_pres : :class:`xarray.DataArray`
+        Temperature and pressure at tropopause level, with the vertical dimension removed
+
+    """
+    tair, pres = xr.broadcast(tair, pres)
+    if tair.chunks is not None:
+        tair = tair.chunk({levname: -1})
+        pres = pres.chunk(dict(zip(tair.dims, tair.chunks)))
+
+    return xr.apply_ufunc(
+        find_tropopause,
+        tair,
+        pres,
+        input_core_dims=[[levname], [levname]],
+        output_core_dims=[[], []],
+        kwargs={'thr': thr, 'vaxis': -1, 'half_levels': half_levels},
+        dask='parallelized',
+        output_dtypes=[tair.dtype, pres.dtype],
+    )
 
 
 def get_tropopause(t_air, pres, thr=2.0, vaxis=1):
@@ -868,6 +1148,8 @@ def get_tropopause_pres(t_air, pres, thr=2.0):
     pres_full[1::2] = pres_hf
 
     # Interpolate temperature to half pressure levels
+    from scipy import interpolate as interp
+
     t_interp = interp.interp1d(pres, t_air, axis=1, kind='linear')(pres_full)
 
     # Broadcast pres_full to 4D, but pressure axis has to be last axis for broadcast_to
@@ -1032,7 +1314,7 @@ def diffz(data, vcoord, axis=None):
             axis = vcoord.shape.index(data.shape[0])
 
     # Create array to hold vertical derivative
-    dxdz = np.zeros(data.shape)
+    dxdz = np.zeros(data.shape, dtype=float_type(data))
 
     # Create an n-dimensional broadcast along matching axis, same as [None, :, None, None]
     # for axis=1, ndim=4
@@ -1040,8 +1322,8 @@ def diffz(data, vcoord, axis=None):
         bcast = [np.newaxis] * data.ndim
         bcast[axis] = slice(None)
         d_z = (vcoord[1:] - vcoord[:-1])
-        d_z2 = d_z[:-1][bcast]
-        d_z1 = d_z[1:][bcast]
+        d_z2 = d_z[:-1][tuple(bcast)]
+        d_z1 = d_z[1:][tuple(bcast)]
         # Create n-dimensional slicer along matching axis
         slc = NDSlicer(axis, data.ndim)
     else:
@@ -1153,7 +1435,7 @@ def convert_radians_latlon(lat, lon):
     return lat_out, lon_out
 
 
-def dlon_dlat(lon, lat, cyclic=True):
+def dlon_dlat(lon, lat, cyclic=True, dtype=None):
     """
     Calculate distance along lat/lon axes on spherical grid.
 
@@ -1163,6 +1445,8 @@ def dlon_dlat(lon, lat, cyclic=True):
         ND array of latitude
     lon : array_like
         ND array of longitude
+    dtype : :class:`numpy.dtype`, optional
+        Type of the output, default is the type of lat / lon
 
     Returns
     ----------
@@ -1195,6 +1479,8 @@ def dlon_dlat(lon, lat, cyclic=True):
     dlong = dlong * EARTH_R * np.cos(lat2d)
     dlatg = dlatg * EARTH_R
 
+    if dtype is not None:
+        dlong, dlatg = dlong.astype(dtype), dlatg.astype(dtype)
     return dlong, dlatg
 
 
@@ -1232,8 +1518,10 @@ def xr_dlon_dlat(data, vlon='lon', vlat='lat', cyclic=True):
 
     dlat = diff_cfd_xr(lat, dim=vlat, cyclic=False)
 
-    dlon = dlon * EARTH_R * lat.pipe(np.cos)
-    dlat = dlat * EARTH_R
+    # Distances are computed from (often double precision) coordinates, but used with
+    # the data, so are in the same type as it
+    dlon = (dlon * EARTH_R * lat.pipe(np.cos)).astype(float_type(data))
+    dlat = (dlat * EARTH_R).astype(float_type(data))
 
     return dlon, dlat
 
@@ -1267,7 +1555,7 @@ def rel_vort(uwnd, vwnd, lat, lon, cyclic=True):
     lat, lon = convert_radians_latlon(lat, lon)
 
     # Get dlon and dlat in spherical coords
-    dlong, dlatg = dlon_dlat(lon, lat, cyclic)
+    dlong, dlatg = dlon_dlat(lon, lat, cyclic, dtype=float_type(uwnd, vwnd))
 
     # Generate quasi-broadcasts of lat/lon differences for divisions
     if uwnd.ndim == 4:
@@ -1467,7 +1755,7 @@ def ipv_theta(uwnd, vwnd, pres, lat, lon, th_levels):
     lat_bcast = [np.newaxis] * rel_v.ndim
     lat_axis = np.where(np.array(rel_v.shape) == lat.shape[0])[0][0]
     lat_bcast[lat_axis] = slice(None)
-    f_cor = 2.0 * OM * np.sin(lat[lat_bcast] * RAD)
+    f_cor = (2.0 * OM * np.sin(lat[tuple(lat_bcast)] * RAD)).astype(float_type(rel_v))
 
     # Calculate IPV, then correct for y-derivative problems at poles
     ipv_out = -GRV * (rel_v + f_cor) * dthdp
@@ -1511,7 +1799,9 @@ def xripv_theta(uwnd, vwnd, pres, dimvars):
 
     # Calculate Coriolis force
     # First, get axis matching latitude to input data
-    f_cor = 2.0 * OM * (RAD * uwnd[dimvars['lat']]).pipe(np.sin)
+    f_cor = (2.0 * OM * (RAD * uwnd[dimvars['lat']]).pipe(np.sin)).astype(
+        float_type(uwnd)
+    )
 
     # Calculate IPV, then correct for y-derivative problems at poles
     ipv_out = -GRV * (rel_v + f_cor) * dthdp
@@ -1556,8 +1846,8 @@ def xripv(uwnd, vwnd, tair, dimvars=None, th_levels=None):
     """
     if th_levels is None:
         th_levels = TH_LEV
-    # import pdb;pdb.set_trace()
-    th_levels = np.float32(th_levels)
+    # Levels are in the same type as the data
+    th_levels = np.asarray(th_levels, dtype=float_type(uwnd))
     if dimvars is None:
         dimvars = {'lev': 'level', 'lat': 'lat', 'lon': 'lon'}
 
@@ -1584,8 +1874,8 @@ def xripv(uwnd, vwnd, tair, dimvars=None, th_levels=None):
     else:
         scale = 1.
 
-    p_th = xrvinterp(scale * uwnd[vlev], thta, th_levels, levname=vlev,
-                     newlevname=vlev)
+    p_th = xrvinterp((scale * uwnd[vlev]).astype(float_type(uwnd)), thta, th_levels,
+                     levname=vlev, newlevname=vlev)
 
     # Calculate IPV on theta levels
     ipv_out = xripv_theta(u_th, v_th, p_th, dimvars)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for writing IPV and jet output files."""
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import xarray as xr
+from STJ_PV import input_data, stj_metric
+
+from .common import RESOLUTIONS, N_TIMES, CHUNKS, make_props, theta_data
+
+
+class WriteIPV:
+    """Write a year of IPV, isentropic wind and pressure (compressed netCDF)."""
+
+    params = [RESOLUTIONS, N_TIMES, CHUNKS]
+    param_names = ['res', 'n_times', 'chunk']
+
+    def setup(self, res, n_times, chunk):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.props = make_props('STJPV', ztype='theta', wpath=self.tmp_dir)
+        data = theta_data(res, n_times, chunk)
+        self.ipv = input_data.InputDataSTJPV(self.props)
+        self.ipv.year = data.year
+        self.ipv.out_data = {var: data[var] for var in ['ipv', 'uwnd', 'pres']}
+
+    def teardown(self, res, n_times, chunk):
+        shutil.rmtree(self.tmp_dir)
+
+    def time_write_ipv(self, res, n_times, chunk):
+        self.ipv._write_ipv()
+
+
+class SaveJet:
+    """Write jet position, intensity and level for both hemispheres."""
+
+    params = [[365, 365 * 40]]
+    param_names = ['n_times']
+
+    def setup(self, n_times):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.props = make_props('STJPV', ztype='theta',
+                                output_file='{}/jet'.format(self.tmp_dir))
+        data = theta_data(RESOLUTIONS[0], 1)
+        self.jet = stj_metric.STJPV(self.props, data)
+        time = pd.date_range('1979-01-01', periods=n_times, freq='D')
+        rng = np.random.default_rng(0)
+        for hem in ['nh', 'sh']:
+            for var in ['lat', 'intens', 'theta']:
+                self.jet.out_data['{}_{}'.format(var, hem)] = xr.DataArray(
+                    rng.standard_normal(n_times), coords={'time': time}, dims=('time',)
+                )
+
+    def teardown(self, n_times):
+        shutil.rmtree(self.tmp_dir)
+
+    def time_save_jet(self, n_times):
+        self.jet.save_jet()
+
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for finding the jet in both hemispheres with each metric."""
+import importlib.util
+import dask
+from STJ_PV import stj_metric
+
+from .common import RESOLUTIONS, N_TIMES, CHUNKS, make_props, pres_data, theta_data
+
+
+class _FindJet:
+    """Run `find_jet` for both hemispheres and compute the output."""
+
+    params = [RESOLUTIONS, N_TIMES, CHUNKS]
+    param_names = ['res', 'n_times', 'chunk']
+    method = None
+    metric = None
+    ztype = 'pres'
+
+    def setup(self, res, n_times, chunk):
+        self.props = make_props(self.method, ztype=self.ztype)
+        if self.ztype == 'pres':
+            self.data = pres_data(res, n_times, chunk)
+        else:
+            self.data = theta_data(res, n_times, chunk)
+
+    def find_jet(self):
+        jet = self.metric(self.props, self.data)
+        for shemis in [True, False]:
+            jet.find_jet(shemis)
+        dask.compute(jet.out_data)
+
+    def time_find_jet(self, res, n_times, chunk):
+        self.find_jet()
+
+    def peakmem_find_jet(self, res, n_times, chunk):
+        self.find_jet()
+
+
+class STJPVFindJet(_FindJet):
+    """PV gradient method on isentropic input."""
+
+    method = 'STJPV'
+    metric = stj_metric.STJPV
+    ztype = 'theta'
+
+
+class MaxWindFindJet(_FindJet):
+    """Maximum wind at a pressure level."""
+
+    method = 'STJUMax'
+    metric = stj_metric.STJMaxWind
+
+
+class DavisBirnerFindJet(_FindJet):
+    """Davis and Birner (2016) maximum wind surface."""
+
+    method = 'DavisBirner'
+    metric = stj_metric.STJDavisBirner
+
+
+class KangPolvaniFindJet(_FindJet):
+    """Kang and Polvani (2011) eddy momentum flux divergence."""
+
+    method = 'KangPolvani'
+    metric = stj_metric.STJKangPolvani
+
+    def setup(self, res, n_times, chunk):
+        if importlib.util.find_spec('STJ_PV.eddy_terms') is None:
+            # Skipped by asv, eddy_terms is not part of this version of the package
+            raise NotImplementedError('STJKangPolvani not available')
+        super(KangPolvaniFindJet, self).setup(res, n_times, chunk)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for the numerical routines in :py:mod:`STJ_PV.utils`."""
+import numpy as np
+import dask
+from STJ_PV import utils
+
+from .common import RESOLUTIONS, N_TIMES, CHUNKS, TH_LEVELS, pres_data, theta_data
+
+DIMVARS = {'time': 'time', 'lev': 'level', 'lat': 'lat', 'lon': 'lon'}
+
+
+class VInterp:
+    """Interpolate wind from pressure to isentropic levels (numpy)."""
+
+    params = [RESOLUTIONS, N_TIMES]
+    param_names = ['res', 'n_times']
+
+    def setup(self, res, n_times):
+        data = pres_data(res, n_times)
+        self.uwnd = data.uwnd.values
+        self.theta = utils.xrtheta(data.air, pvar='level').values
+
+    def time_vinterp(self, res, n_times):
+        utils.vinterp(self.uwnd, self.theta, TH_LEVELS)
+
+    def peakmem_vinterp(self, res, n_times):
+        utils.vinterp(self.uwnd, self.theta, TH_LEVELS)
+
+
+class XRVInterp:
+    """Interpolate wind from pressure to isentropic levels (xarray / dask)."""
+
+    params = [RESOLUTIONS, N_TIMES, CHUNKS]
+    param_names = ['res', 'n_times', 'chunk']
+
+    def setup(self, res, n_times, chunk):
+        data = pres_data(res, n_times, chunk)
+        self.uwnd = data.uwnd
+        self.theta = utils.xrtheta(data.air, pvar='level').persist()
+
+    def time_xrvinterp(self, res, n_times, chunk):
+        utils.xrvinterp(self.uwnd, self.theta, TH_LEVELS, levname='level',
+                        newlevname='level').compute()
+
+
+class XRIPV:
+    """Isentropic PV from u, v, T on pressure levels."""
+
+    params = [RESOLUTIONS, N_TIMES, CHUNKS]
+    param_names = ['res', 'n_times', 'chunk']
+
+    def setup(self, res, n_times, chunk):
+        self.data = pres_data(res, n_times, chunk)
+
+    def time_xripv(self, res, n_times, chunk):
+        dask.compute(*utils.xripv(self.data.uwnd, self.data.vwnd, self.data.air,
+                                  dimvars=DIMVARS, th_levels=TH_LEVELS))
+
+    def peakmem_xripv(self, res, n_times, chunk):
+        dask.compute(*utils.xripv(self.data.uwnd, self.data.vwnd, self.data.air,
+                                  dimvars=DIMVARS, th_levels=TH_LEVELS))
+
+
+class XRIPVTheta:
+    """Isentropic PV from u, v, and pressure on isentropic levels."""
+
+    params = [RESOLUTIONS, N_TIMES, CHUNKS]
+    param_names = ['res', 'n_times', 'chunk']
+
+    def setup(self, res, n_times, chunk):
+        self.data = theta_data(res, n_times, chunk)
+
+    def time_xripv_theta(self, res, n_times, chunk):
+        utils.xripv_theta(self.data.uwnd, self.data.vwnd, self.data.pres,
+                          DIMVARS).compute()
+
+
+class RelVort:
+    """Relative vorticity on a global grid."""
+
+    params = [RESOLUTIONS, N_TIMES]
+    param_names = ['res', 'n_times']
+
+    def setup(self, res, n_times):
+        data = pres_data(res, n_times)
+        self.uwnd = data.uwnd.values
+        self.vwnd = data.vwnd.values
+        self.lat = data.lat.values
+        self.lon = data.lon.values
+
+    def time_rel_vort(self, res, n_times):
+        utils.rel_vort(self.uwnd, self.vwnd, self.lat, self.lon)
+
+
+class TropopauseMask:
+    """WMO lapse-rate tropopause search."""
+
+    params = [RESOLUTIONS, N_TIMES]
+    param_names = ['res', 'n_times']
+
+    def setup(self, res, n_times):
+        data = pres_data(res, n_times)
+        pres = data.level.values / 100.0
+        self.dtdz, self.d_z = utils.lapse_rate(data.air.values, pres)
+
+    def time_find_tropopause_mask(self, res, n_times):
+        utils.find_tropopause_mask(self.dtdz, self.d_z)
+
+
+
+class Tropopause:
+    """WMO tropopause temperature and pressure of each column."""
+
+    params = [RESOLUTIONS, N_TIMES]
+    param_names = ['res', 'n_times']
+
+    def setup(self, res, n_times):
+        # Idealised (time, lev, lat) columns on 41 levels from 1000 to 10 hPa: a 6.5 K/km
+        # lapse rate up to a tropopause, then warming at 1 K/km. The tropopause is from
+        # 100 hPa at the equator to 300 hPa at the poles, scaled by 0.1 to 1.2 over time,
+        # so it's too near the top to be found in some columns
+        lat = np.radians(np.arange(-90.0, 90.0 + res, res))
+        pres = np.logspace(3.0, 1.0, 41)
+        p_trop = (100.0 + 200.0 * np.sin(lat) ** 2)[None, :] * np.linspace(
+            0.1, 1.2, n_times)[:, None]
+        height = -7.0 * np.log(pres[None, :, None] / 1000.0)
+        h_trop = -7.0 * np.log(p_trop[:, None, :] / 1000.0)
+        self.t_air = np.where(height < h_trop, 290.0 - 6.5 * height,
+                              290.0 - 6.5 * h_trop + 1.0 * (height - h_trop))
+        self.pres = np.broadcast_to(pres[None, :, None], self.t_air.shape)
+
+    def time_find_tropopause(self, res, n_times):
+        utils.find_tropopause(self.t_air, self.pres)
+
+    def time_get_tropopause(self, res, n_times):
+        utils.get_tropopause(self.t_air, self.pres)
+
+    def track_find_tropopause_diff(self, res, n_times):
+        """
+        Check :py:func:`~STJ_PV.utils.find_tropopause` against the masked array version.
+
+        Fails (rather than only recording the difference) if the tropopause is found
+        in different columns, or at a different temperature or pressure, than by
+        :py:func:`~STJ_PV.utils.get_tropopause`.
+
+        """
+        max_diff = 0.0
+        for ref, new in zip(utils.get_tropopause(self.t_air, self.pres),
+                            utils.find_tropopause(self.t_air, self.pres)):
+            ref = np.ma.filled(ref.astype(float), np.nan)
+            if not np.array_equal(np.isnan(ref), np.isnan(new)):
+                raise AssertionError('find_tropopause and get_tropopause find a '
+                                     'tropopause in different columns')
+            if np.isfinite(ref).any():
+                max_diff = max(max_diff, float(np.nanmax(np.abs(ref - new))))
+        if max_diff > 0.0:
+            raise AssertionError('find_tropopause differs from get_tropopause by '
+                                 '{:g}'.format(max_diff))
+        return max_diff
+
+    track_find_tropopause_diff.unit = 'K or hPa'
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""Shared inputs for the STJ_PV benchmarks."""
+import logging
+import types
+import numpy as np
+from STJ_PV import synthetic
+
+# Grid spacing (degrees), number of times, and time chunk size (-1: one chunk) that
+# benchmarks are parameterised over
+RESOLUTIONS = [2.5, 1.0]
+N_TIMES = [4, 8]
+CHUNKS = [1, -1]
+
+TH_LEVELS = synthetic.TH_LEVELS.astype(np.float32)
+
+DATA_CFG = {
+    'short_name': 'BENCH', 'path': '', 'wpath': '', 'single_var_file': True,
+    'single_year_file': True, 'time': 'time', 'lev': 'level', 'lat': 'lat',
+    'lon': 'lon', 'pfac': 1.0, 'uwnd': 'uwnd', 'vwnd': 'vwnd', 'tair': 'air',
+    'ipv': 'ipv', 'file_paths': {'ipv': 'ipv.{year:04d}.nc'},
+}
+
+RUN_CFG = {
+    'freq': 'day', 'zonal_opt': 'mean', 'poly': 'cheby', 'pv_value': 2.0,
+    'fit_deg': 6, 'min_lat': 10.0, 'max_lat': 65.0, 'pres_level': 25000.0,
+    'upper_p_level': 10000.0, 'lower_p_level': 40000.0, 'surface_p_level': 85000.0,
+}
+
+
+def make_props(method, ztype='pres', wpath='', **config):
+    """
+    Make the parts of :py:class:`~STJ_PV.run_stj.JetFindRun` the metrics use.
+
+    Parameters
+    ----------
+    method : string
+        Metric name (e.g. STJPV)
+    ztype : string, optional
+        Vertical coordinate of input data, 'pres' (default) or 'theta'
+    wpath : string, optional
+        Directory where output is written
+    config : dict
+        Other run configuration options
+
+    Returns
+    -------
+    props : :class:`types.SimpleNamespace`
+        With `config`, `data_cfg`, `log` and `th_levels`
+
+    """
+    log = logging.getLogger('bench')
+    log.addHandler(logging.NullHandler())
+    log.propagate = False
+    data_cfg = dict(DATA_CFG, ztype=ztype, path=wpath, wpath=wpath)
+    run_cfg = dict(RUN_CFG, method=method, **config)
+    return types.SimpleNamespace(config=run_cfg, data_cfg=data_cfg, log=log,
+                                 th_levels=TH_LEVELS)
+
+
+def _synthetic(ztype, res, n_times, chunk):
+    data_cfg = dict(DATA_CFG, ztype=ztype)
+    times = synthetic.time_axis(2000, 2000)[:n_times]
+    if chunk is None or chunk == -1:
+        chunk = n_times
+    data = synthetic.generate(data_cfg, times, res=res, chunk=chunk, canonical=True)
+    data.attrs = {'cfg': data_cfg, 'year': 2000}
+    return data
+
+
+def pres_data(res, n_times, chunk=None):
+    """
+    Synthetic u, v, T on pressure levels (see :py:mod:`STJ_PV.synthetic`).
+
+    Parameters
+    ----------
+    res : float
+        Grid spacing in degrees
+    n_times : int
+        Number of times
+    chunk : int, optional
+        Time chunk size (-1 for one chunk), default None (numpy arrays)
+
+    Returns
+    -------
+    data : :class:`xarray.Dataset`
+        Canonical layout (see :py:meth:`~STJ_PV.input_data.InputData._normalize`)
+
+    """
+    data = _synthetic('pres', res, n_times, chunk)
+    return data.load() if chunk is None else data.persist()
+
+
+def theta_data(res, n_times, chunk=None):
+    """
+    Synthetic ipv, uwnd, vwnd, and pres on isentropic levels.
+
+    Parameters
+    ----------
+    res : float
+        Grid spacing in degrees
+    n_times : int
+        Number of times
+    chunk : int, optional
+        Time chunk size (-1 for one chunk), default None (numpy arrays)
+
+    Returns
+    -------
+    data : :class:`xarray.Dataset`
+        Same layout as an IPV file written by
+        :py:meth:`~STJ_PV.input_data.InputDataSTJPV._write_ipv`
+
+    """
+    data = _synthetic('theta', res, n_times, chunk)
+    return data.load() if chunk is None else data.persist()